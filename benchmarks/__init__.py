@@ -0,0 +1,9 @@
+"""
+Офлайн-замеры производительности Kbot 3.0
+Поддельный клиент Telegram и генератор синтетического трафика
+"""
+
+from .fake_client import FakeClient
+from .traffic import SyntheticTraffic
+
+__all__ = ['FakeClient', 'SyntheticTraffic']
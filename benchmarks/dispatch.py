@@ -0,0 +1,228 @@
+"""
+Замер обработки входящих сообщений без сети
+
+    python -m benchmarks.dispatch --messages 5000 --latency 0.005
+
+Собирает настоящий Kbot (безопасность, системные команды, модули из modules/)
+поверх FakeClient, прогоняет синтетический трафик и выводит сообщений в секунду
+и задержки по этапам: фильтр безопасности, обработчики модулей, исходящие запросы.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_client import FakeClient
+from benchmarks.traffic import SyntheticTraffic
+from core.bot import Kbot
+from core.config import Config
+from core.database import Database
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Сводка по задержкам в миллисекундах"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': ordered[-1] * 1000,
+    }
+
+
+class BenchmarkBot(Kbot):
+    """Kbot с конфигурацией во временной папке вместо config.py проекта"""
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        super().__init__()
+        self.db = Database(os.path.join(workdir, 'kbot.db'))
+
+    def load_config(self):
+        config_path = os.path.join(self.workdir, 'config.py')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            f.write("api_id = 1\napi_hash = '" + '0' * 32 + "'\n")
+        config = Config(config_path, os.path.join(self.workdir, 'kbot_settings.json'))
+        config.load()
+        return config
+
+
+class StageTimer:
+    """Оборачивает зарегистрированные обработчики и замеряет их по этапам"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, callback):
+        samples = self.samples[stage]
+
+        @functools.wraps(callback)
+        async def timed(event):
+            started = time.perf_counter()
+            try:
+                return await callback(event)
+            finally:
+                samples.append(time.perf_counter() - started)
+
+        return timed
+
+    def instrument(self, bot: Kbot):
+        system = {id(callback) for callback, _ in bot._system_handlers}
+        modules = {
+            id(callback): name
+            for name, info in bot.module_manager.modules.items()
+            for callback, _ in info.get('handlers', [])
+        }
+
+        builders = bot.client._event_builders
+        for index, (event, callback) in enumerate(builders):
+            if callback.__name__ == 'global_security_filter':
+                stage = 'security'
+            elif id(callback) in system:
+                stage = 'system'
+            elif id(callback) in modules:
+                stage = f'module:{modules[id(callback)]}'
+            else:
+                stage = 'other'
+            builders[index] = (event, self.wrap(stage, callback))
+
+
+async def run_benchmark(messages: int = 5000, chats: int = 50, senders: int = 200,
+                        command_ratio: float = 0.1, latency: float = 0.0,
+                        concurrency: int = 64, seed: int = 1) -> Dict:
+    """Прогоняет трафик через бота и возвращает отчет"""
+    previous_cwd = os.getcwd()
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory(prefix='kbot-bench-') as workdir:
+        bot = BenchmarkBot(workdir)
+        # Модули берутся из modules/ проекта: образ модулей не пишем в data/ проекта
+        bot.config['module_image'] = False
+        client = FakeClient(latency=latency, seed=seed)
+        bot.client = client
+        bot.me = client.me
+        bot.db.start()
+        try:
+            await bot.setup()
+            timer = StageTimer()
+            timer.instrument(bot)
+            traffic = SyntheticTraffic(chats=chats, senders=senders, command_ratio=command_ratio, seed=seed)
+
+            # Прогрев: компиляция шаблонов, кеши Telethon
+            for update in traffic.stream(min(100, messages)):
+                await client._dispatch_update(update)
+            for samples in timer.samples.values():
+                samples.clear()
+            client.request_latency.clear()
+
+            dispatch_samples: List[float] = []
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def dispatch(update):
+                async with semaphore:
+                    started = time.perf_counter()
+                    await client._dispatch_update(update)
+                    dispatch_samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            # Как Telethon без sequential_updates: каждое обновление в своей задаче
+            await asyncio.gather(*(dispatch(update) for update in traffic.stream(messages)))
+            elapsed = time.perf_counter() - started
+
+            outbound = [value for samples in client.request_latency.values() for value in samples]
+            return {
+                'messages': messages,
+                'elapsed': elapsed,
+                'messages_per_sec': messages / elapsed if elapsed else 0.0,
+                'settings': {
+                    'chats': chats, 'senders': senders, 'command_ratio': command_ratio,
+                    'latency': latency, 'concurrency': concurrency, 'seed': seed,
+                },
+                'dispatch': percentiles(dispatch_samples),
+                'stages': {stage: percentiles(samples) for stage, samples in sorted(timer.samples.items())},
+                'outbound': percentiles(outbound),
+                'requests': {name: percentiles(samples) for name, samples in sorted(client.request_latency.items())},
+                'unhandled_requests': dict(client.unhandled),
+                'blocked_attempts': bot.security.blocked_attempts,
+            }
+        finally:
+            await bot.teardown()
+            await bot.db.close()
+            os.chdir(previous_cwd)
+
+
+def format_report(report: Dict) -> str:
+    def row(name: str, stats: Dict) -> str:
+        if not stats.get('count'):
+            return f"  {name:<28} —"
+        return (f"  {name:<28} n={stats['count']:<7} mean={stats['mean']:.3f}ms "
+                f"p50={stats['p50']:.3f}ms p95={stats['p95']:.3f}ms p99={stats['p99']:.3f}ms")
+
+    lines = [
+        "📊 Kbot 3.0 - замер обработки сообщений",
+        f"Сообщений: {report['messages']} за {report['elapsed']:.2f}с → {report['messages_per_sec']:.0f} сообщ/с",
+        "",
+        "⏱️ Этапы:",
+        row('dispatch (всего)', report['dispatch']),
+    ]
+    lines += [row(stage, stats) for stage, stats in report['stages'].items()]
+    lines += ["", "📤 Исходящие запросы:", row('все запросы', report['outbound'])]
+    lines += [row(name, stats) for name, stats in report['requests'].items()]
+    if report['unhandled_requests']:
+        lines.append(f"⚠️ Запросы без ответа в FakeClient: {report['unhandled_requests']}")
+    lines.append(f"🚫 Заблокировано чужих команд: {report['blocked_attempts']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-замер обработки сообщений Kbot")
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--senders', type=int, default=200)
+    parser.add_argument('--command-ratio', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.0, help='имитация задержки сети на запрос, секунды')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='сохранить отчет в JSON')
+    parser.add_argument('--min-rate', type=float, default=0.0,
+                        help='завершиться с ошибкой, если сообщений в секунду меньше (для CI)')
+    parser.add_argument('--verbose', action='store_true', help='показывать логи бота')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    report = asyncio.run(run_benchmark(
+        messages=args.messages, chats=args.chats, senders=args.senders,
+        command_ratio=args.command_ratio, latency=args.latency,
+        concurrency=args.concurrency, seed=args.seed
+    ))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report['messages_per_sec'] < args.min_rate:
+        print(f"❌ Производительность ниже порога: {report['messages_per_sec']:.0f} < {args.min_rate:.0f} сообщ/с")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
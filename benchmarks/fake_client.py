@@ -0,0 +1,124 @@
+"""
+Поддельный клиент Telegram для замеров без сети
+Наследует TelegramClient, поэтому фильтры событий, event.reply/edit и
+разбор ответов работают как в бою; подменяется только отправка запросов
+"""
+
+import asyncio
+import datetime
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from telethon import TelegramClient, utils
+from telethon.sessions import MemorySession
+from telethon.tl import functions, types
+
+SELF_ID = 1000
+
+
+class FakeClient(TelegramClient):
+    """Клиент, который отвечает на запросы сам с заданной задержкой"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.5, seed: Optional[int] = None):
+        super().__init__(MemorySession(), api_id=1, api_hash='0' * 32, receive_updates=False)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.me = types.User(id=SELF_ID, access_hash=SELF_ID, is_self=True, first_name='Kbot', username='kbot_bench')
+        self._mb_entity_cache.set_self_user(self.me.id, False, self.me.access_hash)
+        self._next_id = 10 ** 6
+        # Тип запроса -> задержки (секунды), для отчета по исходящим запросам
+        self.request_latency: Dict[str, List[float]] = defaultdict(list)
+        self.unhandled: Dict[str, int] = defaultdict(int)
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        started = time.perf_counter()
+        if self.latency:
+            delay = self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+            await asyncio.sleep(max(0.0, delay))
+        try:
+            return self._respond(request)
+        finally:
+            self.request_latency[type(request).__name__].append(time.perf_counter() - started)
+
+    # region Ответы на запросы
+
+    def _message_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _peer(self, input_peer):
+        if isinstance(input_peer, types.InputPeerSelf):
+            return types.PeerUser(self.me.id)
+        return utils.get_peer(input_peer)
+
+    def _new_message(self, peer, text: str, message_id: Optional[int] = None, reply_to=None) -> types.Message:
+        return types.Message(
+            id=message_id or self._message_id(),
+            peer_id=peer,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            message=text,
+            out=True,
+            from_id=types.PeerUser(self.me.id),
+            reply_to=types.MessageReplyHeader(reply_to_msg_id=reply_to) if reply_to else None
+        )
+
+    def _updates(self, updates: list) -> types.Updates:
+        return types.Updates(
+            updates=updates, users=[self.me], chats=[],
+            date=datetime.datetime.now(datetime.timezone.utc), seq=0
+        )
+
+    def _wrap_new(self, message: types.Message):
+        if isinstance(message.peer_id, types.PeerChannel):
+            return types.UpdateNewChannelMessage(message, pts=0, pts_count=0)
+        return types.UpdateNewMessage(message, pts=0, pts_count=0)
+
+    def _respond(self, request):
+        if isinstance(request, functions.users.GetUsersRequest):
+            return [self.me]
+
+        if isinstance(request, functions.messages.SendMessageRequest):
+            reply_to = getattr(request.reply_to, 'reply_to_msg_id', None)
+            message = self._new_message(self._peer(request.peer), request.message, reply_to=reply_to)
+            return self._updates([
+                types.UpdateMessageID(id=message.id, random_id=request.random_id),
+                self._wrap_new(message)
+            ])
+
+        if isinstance(request, functions.messages.EditMessageRequest):
+            message = self._new_message(self._peer(request.peer), request.message or '', message_id=request.id)
+            if isinstance(message.peer_id, types.PeerChannel):
+                return self._updates([types.UpdateEditChannelMessage(message, pts=0, pts_count=0)])
+            return self._updates([types.UpdateEditMessage(message, pts=0, pts_count=0)])
+
+        if isinstance(request, (functions.messages.DeleteMessagesRequest, functions.channels.DeleteMessagesRequest)):
+            return types.messages.AffectedMessages(pts=0, pts_count=len(request.id))
+
+        if isinstance(request, functions.messages.ForwardMessagesRequest):
+            peer = self._peer(request.to_peer)
+            updates = []
+            for random_id in request.random_id:
+                message = self._new_message(peer, '')
+                updates += [types.UpdateMessageID(id=message.id, random_id=random_id), self._wrap_new(message)]
+            return self._updates(updates)
+
+        if isinstance(request, (functions.messages.GetHistoryRequest, functions.messages.SearchRequest)):
+            return types.messages.Messages(messages=[], chats=[], users=[])
+
+        if isinstance(request, functions.messages.ReadHistoryRequest):
+            return types.messages.AffectedMessages(pts=0, pts_count=0)
+
+        if isinstance(request, (functions.messages.SetTypingRequest, functions.account.UpdateStatusRequest)):
+            return True
+
+        # Неизвестный запрос: считаем, чтобы было видно, чего не хватает подделке
+        self.unhandled[type(request).__name__] += 1
+        return True
+
+    # endregion
@@ -0,0 +1,305 @@
+"""
+Замер запуска Kbot на сгенерированных наборах модулей
+
+    python -m benchmarks.startup --sizes 10,100,1000 --weight 2
+    python -m benchmarks.startup --sizes 100 --compare benchmarks/results/startup-abc1234.json
+    python -m benchmarks.startup --sizes 1000 --warm [--no-image]
+
+Каждый размер запускается в отдельном процессе (холодные импорты, чистый пиковый RSS)
+во временной папке с modules/: системные модули проекта + сгенерированные.
+Фазы: конвертация старых модулей, бэкап modules/, загрузка модулей, остальная
+сборка бота до готовности поверх FakeClient. Результат сохраняется в JSON.
+С --warm замеряется повторный запуск в той же папке (есть __pycache__ и образ
+модулей data/module_image.bin), --no-image отключает образ для сравнения.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SYSTEM_MODULES = ('loader.py', 'system_utils.py', 'stats.py')
+
+STDLIB_IMPORTS = ('json', 're', 'datetime', 'collections', 'hashlib', 'random', 'itertools', 'textwrap')
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# region Генерация модулей
+
+def render_module(index: int, commands: int, weight: int, rng: random.Random) -> str:
+    """Модуль нового формата: docstring, импорты, статические данные, register()"""
+    name = f"gen{index:04d}"
+    imports = rng.sample(STDLIB_IMPORTS, k=min(len(STDLIB_IMPORTS), 2 + weight))
+    lines = [
+        '"""',
+        f"Сгенерированный модуль {name}",
+        "Используется для замера запуска",
+        '"""',
+        "",
+        "from telethon import events",
+    ]
+    lines += [f"import {module}" for module in sorted(imports)]
+    lines.append("")
+    # Вес импорта: таблицы и шаблоны, которые модули обычно строят при загрузке
+    for block in range(weight):
+        lines.append(f"TABLE_{block} = {{f'key{{i}}': i * {block + 1} for i in range({200 * (block + 1)})}}")
+        lines.append(f"PATTERN_{block} = re.compile(r'^{name}_{block}\\s+(\\w+)$')"
+                     if 're' in imports else f"WORDS_{block} = tuple(str(i) for i in range(100))")
+    lines += [
+        "",
+        "",
+        "async def register(bot):",
+    ]
+    for command in range(commands):
+        lines += [
+            f"    @bot.client.on(events.NewMessage(pattern=r'\\.{name}c{command}(?:\\s+(.+))?'))",
+            f"    async def {name}_c{command}(event):",
+            f'        """Команда {command} модуля {name}"""',
+            "        argument = event.pattern_match.group(1) or ''",
+            f"        await bot.safe_reply(event, f'{name}: {{argument}}')",
+            "",
+        ]
+    lines += [
+        "",
+        "async def unregister(bot):",
+        '    """Выгрузка модуля"""',
+        "    pass",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def render_legacy_module(index: int, commands: int) -> str:
+    """Модуль старого формата (@events.register) для проверки конвертера"""
+    name = f"gen{index:04d}"
+    lines = [
+        '"""',
+        f"Старый модуль {name}",
+        '"""',
+        "",
+        "from telethon import events",
+        "",
+    ]
+    for command in range(commands):
+        lines += [
+            f"@events.register(events.NewMessage(pattern=r'\\.{name}c{command}'))",
+            f"async def {name}_c{command}(event):",
+            f"    await event.edit('{name}')",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def generate_fleet(directory: str, size: int, commands: int, weight: int,
+                   legacy_ratio: float, seed: int):
+    """Создает modules/ с системными и size сгенерированными модулями"""
+    modules_dir = os.path.join(directory, 'modules')
+    os.makedirs(modules_dir, exist_ok=True)
+    for name in SYSTEM_MODULES:
+        source = os.path.join(ROOT, 'modules', name)
+        if os.path.exists(source):
+            shutil.copy(source, modules_dir)
+
+    rng = random.Random(seed)
+    for index in range(size):
+        legacy = rng.random() < legacy_ratio
+        content = render_legacy_module(index, commands) if legacy else render_module(index, commands, weight, rng)
+        with open(os.path.join(modules_dir, f"gen{index:04d}.py"), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+# endregion
+
+
+# region Один запуск (в отдельном процессе)
+
+async def measure_startup(size: int, commands: int, weight: int, legacy_ratio: float, seed: int,
+                          workdir: Optional[str] = None, image: bool = True) -> Dict:
+    """Запуск в новой папке или (workdir) в уже подготовленной прошлым запуском"""
+    if workdir is not None:
+        return await measure_in(workdir, size, image)
+    with tempfile.TemporaryDirectory(prefix='kbot-startup-') as workdir:
+        generate_fleet(workdir, size, commands, weight, legacy_ratio, seed)
+        return await measure_in(workdir, size, image)
+
+
+async def measure_in(workdir: str, size: int, image: bool) -> Dict:
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+
+    from benchmarks.dispatch import BenchmarkBot
+    from benchmarks.fake_client import FakeClient
+    from core.diagnostics import peak_rss
+
+    phases: Dict[str, float] = {}
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+
+        phase = time.perf_counter()
+        from utils.module_converter import convert_all_old_modules
+        converted = convert_all_old_modules()
+        phases['convert'] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        bot = BenchmarkBot(workdir)
+        bot.config['module_image'] = image
+        bot.client = FakeClient()
+        bot.me = bot.client.me
+        bot.db.start()
+        phases['init'] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        await bot.create_modules_backup()
+        phases['backup'] = time.perf_counter() - phase
+
+        # Загрузку модулей замеряем внутри setup(), не меняя его порядок
+        manager = bot.module_manager
+        load_all_modules = manager.load_all_modules
+
+        async def timed_load():
+            load_started = time.perf_counter()
+            await load_all_modules()
+            phases['load_modules'] = time.perf_counter() - load_started
+
+        manager.load_all_modules = timed_load
+        phase = time.perf_counter()
+        await bot.setup()
+        phases['setup_other'] = time.perf_counter() - phase - phases['load_modules']
+
+        phases['ready'] = time.perf_counter() - started
+        loaded = len(bot.module_manager.list_modules())
+        handlers = len(bot.client.list_event_handlers())
+        await bot.teardown()
+        await bot.db.close()
+    finally:
+        os.chdir(previous_cwd)
+
+    return {
+        'size': size,
+        'converted': converted,
+        'loaded_modules': loaded,
+        'handlers': handlers,
+        'phases': phases,
+        'peak_rss': peak_rss(),
+    }
+
+# endregion
+
+
+def run_size(size: int, args) -> Dict:
+    """Запускает замер одного размера в дочернем процессе"""
+    if not args.warm:
+        return run_child(size, args)
+    # Первый запуск готовит папку (__pycache__, образ модулей), замеряется второй
+    with tempfile.TemporaryDirectory(prefix='kbot-startup-') as workdir:
+        generate_fleet(workdir, size, args.commands, args.weight, args.legacy_ratio, args.seed)
+        run_child(size, args, workdir)
+        result = run_child(size, args, workdir)
+    result['warm'] = True
+    return result
+
+
+def run_child(size: int, args, workdir: Optional[str] = None) -> Dict:
+    command = [
+        sys.executable, '-m', 'benchmarks.startup', '--single', str(size),
+        '--commands', str(args.commands), '--weight', str(args.weight),
+        '--legacy-ratio', str(args.legacy_ratio), '--seed', str(args.seed),
+    ]
+    if workdir:
+        command += ['--workdir', workdir]
+    if args.no_image:
+        command.append('--no-image')
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Замер {size} модулей завершился с ошибкой:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def format_row(run: Dict, baseline: Optional[Dict] = None) -> str:
+    phases = run['phases']
+    rss = f"{run['peak_rss'] / 1048576:.1f} МБ" if run.get('peak_rss') else "—"
+    text = (f"  {run['size']:>5} модулей: готов за {phases['ready'] * 1000:8.1f}ms "
+            f"(конвертация {phases['convert'] * 1000:.1f}, бэкап {phases['backup'] * 1000:.1f}, "
+            f"загрузка {phases['load_modules'] * 1000:.1f}, прочее {phases['setup_other'] * 1000:.1f}) "
+            f"RSS {rss}")
+    if baseline:
+        delta = (phases['ready'] / baseline['phases']['ready'] - 1) * 100
+        text += f"  [{delta:+.1f}% к базовому]"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер запуска Kbot на наборах модулей")
+    parser.add_argument('--sizes', default='10,100,1000', help='размеры наборов через запятую')
+    parser.add_argument('--commands', type=int, default=3, help='команд в каждом модуле')
+    parser.add_argument('--weight', type=int, default=1, help='вес импорта модуля (статические данные)')
+    parser.add_argument('--legacy-ratio', type=float, default=0.1, help='доля модулей старого формата')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='путь к JSON (по умолчанию benchmarks/results/startup-<commit>.json)')
+    parser.add_argument('--compare', help='JSON прошлого замера для сравнения')
+    parser.add_argument('--warm', action='store_true', help='замерять повторный запуск в той же папке')
+    parser.add_argument('--no-image', action='store_true', help='без образа модулей (module_image = False)')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        result = asyncio.run(measure_startup(args.single, args.commands, args.weight, args.legacy_ratio, args.seed,
+                                             args.workdir, not args.no_image))
+        print(json.dumps(result))
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {run['size']: run for run in json.load(f)['runs']}
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': time.time(),
+        'python': sys.version.split()[0],
+        'settings': {
+            'commands': args.commands, 'weight': args.weight,
+            'legacy_ratio': args.legacy_ratio, 'seed': args.seed,
+            'warm': args.warm, 'module_image': not args.no_image,
+        },
+        'runs': [],
+    }
+
+    print(f"🚀 Kbot 3.0 - замер запуска (коммит {commit or '?'})")
+    for size in [int(value) for value in args.sizes.split(',') if value.strip()]:
+        run = run_size(size, args)
+        report['runs'].append(run)
+        print(format_row(run, baseline.get(size)))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Генератор синтетического трафика
+Смесь команд и обычной переписки во множестве чатов от множества отправителей
+"""
+
+import datetime
+import random
+from typing import Iterator, List, Optional, Sequence
+
+from telethon import utils
+from telethon.tl import types
+
+from .fake_client import SELF_ID
+
+DEFAULT_COMMANDS = ('.ping', '.help', '.modules', '.version', '.pingq', '.stats')
+CHATTER = (
+    'привет', 'как дела?', 'ок', 'смотри что нашел', 'завтра созвон в 10',
+    'https://example.com/article', 'ахаха', 'да, согласен', 'скинь файл пожалуйста',
+)
+
+
+class SyntheticTraffic:
+    """Выдает обновления UpdateNewMessage/UpdateNewChannelMessage с готовыми сущностями"""
+
+    def __init__(self, chats: int = 50, senders: int = 200, command_ratio: float = 0.1,
+                 own_command_ratio: float = 0.5, group_ratio: float = 0.7,
+                 commands: Sequence[str] = DEFAULT_COMMANDS, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.command_ratio = command_ratio
+        # Доля команд, отправленных владельцем (исходящие); остальные - чужие попытки
+        self.own_command_ratio = own_command_ratio
+        self.commands = list(commands)
+        self.me = types.User(id=SELF_ID, access_hash=SELF_ID, is_self=True, first_name='Kbot')
+        self.users: List[types.User] = [
+            types.User(id=SELF_ID + 1 + i, access_hash=i + 1, first_name=f'User{i}', username=f'user{i}')
+            for i in range(senders)
+        ]
+        group_count = max(1, int(chats * group_ratio))
+        self.groups: List[types.Channel] = [
+            types.Channel(id=5000 + i, access_hash=i + 1, title=f'Group {i}', megagroup=True,
+                          photo=types.ChatPhotoEmpty(), date=None)
+            for i in range(group_count)
+        ]
+        # Личные чаты - с первыми отправителями
+        self.private: List[types.User] = self.users[:max(0, chats - group_count)]
+        self._message_ids = {}
+
+    def _next_id(self, chat_id: int) -> int:
+        self._message_ids[chat_id] = self._message_ids.get(chat_id, 0) + 1
+        return self._message_ids[chat_id]
+
+    def update(self):
+        """Одно случайное входящее или исходящее сообщение"""
+        in_group = not self.private or self.random.random() < len(self.groups) / (len(self.groups) + len(self.private))
+        sender = self.random.choice(self.users)
+        if in_group:
+            chat = self.random.choice(self.groups)
+            peer = types.PeerChannel(chat.id)
+        else:
+            chat = self.random.choice(self.private)
+            sender = chat
+            peer = types.PeerUser(chat.id)
+
+        is_command = self.random.random() < self.command_ratio
+        out = is_command and self.random.random() < self.own_command_ratio
+        text = self.random.choice(self.commands) if is_command else self.random.choice(CHATTER)
+        author = self.me if out else sender
+
+        message = types.Message(
+            id=self._next_id(utils.get_peer_id(peer)),
+            peer_id=peer,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            message=text,
+            out=out,
+            from_id=types.PeerUser(author.id) if in_group or out else None
+        )
+        if in_group:
+            update = types.UpdateNewChannelMessage(message, pts=0, pts_count=0)
+        else:
+            update = types.UpdateNewMessage(message, pts=0, pts_count=0)
+        # Так же, как Telethon прикрепляет сущности к обновлениям из сети
+        update._entities = {
+            utils.get_peer_id(entity): entity
+            for entity in (chat, author, self.me)
+        }
+        return update
+
+    def stream(self, count: int) -> Iterator:
+        for _ in range(count):
+            yield self.update()
@@ -0,0 +1,62 @@
+"""
+Несколько аккаунтов в одном процессе Kbot 3.0
+Аккаунты описываются файлами configs/accounts/<имя>.json поверх общего config.py,
+работают в одном event loop и разделяют импортированный код модулей
+"""
+
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from .bot import Kbot
+
+ACCOUNTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'configs', 'accounts')
+
+
+def list_accounts(accounts_dir: str = ACCOUNTS_DIR) -> List[str]:
+    """Возвращает имена настроенных аккаунтов (по файлам <имя>.json)"""
+    if not os.path.isdir(accounts_dir):
+        return []
+    return sorted(
+        name[:-5] for name in os.listdir(accounts_dir)
+        if name.endswith('.json') and not name.startswith('.')
+    )
+
+
+class AccountHost:
+    """Запускает боты всех аккаунтов в одном процессе"""
+
+    def __init__(self, accounts: Optional[List[str]] = None):
+        self.logger = logging.getLogger("AccountHost")
+        names = list_accounts() if accounts is None else accounts
+        # Без файлов аккаунтов работает один бот с configs/kbot_settings.json
+        self.bots: List[Kbot] = [Kbot(name) for name in names] if names else [Kbot()]
+
+    @property
+    def primary(self) -> Kbot:
+        return self.bots[0]
+
+    async def run(self):
+        """Запускает все аккаунты; сбой одного не останавливает остальные"""
+        if len(self.bots) > 1:
+            self.logger.info(f"👥 Аккаунтов в процессе: {len(self.bots)} ({', '.join(bot.account for bot in self.bots)})")
+
+        results = await asyncio.gather(*(self._run_bot(bot) for bot in self.bots), return_exceptions=True)
+        failed = [bot for bot, result in zip(self.bots, results) if isinstance(result, Exception)]
+        if failed and len(failed) == len(self.bots):
+            # Ни один аккаунт не запустился - отдаем ошибку main.py
+            raise results[0]
+
+    async def _run_bot(self, bot: Kbot):
+        try:
+            await bot.start()
+        except Exception as e:
+            self.logger.error(f"❌ Аккаунт {bot.account or 'main'} остановлен: {e}")
+            raise
+
+    async def stop(self):
+        """Отключает клиенты всех аккаунтов"""
+        for bot in self.bots:
+            if bot.client is not None:
+                await bot.client.disconnect()
@@ -1,79 +1,135 @@
 import asyncio
+import io
 import logging
 import sys
 import os
-import importlib.util
+import re
 import time
+from typing import Optional
 from telethon import TelegramClient, events
 from .module_manager.manager import ModuleManager
+from .module_manager.sources import BUNDLE_SUFFIXES
 from .security import init_security, security_manager
+from .updates import UpdateBuffer, CatchUpGate
+from .fetcher import ModuleFetcher
+from .config import Config, SETTINGS
+from .database import Database
+from .cache import CacheService
+from .stats import UsageStats
+from .media import MediaTransfer, normalize_part_size
+from .bulk import BulkOperations
+from .session import BufferedSession
+from .diagnostics import MemoryDiagnostics, process_memory, format_size
+from .profiler import SamplingProfiler
+from .tracing import Tracer
+from .inline import InlineMenus
+from .output import OutputService
+from .fileio import disk
+from .breaker import ModuleBreakers
+from .search import MessageIndex, message_link, format_snippet, plain
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 class Kbot:
-    def __init__(self):
+    def __init__(self, account: Optional[str] = None):
+        # Имя аккаунта, если в процессе запущено несколько (см. core.accounts)
+        self.account = account
         # Инициализируем логгер ПЕРВЫМ делом
-        self.logger = logging.getLogger("Kbot")
+        self.logger = logging.getLogger(f"Kbot.{account}" if account else "Kbot")
         self.config = self.load_config()
         self.client = None
         self.module_manager = ModuleManager(self)
+        self.module_fetcher = ModuleFetcher(
+            self,
+            max_size=self.config.get('module_max_size', 1024 * 1024),
+            timeout=self.config.get('module_download_timeout', 30)
+        )
+        self.db = Database(os.path.join('data', 'accounts', account, 'kbot.db') if account else os.path.join('data', 'kbot.db'))
+        self.cache = CacheService()
+        self.stats = UsageStats(self)
+        # Бюджеты модулей: ошибки, время обработчиков и отправки (.modules)
+        self.breakers = ModuleBreakers(self)
+        # Локальный полнотекстовый индекс сообщений (.search)
+        self.search = MessageIndex(self)
+        self.media = MediaTransfer(
+            self,
+            part_size=self.config.get('media_part_size', 512 * 1024),
+            workers=self.config.get('media_workers', 4),
+            bandwidth=self.config.get('media_bandwidth', 0)
+        )
+        self.bulk = BulkOperations(self)
+        self.memory = MemoryDiagnostics(self)
+        self.profiler = SamplingProfiler(self)
+        self.tracer = Tracer(
+            self,
+            keep=self.config.get('trace_keep', 20),
+            export_path=self.config.get('trace_export_path'),
+            export_min=self.config.get('trace_export_min', 1.0),
+            enabled=self.config.get('tracing', True)
+        )
+        self.inline = InlineMenus(self)
+        self.output = OutputService(self)
+        # Файловые операции вне цикла событий, общий пул процесса (доступен модулям как bot.io)
+        disk.configure(workers=self.config.get('io_workers', 4))
+        self.io = disk
         self.me = None
         self.security = None
         self.system_commands = {
             '.modules', '.klm', '.kun', '.help', '.info', '.khelp',
             '.restart', '.update', '.ping', '.backup', '.settings',
-            '.checkupdate', '.version', '.security'
+            '.checkupdate', '.version', '.security', '.stats', '.purge', '.mem',
+            '.profile', '.trace', '.menu', '.search', '.index',
+            '.next', '.prev', '.page'
         }
         self.start_time = time.time()
+        self.last_restart_duration = None
+        self.catch_up_gate = None
+        self._system_handlers = []
+        self._config_watcher = None
+        # Конвейер логирования (utils.log_pipeline), его передает main.py
+        self.log_pipeline = None
         # Системные модули, которые нельзя удалить и не показываются в списке
         self.system_modules = {'loader', 'system_utils', 'stats'}
 
     def load_config(self):
-        """Загружает конфигурацию из config.py"""
+        """Загружает конфигурацию из config.py и configs/kbot_settings.json"""
         try:
-            # Динамически импортируем config.py
-            config_path = os.path.join(os.path.dirname(__file__), '..', 'config.py')
-            spec = importlib.util.spec_from_file_location("config", config_path)
-            config = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(config)
-            
-            # Получаем значения из config
-            api_id = getattr(config, 'api_id', None)
-            api_hash = getattr(config, 'api_hash', None)
-            session_name = getattr(config, 'session_name', 'session_kbot')
-            session_string = getattr(config, 'session_string', None)
-            admin_id = getattr(config, 'admin_id', None)
-            chat_id = getattr(config, 'chat_id', None)
-            user_name = getattr(config, 'user_name', 'User')
-            command_prefix = getattr(config, 'command_prefix', '.')
-            enable_backups = getattr(config, 'enable_backups', True)
-            enable_startup_notification = getattr(config, 'enable_startup_notification', False)  # Новое поле
-            enable_security_notifications = getattr(config, 'enable_security_notifications', False)  # Новое поле
+            root_dir = os.path.join(os.path.dirname(__file__), '..')
+            # У каждого аккаунта свой файл настроек поверх общего config.py
+            if self.account:
+                settings_path = os.path.join(root_dir, 'configs', 'accounts', f'{self.account}.json')
+            else:
+                settings_path = os.path.join(root_dir, 'configs', 'kbot_settings.json')
+            config = Config(os.path.join(root_dir, 'config.py'), settings_path)
+            config.load()
             
-            if not api_id or not api_hash:
+            if not config.get('api_id') or not config.get('api_hash'):
                 self.logger.error("❌ Не найдены api_id или api_hash")
                 self.logger.info("💡 Запустите setup.py для настройки")
                 raise ValueError("Отсутствуют api_id или api_hash")
                 
-            self.logger.info("✅ Конфигурация загружена")
-            return {
-                'api_id': int(api_id),
-                'api_hash': api_hash,
-                'session_name': session_name,
-                'session_string': session_string,
-                'admin_id': int(admin_id) if admin_id else None,
-                'chat_id': int(chat_id) if chat_id else None,
-                'user_name': user_name,
-                'command_prefix': command_prefix,
-                'enable_backups': enable_backups,
-                'enable_startup_notification': enable_startup_notification,
-                'enable_security_notifications': enable_security_notifications
-            }
+            return config
         except Exception as e:
             self.logger.error(f"❌ Ошибка загрузки конфигурации: {e}")
             self.logger.info("💡 Запустите setup.py для настройки")
             raise
 
+    def session_name(self) -> str:
+        """Имя файла сессии; аккаунты без своего session_name получают session_<имя>"""
+        session_name = self.config['session_name']
+        if self.account and session_name == SETTINGS['session_name'].default:
+            return f"session_{self.account}"
+        return session_name
+
+    def create_session(self):
+        """Создает хранилище сессии согласно session_backend"""
+        if self.config.get('session_backend', 'buffered') == 'sqlite':
+            return self.session_name()
+        return BufferedSession(
+            self.session_name(),
+            max_entities=self.config.get('session_max_entities', 0)
+        )
+
     def is_admin(self, user_id: int) -> bool:
         """Проверяет, является ли пользователь администратором"""
         if not self.security:
@@ -84,55 +140,71 @@ class Kbot:
         return self.security.is_user_allowed(user_id)
 
     async def update_config_file(self):
-        """Обновляет config.py с текущими данными"""
+        """Сохраняет актуальные данные аккаунта в настройки (только при изменениях)"""
         try:
-            config_path = os.path.join(os.path.dirname(__file__), '..', 'config.py')
-            with open(config_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            updates = {'user_name': self.me.first_name or 'User'}
+            if self.config.get('chat_id') is None:
+                updates['chat_id'] = self.me.id
             
-            # Обновляем chat_id если его нет или он пустой
-            if 'chat_id =' not in content or self.config.get('chat_id') is None:
-                if 'chat_id =' in content:
-                    # Заменяем существующий chat_id
-                    import re
-                    content = re.sub(r'chat_id\s*=\s*[^\n]+', f'chat_id = {self.me.id}', content)
-                else:
-                    # Добавляем chat_id после admin_id
-                    if 'admin_id =' in content:
-                        content = content.replace(
-                            f"admin_id = {self.config.get('admin_id', self.me.id)}",
-                            f"admin_id = {self.config.get('admin_id', self.me.id)}\nchat_id = {self.me.id}"
-                        )
-                
-                # Записываем обновленный конфиг
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
+            changes = await self.config.update(updates)
+            if 'chat_id' in changes:
                 self.logger.info(f"✅ Конфиг обновлен: chat_id = {self.me.id}")
-            
-            # Обновляем user_name если он изменился
-            current_name = self.me.first_name or 'User'
-            if f"user_name = '{self.config.get('user_name', 'User')}'" in content:
-                content = content.replace(
-                    f"user_name = '{self.config.get('user_name', 'User')}'",
-                    f"user_name = '{current_name}'"
-                )
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-            
-            # Добавляем новые настройки если их нет
-            if 'enable_startup_notification =' not in content:
-                content += "\n# Уведомления\nenable_startup_notification = False  # Уведомление о запуске бота\nenable_security_notifications = False  # Уведомления о попытках доступа\n"
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-            self.config['chat_id'] = self.me.id
-            self.config['user_name'] = current_name
-            self.config['enable_startup_notification'] = False  # По умолчанию выключено
-            self.config['enable_security_notifications'] = False  # По умолчанию выключено
-            
         except Exception as e:
-            self.logger.warning(f"⚠️ Не удалось обновить config.py: {e}")
+            self.logger.warning(f"⚠️ Не удалось обновить настройки: {e}")
+
+    async def apply_config_changes(self, changes):
+        """Применяет измененные настройки к работающему боту"""
+        if 'command_prefix' in changes:
+            # Перерегистрируем системные команды под новый префикс
+            for callback, event in self._system_handlers:
+                self.client.remove_event_handler(callback, event)
+            await self.register_system_commands()
+            self.logger.info(f"🔧 Префикс команд изменен на {changes['command_prefix']}")
+        
+        if 'module_max_size' in changes:
+            self.module_fetcher.max_size = changes['module_max_size']
+        if 'module_download_timeout' in changes:
+            self.module_fetcher.timeout = changes['module_download_timeout']
+            # Новый таймаут применится к следующей сессии
+            await self.module_fetcher.close()
+        
+        if self.catch_up_gate:
+            if 'catch_up_max_age' in changes:
+                self.catch_up_gate.max_age = changes['catch_up_max_age']
+            if 'catch_up_batch' in changes:
+                self.catch_up_gate.batch_size = max(1, changes['catch_up_batch'])
+        
+        if 'tracing' in changes:
+            self.tracer.enabled = changes['tracing']
+        if 'trace_keep' in changes:
+            self.tracer.resize(changes['trace_keep'])
+        if 'trace_export_path' in changes:
+            self.tracer.export_path = changes['trace_export_path']
+        if 'trace_export_min' in changes:
+            self.tracer.export_min = changes['trace_export_min']
+        
+        if 'module_breaker' in changes or 'module_budgets' in changes:
+            self.breakers.configure()
+        
+        if {'search_index', 'search_chats'} & set(changes):
+            await self.search.configure(changes)
+        
+        if 'io_strict' in changes:
+            try:
+                self.io.arm(changes['io_strict'])
+            except ValueError as e:
+                self.logger.warning(f"⚠️ {e}")
+        
+        if 'media_part_size' in changes:
+            self.media.part_size = normalize_part_size(changes['media_part_size'])
+        if 'media_workers' in changes:
+            self.media.workers = max(1, changes['media_workers'])
+        if 'media_bandwidth' in changes:
+            self.media.limiter.bandwidth = changes['media_bandwidth']
+
+    def command_pattern(self, pattern: str) -> str:
+        """Возвращает шаблон системной команды с текущим префиксом"""
+        return re.escape(self.config.get('command_prefix', '.')) + pattern
 
     async def start(self):
         """Запускает бота"""
@@ -144,41 +216,59 @@ class Kbot:
             self.client = TelegramClient(
                 StringSession(self.config['session_string']),
                 self.config['api_id'],
-                self.config['api_hash']
+                self.config['api_hash'],
+                catch_up=self.config.get('catch_up', True)
             )
         else:
             self.client = TelegramClient(
-                self.config['session_name'],
+                self.create_session(),
                 self.config['api_id'],
-                self.config['api_hash']
+                self.config['api_hash'],
+                catch_up=self.config.get('catch_up', True)
             )
+        
+        # Трасса начинается внутри шлюза: отложенные обновления трассируются при обработке
+        self.tracer.install(self.client)
+        # Отправки сообщений засчитываются модулю, из обработчика которого они сделаны
+        self.breakers.install(self.client)
+        
+        # До регистрации обработчиков пропущенные обновления копятся в шлюзе
+        self.catch_up_gate = CatchUpGate(
+            self,
+            self.client,
+            max_age=self.config.get('catch_up_max_age', 300.0),
+            batch_size=self.config.get('catch_up_batch', 50)
+        )
+        self.catch_up_gate.install()
             
         await self.client.start()
+        if isinstance(self.client.session, BufferedSession):
+            self.client.session.start_flushing(self.config.get('session_flush_interval', 30.0))
         self.me = await self.client.get_me()
+        self.db.start()
+        await self.stats.start()
+        await self.search.start()
         self.logger.info(f"✅ Авторизован как: {self.me.username or self.me.first_name} (ID: {self.me.id})")
         
-        # Инициализируем систему безопасности ДО всего остального
-        self.security = init_security(self)
-        self.logger.info("🛡️ Инициализация системы безопасности...")
-        
         # Обновляем конфигурационный файл с актуальными данными
         await self.update_config_file()
         
-        # Активируем глобальную безопасность
-        self.security.register_global_security()
-        
         # Создаем бэкап модулей при первом запуске
         if self.config.get('enable_backups', True):
             await self.create_modules_backup()
-            
-        # Загружаем модули
-        await self.module_manager.load_all_modules()
         
-        # Защищаем все загруженные модули
-        self.security.scan_and_secure_modules()
+        await self.setup()
+        # Обработчики готовы: новые сообщения идут сразу, накопившиеся - в фоне
+        self.catch_up_gate.open()
         
-        # Регистрируем системные команды
-        await self.register_system_commands()
+        # Бот-компаньон для inline-меню (если включен inline_bot)
+        await self.inline.start()
+        
+        # Запуск закончен: дальше блокирующий файловый ввод-вывод в цикле - ошибка кода
+        self.io.arm(os.environ.get('KBOT_IO_STRICT') or self.config.get('io_strict', 'off'))
+        
+        # Следим за изменениями config.py и kbot_settings.json
+        self._config_watcher = asyncio.create_task(self.config.watch())
         
         self.logger.info("✅ Kbot 3.0 успешно запущен!")
         self.logger.info(f"💻 Системные команды: {', '.join(sorted(self.system_commands))}")
@@ -190,7 +280,83 @@ class Kbot:
         if self.config.get('enable_startup_notification'):
             await self.send_startup_notification()
         
-        await self.client.run_until_disconnected()
+        try:
+            await self.client.run_until_disconnected()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Освобождает ресурсы бота после отключения клиента"""
+        self.io.disarm()
+        if self._config_watcher:
+            self._config_watcher.cancel()
+        await self.module_fetcher.close()
+        await self.stats.stop()
+        await self.search.stop()
+        await self.inline.stop()
+        self.memory.close()
+        await self.db.close()
+
+    async def setup(self):
+        """Собирает безопасность, модули и обработчики поверх подключенного клиента"""
+        # Инициализируем систему безопасности ДО всего остального
+        self.security = init_security(self)
+        await self.security.load_state()
+        self.logger.info("🛡️ Инициализация системы безопасности...")
+        
+        # Индекс сообщений встает перед фильтром безопасности и видит все сообщения
+        self.search.register(self.client)
+        
+        # Активируем глобальную безопасность
+        self.security.register_global_security()
+        
+        # Загружаем модули
+        await self.module_manager.load_all_modules()
+        
+        # Защищаем все загруженные модули
+        self.security.scan_and_secure_modules()
+        
+        # Регистрируем системные команды
+        await self.register_system_commands()
+        
+        self.config.subscribe(self.apply_config_changes)
+        self.config.subscribe(self.security.apply_config_changes, keys={'admin_id'})
+        if self.log_pipeline:
+            from utils.log_pipeline import LOG_SETTINGS
+            self.config.subscribe(lambda changes: self.log_pipeline.configure(self.config), keys=LOG_SETTINGS)
+
+    async def teardown(self):
+        """Выгружает модули и снимает все обработчики, не разрывая соединение"""
+        for module_name in list(self.module_manager.list_modules()):
+            await self.module_manager.unload_module(module_name)
+        
+        for callback, event in self.client.list_event_handlers():
+            self.client.remove_event_handler(callback, event)
+        
+        self.security = None
+        self._system_handlers = []
+        self.config.clear_subscribers()
+
+    async def soft_restart(self) -> float:
+        """Перезапускает бота без переподключения к Telegram, возвращает длительность в секундах"""
+        started = time.perf_counter()
+        self.logger.info("🔄 Мягкий перезапуск Kbot...")
+        
+        # Пока граф пересобирается, обновления копятся в буфере
+        buffer = UpdateBuffer(self.client)
+        buffer.hold()
+        try:
+            await self.teardown()
+            await self.config.reload()
+            self.module_manager = ModuleManager(self)
+            await self.setup()
+        finally:
+            replayed = await buffer.release()
+        
+        duration = time.perf_counter() - started
+        self.last_restart_duration = duration
+        self.logger.info(f"✅ Мягкий перезапуск завершен за {duration * 1000:.0f}ms (отложенных обновлений: {replayed})")
+        return duration
 
     async def send_startup_notification(self):
         """Отправляет уведомление о запуске бота (только если включено)"""
@@ -215,33 +381,81 @@ class Kbot:
     async def create_modules_backup(self):
         """Создает бэкап модулей"""
         try:
-            import shutil
             from datetime import datetime
             
             backup_dir = "backups"
-            os.makedirs(backup_dir, exist_ok=True)
+            await self.io.makedirs(backup_dir)
             
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_path = os.path.join(backup_dir, f"modules_backup_{timestamp}")
             
-            if os.path.exists("modules"):
-                shutil.copytree("modules", backup_path)
+            if await self.io.exists("modules"):
+                await self.io.copytree("modules", backup_path)
                 self.logger.info(f"📦 Создан бэкап модулей: {backup_path}")
                 
-            # Удаляем старые бэкапы (оставляем последние 5)
-            backups = sorted([os.path.join(backup_dir, d) for d in os.listdir(backup_dir) if d.startswith("modules_backup_")])
-            for old_backup in backups[:-5]:
-                shutil.rmtree(old_backup)
+            # Удаляем старые бэкапы (оставляем последние backup_count)
+            backup_count = max(1, self.config.get('backup_count', 5))
+            backups = sorted([os.path.join(backup_dir, d) for d in await self.io.listdir(backup_dir) if d.startswith("modules_backup_")])
+            for old_backup in backups[:-backup_count]:
+                await self.io.rmtree(old_backup)
                 self.logger.info(f"🗑️ Удален старый бэкап: {old_backup}")
                 
         except Exception as e:
             self.logger.warning(f"⚠️ Не удалось создать бэкап: {e}")
 
+    def only_modules_changed(self, root_dir: str) -> bool:
+        """Проверяет, что последний git pull затронул только папку modules"""
+        try:
+            import subprocess
+            result = subprocess.run(
+                ['git', 'diff', '--name-only', 'ORIG_HEAD', 'HEAD'],
+                capture_output=True,
+                text=True,
+                cwd=root_dir,
+                timeout=10
+            )
+            if result.returncode != 0:
+                return False
+            changed = [line for line in result.stdout.splitlines() if line.strip()]
+            return bool(changed) and all(path.startswith('modules/') for path in changed)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Не удалось определить измененные файлы: {e}")
+            return False
+
+    def system_command_help(self) -> list:
+        """Системные команды и их описания для справки (.help и inline-меню)"""
+        return [
+            ('.modules', 'Показать все модули'),
+            ('.modules enable|disable <модуль>', 'Вернуть приостановленный модуль или приостановить'),
+            ('.klm', 'Установить модуль (ответ на .py файл или пакет .kbz)'),
+            ('.kun <название>', 'Удалить модуль'),
+            ('.help', 'Эта справка'),
+            ('.help <модуль>', 'Помощь по модулю'),
+            ('.info', 'Информация о боте'),
+            ('.ping', 'Проверить пинг бота'),
+            ('.restart', 'Перезапустить бота'),
+            ('.update', 'Обновить бота'),
+            ('.backup', 'Создать бэкап модулей'),
+            ('.settings', 'Настройки бота'),
+            ('.checkupdate', 'Проверить обновления'),
+            ('.version', 'Показать версию бота'),
+            ('.security', 'Информация о безопасности'),
+            ('.stats [модуль|.команда] [период]', 'Статистика команд'),
+            ('.purge', 'Удалить сообщения от ответа до команды'),
+            ('.mem [start|stop|reset]', 'Диагностика памяти'),
+            ('.profile [секунд]', 'Профилировать работающего бота'),
+            ('.trace [id|clear]', 'Самые медленные трассы обработки'),
+            ('.menu [модули|настройки]', 'Меню с кнопками через inline-бота'),
+            ('.search <запрос> [@чат]', 'Поиск по локальному индексу сообщений'),
+            ('.index [add|remove|backfill <чат> [N]]', 'Чаты индекса сообщений'),
+            ('.next / .prev / .page N', 'Листать длинный вывод')
+        ]
+
     async def safe_reply(self, event, message: str):
-        """Безопасно отвечает на сообщение, заменяя команду"""
+        """Безопасно отвечает на сообщение, заменяя команду (или ответом, если edit_mode выключен)"""
         try:
             # Пытаемся отредактировать исходное сообщение с командой
-            if event.text and event.text.startswith('.'):  # Это команда
+            if self.config.get('edit_mode', True) and event.text and event.text.startswith(self.config.get('command_prefix', '.')):  # Это команда
                 await event.edit(message)
             else:
                 await event.reply(message)
@@ -254,49 +468,72 @@ class Kbot:
 
     async def register_system_commands(self):
         """Регистрирует системные команды для управления модулями"""
+        handlers_before = len(self.client.list_event_handlers())
         
-        @self.client.on(events.NewMessage(pattern=r'\.modules'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'modules(?:\s+(enable|disable)\s+(\w+))?\s*$')))
         async def list_modules_handler(event):
             """Показывает список всех пользовательских модулей (исключая системные)"""
             modules = self.module_manager.list_modules()
-            user_modules = {name: info for name, info in modules.items() if name not in self.system_modules}
+            action, module_name = event.pattern_match.group(1), event.pattern_match.group(2)
+            if action:
+                if module_name in self.system_modules or module_name not in modules:
+                    await self.safe_reply(event, f"❌ Модуль `{module_name}` не найден!")
+                elif action == 'disable':
+                    self.breakers.suspend(module_name)
+                    await self.safe_reply(event, f"⏸️ Модуль `{module_name}` приостановлен до `.modules enable {module_name}`")
+                elif self.breakers.resume(module_name):
+                    await self.safe_reply(event, f"✅ Модуль `{module_name}` снова работает")
+                else:
+                    await self.safe_reply(event, f"ℹ️ Модуль `{module_name}` не был приостановлен")
+                return
             
-            if user_modules:
-                loaded_count = len([m for m in user_modules.values() if m['loaded']])
-                message = f"📦 **Пользовательские модули Kbot** ({loaded_count}/{len(user_modules)})\n\n"
-                for name, info in user_modules.items():
-                    status = "✅" if info['loaded'] else "❌"
-                    message += f"{status} `{name}`\n"
-                    if info['loaded'] and info['commands']:
-                        message += f" └─ Команды: {', '.join(info['commands'])}\n"
-            else:
-                message = "📦 Нет установленных модулей\n💡 Используйте `.klm` для установки модулей"
+            user_modules = {name: info for name, info in modules.items() if name not in self.system_modules}
             
             # Добавляем информацию о системных модулях
             system_loaded = len([m for m in modules.items() if m[0] in self.system_modules and m[1]['loaded']])
-            message += f"\n🔧 **Системные модули:** {system_loaded}/{len(self.system_modules)} (скрыты)"
+            footer = f"🔧 **Системные модули:** {system_loaded}/{len(self.system_modules)} (скрыты)"
             
-            await self.safe_reply(event, message)
+            if not user_modules:
+                message = "📦 Нет установленных модулей\n💡 Используйте `.klm` для установки модулей"
+                await self.safe_reply(event, f"{message}\n\n{footer}")
+                return
+            
+            def render_module(item):
+                name, info = item
+                status = self.breakers.status(name)
+                icon = '⛔' if status else '✅' if info['loaded'] else '❌'
+                line = f"{icon} `{name}`"
+                if info['loaded'] and info['commands']:
+                    line += f"\n └─ Команды: {', '.join(info['commands'])}"
+                if status:
+                    line += f"\n └─ {status}"
+                return line
+            
+            loaded_count = len([m for m in user_modules.values() if m['loaded']])
+            await self.output.send_items(
+                event, f"📦 **Пользовательские модули Kbot** ({loaded_count}/{len(user_modules)})",
+                list(user_modules.items()), render_module, footer=footer, file_name='modules.txt'
+            )
 
-        @self.client.on(events.NewMessage(pattern=r'\.klm'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'klm\s*$')))
         async def install_module_handler(event):
-            """Устанавливает модуль из файла .py в ответ на сообщение"""
+            """Устанавливает модуль из файла .py или zip-пакет модулей в ответ на сообщение"""
             if not event.is_reply:
-                await self.safe_reply(event, "❌ Ответьте на сообщение с файлом модуля (.py) командой `.klm`")
+                await self.safe_reply(event, "❌ Ответьте на сообщение с файлом модуля (.py) или пакетом (.kbz) командой `.klm`")
                 return
             
             try:
                 reply_msg = await event.get_reply_message()
-                if not reply_msg.file or not reply_msg.file.name.endswith('.py'):
-                    await self.safe_reply(event, "❌ Это не Python файл! Ответьте на сообщение с файлом .py")
+                if not reply_msg.file or not reply_msg.file.name or not reply_msg.file.name.endswith(('.py',) + BUNDLE_SUFFIXES):
+                    await self.safe_reply(event, "❌ Это не модуль! Ответьте на сообщение с файлом .py или пакетом .kbz")
                     return
                 
                 await self.safe_reply(event, "📥 Скачиваю модуль...")
                 file_name = reply_msg.file.name
                 file_path = f"modules/{file_name}"
-                os.makedirs("modules", exist_ok=True)
+                await self.io.makedirs("modules")
                 
-                downloaded = await reply_msg.download_media(file=file_path)
+                downloaded = await self.media.download(reply_msg, file_path)
                 if downloaded:
                     # Проверяем модуль на конфликты
                     module_conflicts = await self.module_manager.check_module_conflicts(downloaded, self.system_commands)
@@ -306,22 +543,24 @@ class Kbot:
                             conflict_message += f"• `{conflict}` - системная команда\n"
                         conflict_message += "\nИзмените команды в модуле и попробуйте снова."
                         await self.safe_reply(event, conflict_message)
-                        if os.path.exists(downloaded):
-                            os.remove(downloaded)
+                        await self.io.remove(downloaded)
                         return
                     
                     success = await self.module_manager.load_module_from_file(downloaded)
                     if success:
-                        module_name = file_name[:-3]
-                        commands = self.module_manager.get_module_commands(module_name)
-                        message = f"✅ Модуль `{module_name}` успешно установлен!"
+                        names = await self.module_manager.modules_from(downloaded)
+                        if file_name.endswith('.py'):
+                            message = f"✅ Модуль `{names[0]}` успешно установлен!"
+                        else:
+                            message = f"✅ Пакет `{file_name}` успешно установлен, модулей: {len(names)}"
+                        commands = [cmd for name in names for cmd in self.module_manager.get_module_commands(name)]
                         if commands:
                             message += f"\n\n🛠 Доступные команды:\n" + "\n".join(f"• `{cmd}`" for cmd in commands)
                         
                         # Автоматически защищаем новый модуль
                         self.security.scan_and_secure_modules()
                         
-                        await self.safe_reply(event, message)
+                        await self.output.send(event, message)
                     else:
                         await self.safe_reply(event, f"❌ Ошибка загрузки модуля `{file_name}`")
                     
@@ -332,7 +571,7 @@ class Kbot:
             except Exception as e:
                 await self.safe_reply(event, f"❌ Ошибка установки: {str(e)}")
 
-        @self.client.on(events.NewMessage(pattern=r'\.kun\s+(\w+)'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'kun\s+(\w+)')))
         async def uninstall_module_handler(event):
             """Удаляет модуль по имени"""
             module_name = event.pattern_match.group(1)
@@ -342,15 +581,27 @@ class Kbot:
                 await self.safe_reply(event, f"❌ Модуль `{module_name}` является системным и не может быть удален!")
                 return
             
+            source = self.module_manager.get_module_info(module_name).get('source')
             if await self.module_manager.unload_module(module_name):
-                file_path = f"modules/{module_name}.py"
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                if source is None or source.kind == 'file':
+                    await self.io.remove(f"modules/{module_name}.py")
+                elif source.kind == 'package':
+                    await self.io.rmtree(source.path)
+                else:
+                    # Zip-пакет удаляется целиком вместе с остальными его модулями
+                    others = await self.module_manager.modules_from(source.path)
+                    for other in others:
+                        await self.module_manager.unload_module(other)
+                    await self.io.remove(source.path)
+                    if others:
+                        await self.safe_reply(event, f"✅ Пакет `{source.path.name}` удален вместе с модулями: "
+                                                     f"{', '.join(f'`{name}`' for name in [module_name] + others)}")
+                        return
                 await self.safe_reply(event, f"✅ Модуль `{module_name}` полностью удален!")
             else:
                 await self.safe_reply(event, f"❌ Модуль `{module_name}` не найден!")
 
-        @self.client.on(events.NewMessage(pattern=r'\.help(?:\s+(\w+))?'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'help(?:\s+(\w+))?')))
         async def help_handler(event):
             """Показывает справку по командам"""
             module_name = event.pattern_match.group(1)
@@ -378,22 +629,7 @@ class Kbot:
                 all_commands = self.module_manager.get_all_commands()
                 user_commands = {name: info for name, info in all_commands.items() if name not in self.system_modules}
                 
-                system_commands = [
-                    ('.modules', 'Показать все модули'),
-                    ('.klm', 'Установить модуль (ответ на .py файл)'),
-                    ('.kun <название>', 'Удалить модуль'),
-                    ('.help', 'Эта справка'),
-                    ('.help <модуль>', 'Помощь по модулю'),
-                    ('.info', 'Информация о боте'),
-                    ('.ping', 'Проверить пинг бота'),
-                    ('.restart', 'Перезапустить бота'),
-                    ('.update', 'Обновить бота'),
-                    ('.backup', 'Создать бэкап модулей'),
-                    ('.settings', 'Настройки бота'),
-                    ('.checkupdate', 'Проверить обновления'),
-                    ('.version', 'Показать версию бота'),
-                    ('.security', 'Информация о безопасности')
-                ]
+                system_commands = self.system_command_help()
                 
                 message = "🛠 **Kbot 3.0 - Система помощи**\n\n"
                 message += "⚙️ **Системные команды:**\n"
@@ -411,9 +647,9 @@ class Kbot:
                 
                 message += "\n🔧 **Системные модули:** 3 модуля (скрыты)\n"
                 message += "\n💡 Используйте `.help <модуль>` для подробной информации"
-                await self.safe_reply(event, message)
+                await self.output.send(event, message, file_name='help.txt')
 
-        @self.client.on(events.NewMessage(pattern=r'\.info'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'info')))
         async def info_handler(event):
             """Показывает информацию о боте"""
             user = self.me.username or self.me.first_name
@@ -429,6 +665,10 @@ class Kbot:
             
             # Информация о безопасности
             security_report = self.security.get_security_report() if self.security else {}
+            memory = await disk.run('stat', process_memory)
+            io_stats = self.io.stats()
+            io_count = sum(stat['count'] for stat in io_stats.values())
+            io_peak = max((stat['max_ms'] for stat in io_stats.values()), default=0.0)
             
             message = f"""
 🤖 Kbot 3.0 - Информация
@@ -440,6 +680,8 @@ class Kbot:
 🔧 Системных: {len([m for m in modules.items() if m[0] in self.system_modules and m[1]['loaded']])}/{len(self.system_modules)}
 🛠 Команды: {total_commands}
 ⏱ Время работы: {hours}ч {minutes}м
+💾 Память: {format_size(memory['rss'] or memory['peak_rss'])}{'' if memory['rss'] else ' (пик)'}
+💽 Ввод-вывод: {io_count} операций, макс. {io_peak:.1f}ms, строгий режим: {self.io.strict}
 🚀 Статус: Активен
 
 🛡️ Безопасность:
@@ -454,7 +696,7 @@ class Kbot:
 
             await self.safe_reply(event, message)
 
-        @self.client.on(events.NewMessage(pattern=r'\.ping'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'ping')))
         async def ping_handler(event):
             """Проверка пинга"""
             try:
@@ -472,13 +714,20 @@ class Kbot:
                 ping_time = round((end - start) * 1000, 2)
                 await msg.edit(f'🏓 Pong! `{ping_time}ms`')
 
-        @self.client.on(events.NewMessage(pattern=r'\.restart'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'restart(?:\s+(hard))?')))
         async def restart_handler(event):
-            """Перезапуск бота"""
+            """Перезапуск бота: мягкий по умолчанию, `.restart hard` - с перезапуском процесса"""
+            if event.pattern_match.group(1):
+                await self.safe_reply(event, '🔄 Полный перезапуск Kbot 3.0...')
+                os.execv(sys.executable, [sys.executable] + sys.argv)
+            
             await self.safe_reply(event, '🔄 Перезапуск Kbot 3.0...')
-            os.execv(sys.executable, [sys.executable] + sys.argv)
+            duration = await self.soft_restart()
+            await self.safe_reply(event, f'✅ Kbot 3.0 перезапущен за `{duration * 1000:.0f}ms`')
+            # Обработчики уже заменены новыми - не даем им повторно получить эту команду
+            raise events.StopPropagation
 
-        @self.client.on(events.NewMessage(pattern=r'\.update'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'update')))
         async def update_handler(event):
             """Обновление бота через Git"""
             try:
@@ -506,7 +755,8 @@ class Kbot:
                         if not update_output:
                             update_output = result.stderr.strip()
                         
-                        await self.safe_reply(event, f'✅ Бот успешно обновлен!\n\n```{update_output}```')
+                        await self.output.send(event, update_output, code=True, reply=True,
+                                               header='✅ Бот успешно обновлен!', file_name='update.txt')
                         
                         # Перезагружаем зависимости если нужно
                         if 'requirements.txt' in update_output:
@@ -514,18 +764,28 @@ class Kbot:
                             subprocess.run([sys.executable, '-m', 'pip', 'install', '-r', 'requirements.txt'], 
                                          cwd=root_dir)
                         
+                        # Если обновились только модули, достаточно мягкого перезапуска
+                        if self.only_modules_changed(root_dir):
+                            await self.safe_reply(event, '🔄 Перезагрузка модулей для применения обновлений...')
+                            duration = await self.soft_restart()
+                            await self.safe_reply(event, f'✅ Обновления применены за `{duration * 1000:.0f}ms`')
+                            raise events.StopPropagation
+                        
                         await self.safe_reply(event, '🔄 Перезапуск для применения обновлений...')
                         os.execv(sys.executable, [sys.executable] + sys.argv)
                 else:
                     error_msg = result.stderr if result.stderr else result.stdout
-                    await self.safe_reply(event, f'❌ Ошибка при обновлении:\n```{error_msg}```')
+                    await self.output.send(event, error_msg.strip(), code=True,
+                                           header='❌ Ошибка при обновлении:', file_name='update.txt')
                     
+            except events.StopPropagation:
+                raise
             except subprocess.TimeoutExpired:
                 await self.safe_reply(event, '❌ Таймаут при обновлении. Попробуйте позже.')
             except Exception as e:
                 await self.safe_reply(event, f'❌ Ошибка при обновлении: {str(e)}')
 
-        @self.client.on(events.NewMessage(pattern=r'\.backup'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'backup')))
         async def backup_handler(event):
             """Создает бэкап модулей"""
             try:
@@ -534,9 +794,23 @@ class Kbot:
             except Exception as e:
                 await self.safe_reply(event, f'❌ Ошибка создания бэкапа: {str(e)}')
 
-        @self.client.on(events.NewMessage(pattern=r'\.settings'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'settings(?:\s+set\s+(\w+)\s+(.+))?')))
         async def settings_handler(event):
-            """Показывает текущие настройки бота"""
+            """Показывает текущие настройки бота, `.settings set <ключ> <значение>` меняет их на лету"""
+            key = event.pattern_match.group(1)
+            if key:
+                value = event.pattern_match.group(2).strip()
+                try:
+                    changes = await self.config.set(key, value)
+                except (KeyError, ValueError) as e:
+                    await self.safe_reply(event, f"❌ {e.args[0]}")
+                    return
+                if changes:
+                    await self.safe_reply(event, f"✅ `{key}` = `{self.config.get(key)}`")
+                else:
+                    await self.safe_reply(event, f"ℹ️ `{key}` уже равно `{self.config.get(key)}`")
+                return
+            
             modules = self.module_manager.list_modules()
             user_modules = {name: info for name, info in modules.items() if name not in self.system_modules}
             
@@ -548,6 +822,7 @@ class Kbot:
 • Бэкапы: {'✅ Включены' if self.config.get('enable_backups', True) else '❌ Выключены'}
 • Уведомления о запуске: {'✅ Включены' if self.config.get('enable_startup_notification', False) else '❌ Выключены'}
 • Уведомления безопасности: {'✅ Включены' if self.config.get('enable_security_notifications', False) else '❌ Выключены'}
+• Ответ на команды: {'редактированием команды' if self.config.get('edit_mode', True) else 'новым сообщением'}
 • Админ ID: {self.config.get('admin_id', 'Не установлен')}
 • Chat ID: {self.config.get('chat_id', 'Не установлен')}
 • Имя пользователя: {self.config.get('user_name', 'Неизвестно')}
@@ -563,11 +838,13 @@ class Kbot:
 • Глобальная защита: ✅ Активна
 • Проверка прав: ✅ Включена
 • Уведомления: {'✅ Включены' if self.config.get('enable_security_notifications', False) else '❌ Выключены'}
+
+💡 Изменить: `.settings set <ключ> <значение>`
 """.strip()
 
             await self.safe_reply(event, message)
 
-        @self.client.on(events.NewMessage(pattern=r'\.checkupdate'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'checkupdate')))
         async def check_update_handler(event):
             """Проверяет наличие обновлений с улучшенным выводом"""
             try:
@@ -576,7 +853,7 @@ class Kbot:
             except ImportError:
                 await self.safe_reply(event, "❌ Модуль проверки обновлений не установлен")
 
-        @self.client.on(events.NewMessage(pattern=r'\.version'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'version')))
         async def version_handler(event):
             """Показывает текущую версию бота"""
             try:
@@ -601,7 +878,7 @@ class Kbot:
             except ImportError:
                 await self.safe_reply(event, "❌ Модуль проверки обновлений не установлен")
 
-        @self.client.on(events.NewMessage(pattern=r'\.security'))
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'security')))
         async def security_handler(event):
             """Показывает информацию о системе безопасности"""
             if not self.security:
@@ -638,3 +915,221 @@ class Kbot:
                 await self.safe_reply(event, message)
             except Exception as e:
                 await self.safe_reply(event, f"❌ Ошибка при получении отчета безопасности: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'purge\s*$')))
+        async def purge_handler(event):
+            """Удаляет свои сообщения начиная с того, на которое дан ответ"""
+            if not event.is_reply:
+                await self.safe_reply(event, "❌ Ответьте на сообщение, с которого начать удаление")
+                return
+
+            reply_msg = await event.get_reply_message()
+            # Прогресс сохраняется, поэтому прерванная очистка продолжится с того же места
+            job_id = f"purge:{event.chat_id}:{reply_msg.id}"
+            try:
+                deleted = await self.bulk.purge(
+                    event.chat_id, min_id=reply_msg.id, max_id=event.id,
+                    from_user=self.me.id, job_id=job_id
+                )
+                self.logger.info(f"🧹 .purge: удалено {deleted} сообщений")
+            except Exception as e:
+                await self.safe_reply(event, f"❌ Ошибка очистки: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'mem(?:\s+(start|stop|reset)(?:\s+(\d+))?)?\s*$')))
+        async def memory_handler(event):
+            """Диагностика памяти: сводка и файл отчета, `.mem start [кадров]|stop|reset`"""
+            action = event.pattern_match.group(1)
+            if action == 'start':
+                frames = int(event.pattern_match.group(2) or 10)
+                if self.memory.start(frames):
+                    await self.safe_reply(event, f"🔬 tracemalloc запущен (кадров: {frames}), исходный снимок сохранен")
+                else:
+                    await self.safe_reply(event, "ℹ️ tracemalloc уже запущен")
+                return
+            if action == 'stop':
+                stopped = self.memory.stop()
+                await self.safe_reply(event, "🔬 tracemalloc остановлен" if stopped else "ℹ️ tracemalloc не запущен")
+                return
+            if action == 'reset':
+                if not self.memory.tracing:
+                    await self.safe_reply(event, "ℹ️ tracemalloc не запущен, используйте `.mem start`")
+                    return
+                self.memory.reset()
+                await self.safe_reply(event, "🔬 Новый исходный снимок сохранен")
+                return
+
+            try:
+                report = await self.memory.report()
+                await self.safe_reply(event, self.memory.summary(report))
+                report_file = io.BytesIO(self.memory.render(report).encode('utf-8'))
+                report_file.name = f"kbot-mem-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+                await self.client.send_file(event.chat_id, report_file, caption="💾 Полный отчет о памяти")
+            except Exception as e:
+                await self.safe_reply(event, f"❌ Ошибка диагностики памяти: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'profile(?:\s+(\d+))?\s*$')))
+        async def profile_handler(event):
+            """Сэмплирующий профиль цикла событий за указанное число секунд"""
+            if self.profiler.running:
+                await self.safe_reply(event, "ℹ️ Профилирование уже идет")
+                return
+            seconds = min(int(event.pattern_match.group(1) or 10), 300)
+            await self.safe_reply(event, f"🔥 Профилирую {seconds}с...")
+            try:
+                result = await self.profiler.profile(seconds)
+                await self.safe_reply(event, result.summary())
+                stacks_file = io.BytesIO(result.collapsed().encode('utf-8'))
+                stacks_file.name = f"kbot-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+                await self.client.send_file(
+                    event.chat_id, stacks_file,
+                    caption="🔥 Свернутые стеки: flamegraph.pl, speedscope.app или inferno"
+                )
+            except Exception as e:
+                await self.safe_reply(event, f"❌ Ошибка профилирования: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'trace(?:\s+([\w-]+))?\s*$')))
+        async def trace_handler(event):
+            """Самые медленные трассы: `.trace` - список и дерево худшей, `.trace <id>` - дерево, `.trace clear`"""
+            argument = event.pattern_match.group(1)
+            if argument == 'clear':
+                self.tracer.clear()
+                await self.safe_reply(event, "🧹 Сохраненные трассы очищены")
+                return
+            if argument:
+                trace = self.tracer.get(argument)
+                if trace is None:
+                    await self.safe_reply(event, f"❌ Трасса `{argument}` не найдена")
+                    return
+                await self.safe_reply(event, self.tracer.format_tree(trace))
+                return
+
+            traces = self.tracer.slowest(10)
+            if not traces:
+                status = "✅ включена" if self.tracer.enabled else "❌ выключена (`.settings set tracing on`)"
+                await self.safe_reply(event, f"🧵 Трасс пока нет, трассировка {status}")
+                return
+            message = f"🧵 **Kbot 3.0 - Самые медленные трассы** (всего трассировано: {self.tracer.traced})\n\n"
+            for trace in traces:
+                message += f"• `{trace.id}` {trace.root.name} - {trace.duration * 1000:.1f}ms\n"
+            message += "\n" + self.tracer.format_tree(traces[0], max_lines=25)
+            message += "\n\n💡 `.trace <id>` - дерево трассы"
+            await self.safe_reply(event, message)
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'menu(?:\s+(.+))?$')))
+        async def menu_handler(event):
+            """Присылает меню с кнопками через inline-бота"""
+            if not self.inline.enabled:
+                await self.safe_reply(event, "❌ Inline-бот не запущен: задайте `inline_bot`, `bot_username` и `bot_token`")
+                return
+            try:
+                results = await self.client.inline_query(self.inline.username, event.pattern_match.group(1) or '')
+                if not results:
+                    await self.safe_reply(event, "❌ Inline-бот не вернул меню")
+                    return
+                await results[0].click(event.chat_id, reply_to=event.reply_to_msg_id)
+                await event.delete()
+            except Exception as e:
+                await self.safe_reply(event, f"❌ Ошибка меню: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'search\s+(.+)')))
+        async def search_handler(event):
+            """Поиск по локальному индексу: `.search <запрос> [@чат|id]`"""
+            if not self.search.enabled:
+                await self.safe_reply(event, "❌ Индекс сообщений выключен (`.settings set search_index on`)")
+                return
+            query, chat_id = event.pattern_match.group(1).strip(), None
+            words = query.rsplit(maxsplit=1)
+            if len(words) == 2 and re.fullmatch(r'@\w+|-?\d{5,}', words[1]):
+                try:
+                    chat_id = await self.search.resolve_chat(words[1])
+                except (ValueError, TypeError) as e:
+                    await self.safe_reply(event, f"❌ Чат `{words[1]}` не найден: {e}")
+                    return
+                query = words[0]
+            
+            started = time.perf_counter()
+            results = await self.search.search(query, chat_id)
+            elapsed = (time.perf_counter() - started) * 1000
+            if not results:
+                await self.safe_reply(event, f"🔎 Ничего не найдено за `{elapsed:.1f}ms`")
+                return
+            
+            def render_result(item):
+                date = time.strftime('%d.%m.%Y %H:%M', time.localtime(item['date']))
+                link = message_link(item['chat_id'], item['message_id'])
+                return f"• [{plain(self.search.title(item['chat_id']))} · {date}]({link})\n  {format_snippet(item['snippet'])}"
+            
+            await self.output.send_items(
+                event, f"🔎 **Найдено: {len(results)}** за `{elapsed:.1f}ms`",
+                results, render_result, file_name='search.txt'
+            )
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'index(?:\s+(add|remove|backfill)\s+(\S+)(?:\s+(\d+))?)?\s*$')))
+        async def index_handler(event):
+            """Чаты индекса сообщений: `.index`, `.index add|remove|backfill <чат> [N]`"""
+            action, target, count = event.pattern_match.groups()
+            if not action:
+                counts = await self.search.status()
+                status = "✅ включен" if self.search.enabled else "❌ выключен (`.settings set search_index on`)"
+                message = f"🔎 **Kbot 3.0 - Индекс сообщений** {status}\n\n"
+                for chat_id in sorted(self.search.chats | set(counts)):
+                    backfill = " ⏳ догрузка" if chat_id in self.search.backfills else ""
+                    message += f"• {plain(self.search.title(chat_id))} (`{chat_id}`): {counts.get(chat_id, 0)}{backfill}\n"
+                if not self.search.chats:
+                    message += "Чатов нет: `.index add <чат>`\n"
+                days = self.config.get('search_retention_days', 365)
+                message += f"\n🧹 Хранение: {f'{days} дн.' if days else 'без срока'}, не больше {self.config.get('search_max_messages', 500000)} сообщений"
+                await self.safe_reply(event, message)
+                return
+            
+            try:
+                chat_id = await self.search.resolve_chat(target)
+            except (ValueError, TypeError) as e:
+                await self.safe_reply(event, f"❌ Чат `{target}` не найден: {e}")
+                return
+            title = plain(self.search.title(chat_id))
+            
+            if action == 'remove':
+                await self.config.update({'search_chats': [chat for chat in self.search.chats if chat != chat_id]})
+                self.search.chats.discard(chat_id)
+                removed = await self.search.drop_chat(chat_id) if self.search.enabled else 0
+                await self.safe_reply(event, f"✅ Чат {title} убран из индекса, удалено сообщений: {removed}")
+                return
+            
+            if action == 'add':
+                await self.config.update({'search_chats': sorted(self.search.chats | {chat_id})})
+                self.search.chats.add(chat_id)
+            elif chat_id not in self.search.chats:
+                await self.safe_reply(event, f"❌ Чат {title} не индексируется: `.index add {target}`")
+                return
+            if not self.search.enabled:
+                await self.safe_reply(event, f"✅ Чат {title} добавлен; индекс выключен (`.settings set search_index on`)")
+                return
+            
+            limit = int(count) if count else self.config.get('search_backfill', 1000)
+            task = self.search.start_backfill(chat_id, limit)
+            if task is None:
+                await self.safe_reply(event, f"⏳ Догрузка чата {title} уже идет")
+                return
+            await self.safe_reply(event, f"⏳ Чат {title}: догружаю до {limit} последних сообщений...")
+            try:
+                indexed = await task
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                await self.safe_reply(event, f"❌ Ошибка догрузки чата {title}: {e}")
+                return
+            await self.safe_reply(event, f"✅ Чат {title}: в индексе {indexed} сообщений из истории")
+
+        @self.client.on(events.NewMessage(pattern=self.command_pattern(r'(next|prev|page\s+(\d+))\s*$')))
+        async def page_handler(event):
+            """Листает длинный вывод: `.next`, `.prev`, `.page N` (ответом на вывод или последний в чате)"""
+            action, number = event.pattern_match.group(1), event.pattern_match.group(2)
+            if number:
+                await self.output.turn(event, page=int(number) - 1)
+            else:
+                await self.output.turn(event, step=1 if action == 'next' else -1)
+
+        self._system_handlers = self.module_manager.instrument_handlers(
+            'system', self.client.list_event_handlers()[handlers_before:]
+        )
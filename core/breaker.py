@@ -0,0 +1,278 @@
+"""
+Бюджеты модулей Kbot 3.0
+Учет ошибок, времени обработчиков и отправленных сообщений каждого модуля
+в скользящем окне. Модуль, превысивший бюджет, отключается предохранителем
+(circuit breaker): события до него не доходят, после паузы он получает по одному
+пробному событию и возвращается, если пробы прошли без ошибок
+"""
+
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Модуль, чей обработчик сейчас выполняется (наследуется задачами, созданными в нем)
+current_module: contextvars.ContextVar = contextvars.ContextVar('kbot_module', default=None)
+
+DEFAULT_BUDGET = {
+    # Окно учета, секунд
+    'window': 60.0,
+    # Пока событий в окне меньше, доля ошибок не оценивается
+    'min_events': 10,
+    # Доля событий, завершившихся ошибкой
+    'error_rate': 0.5,
+    # Суммарное время обработчиков модуля в окне, секунд
+    'handler_time': 20.0,
+    # Отправленных сообщений в окне
+    'sends': 30,
+    # Пробное событие дольше этого считается неудачным, секунд
+    'slow_event': 5.0,
+    # Пауза до пробных событий; удваивается при каждой неудачной пробе
+    'cooldown': 60.0,
+    'max_cooldown': 3600.0,
+    # Сколько пробных событий подряд должно пройти для возврата модуля
+    'probes': 3,
+}
+
+# Запросы, которые считаются отправкой сообщения
+SEND_REQUESTS = {
+    'SendMessageRequest', 'SendMediaRequest', 'SendMultiMediaRequest',
+    'ForwardMessagesRequest', 'SendInlineBotResultRequest',
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ModuleSuspended(RuntimeError):
+    """Модуль приостановлен предохранителем: его отправки отклоняются"""
+
+
+class Breaker:
+    """Окно учета и состояние предохранителя одного модуля"""
+
+    __slots__ = ('name', 'state', 'reason', 'opened_at', 'cooldown', 'manual', 'probing', 'probes_ok',
+                 'trips', 'skipped', 'events', 'errors', 'busy', 'sends')
+
+    def __init__(self, name: str, cooldown: float):
+        self.name = name
+        self.state = CLOSED
+        self.reason = ''
+        self.opened_at = 0.0
+        self.cooldown = cooldown
+        # Отключен командой: пробных событий нет, вернуть можно только вручную
+        self.manual = False
+        self.probing = False
+        self.probes_ok = 0
+        self.trips = 0
+        self.skipped = 0
+        # (время, длительность, ошибка) событий окна и суммы по ним
+        self.events: deque = deque()
+        self.errors = 0
+        self.busy = 0.0
+        self.sends: deque = deque()
+
+    def expire(self, now: float, window: float):
+        """Убирает из окна события старше window секунд"""
+        edge = now - window
+        events = self.events
+        while events and events[0][0] < edge:
+            _, duration, failed = events.popleft()
+            self.busy -= duration
+            self.errors -= failed
+        sends = self.sends
+        while sends and sends[0] < edge:
+            sends.popleft()
+
+    def clear(self):
+        self.events.clear()
+        self.sends.clear()
+        self.errors = 0
+        self.busy = 0.0
+
+
+class ModuleBreakers:
+    """Бюджеты и предохранители пользовательских модулей (bot.breakers)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("ModuleBreakers")
+        self.breakers: Dict[str, Breaker] = {}
+        self._budgets: Dict[str, dict] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.bot.config.get('module_breaker', True)
+
+    def budget(self, module: str) -> dict:
+        """Бюджет модуля: значения по умолчанию, '*' и переопределения из module_budgets"""
+        budget = self._budgets.get(module)
+        if budget is None:
+            overrides = self.bot.config.get('module_budgets', {}) or {}
+            budget = {**DEFAULT_BUDGET, **overrides.get('*', {}), **overrides.get(module, {})}
+            self._budgets[module] = budget
+        return budget
+
+    def configure(self):
+        """Применяет измененные module_breaker и module_budgets"""
+        self._budgets.clear()
+        if not self.enabled:
+            # Приостановленные командой остаются приостановленными
+            for breaker in self.breakers.values():
+                if breaker.state != CLOSED and not breaker.manual:
+                    self.close(breaker)
+
+    def breaker(self, module: str) -> Breaker:
+        breaker = self.breakers.get(module)
+        if breaker is None:
+            breaker = self.breakers[module] = Breaker(module, self.budget(module)['cooldown'])
+        return breaker
+
+    # region Обработчики
+
+    def allow(self, module: str) -> bool:
+        """Можно ли передать событие модулю; вызывается перед каждым обработчиком"""
+        breaker = self.breakers.get(module)
+        if breaker is None or breaker.state == CLOSED:
+            return True
+        if breaker.state == OPEN:
+            if breaker.manual or time.monotonic() - breaker.opened_at < breaker.cooldown:
+                breaker.skipped += 1
+                return False
+            breaker.state = HALF_OPEN
+            breaker.probes_ok = 0
+            self.logger.info(f"🔶 Модуль {module}: пробные события после паузы {breaker.cooldown:.0f}с")
+        # Полуоткрытый: одно пробное событие за раз
+        if breaker.probing:
+            breaker.skipped += 1
+            return False
+        breaker.probing = True
+        return True
+
+    def record(self, module: str, duration: float, failed: bool):
+        """Учитывает выполненный обработчик и проверяет бюджет"""
+        if not self.enabled:
+            return
+        breaker = self.breaker(module)
+        budget = self.budget(module)
+
+        if breaker.state == HALF_OPEN and breaker.probing:
+            breaker.probing = False
+            if failed or duration > budget['slow_event']:
+                reason = "ошибка" if failed else f"{duration:.1f}с"
+                self.trip(breaker, f"пробное событие не прошло ({reason})", backoff=True)
+                return
+            breaker.probes_ok += 1
+            if breaker.probes_ok >= budget['probes']:
+                self.close(breaker)
+            return
+
+        now = time.monotonic()
+        breaker.expire(now, budget['window'])
+        breaker.events.append((now, duration, failed))
+        breaker.busy += duration
+        breaker.errors += failed
+        if breaker.state != CLOSED:
+            return
+
+        events = len(breaker.events)
+        if events >= budget['min_events'] and breaker.errors >= events * budget['error_rate']:
+            self.trip(breaker, f"ошибки в {breaker.errors} из {events} событий")
+        elif breaker.busy >= budget['handler_time']:
+            self.trip(breaker, f"обработчики заняли {breaker.busy:.1f}с за {budget['window']:.0f}с")
+
+    def record_send(self, module: str):
+        """Учитывает отправку сообщения модулем; отклоняет ее, если модуль приостановлен"""
+        if not self.enabled:
+            return
+        breaker = self.breaker(module)
+        if breaker.state == OPEN:
+            raise ModuleSuspended(f"Модуль {module} приостановлен: {breaker.reason}")
+        budget = self.budget(module)
+        now = time.monotonic()
+        breaker.expire(now, budget['window'])
+        breaker.sends.append(now)
+        if len(breaker.sends) > budget['sends']:
+            self.trip(breaker, f"отправлено {len(breaker.sends)} сообщений за {budget['window']:.0f}с",
+                      backoff=breaker.state == HALF_OPEN)
+            raise ModuleSuspended(f"Модуль {module} приостановлен: {breaker.reason}")
+
+    # endregion
+
+    # region Состояние
+
+    def trip(self, breaker: Breaker, reason: str, backoff: bool = False, manual: bool = False):
+        budget = self.budget(breaker.name)
+        breaker.cooldown = min(breaker.cooldown * 2, budget['max_cooldown']) if backoff else budget['cooldown']
+        breaker.state = OPEN
+        breaker.reason = reason
+        breaker.manual = manual
+        breaker.opened_at = time.monotonic()
+        breaker.probing = False
+        breaker.trips += 1
+        breaker.clear()
+        if manual:
+            self.logger.info(f"⏸️ Модуль {breaker.name} приостановлен вручную")
+        else:
+            self.logger.warning(f"⛔ Модуль {breaker.name} приостановлен: {reason} (пауза {breaker.cooldown:.0f}с)")
+
+    def close(self, breaker: Breaker):
+        breaker.state = CLOSED
+        breaker.reason = ''
+        breaker.manual = False
+        breaker.probing = False
+        breaker.cooldown = self.budget(breaker.name)['cooldown']
+        breaker.skipped = 0
+        breaker.clear()
+        self.logger.info(f"✅ Модуль {breaker.name} снова работает")
+
+    def suspend(self, module: str):
+        """Приостанавливает модуль до .modules enable"""
+        self.trip(self.breaker(module), "отключен командой", manual=True)
+
+    def resume(self, module: str) -> bool:
+        """Возвращает приостановленный модуль; False, если он не был приостановлен"""
+        breaker = self.breakers.get(module)
+        if breaker is None or breaker.state == CLOSED:
+            return False
+        self.close(breaker)
+        return True
+
+    def forget(self, module: str):
+        """Новая версия модуля начинает с чистого учета"""
+        self.breakers.pop(module, None)
+        self._budgets.pop(module, None)
+
+    def status(self, module: str) -> Optional[str]:
+        """Строка состояния для .modules; None, если модуль работает штатно"""
+        breaker = self.breakers.get(module)
+        if breaker is None or breaker.state == CLOSED:
+            return None
+        if breaker.state == HALF_OPEN:
+            return f"🔶 Проверяется после сбоя ({breaker.probes_ok}/{self.budget(module)['probes']} проб): {breaker.reason}"
+        if breaker.manual:
+            return f"⏸️ Отключен командой, пропущено событий: {breaker.skipped}"
+        left = max(0.0, breaker.cooldown - (time.monotonic() - breaker.opened_at))
+        return f"⛔ Приостановлен: {breaker.reason}; проба через {left:.0f}с, пропущено событий: {breaker.skipped}"
+
+    def suspended(self, module: str) -> bool:
+        breaker = self.breakers.get(module)
+        return breaker is not None and breaker.state != CLOSED
+
+    # endregion
+
+    def install(self, client):
+        """Учитывает отправки сообщений из обработчиков модулей"""
+        call = client._call
+
+        async def guarded_call(sender, request, ordered=False, flood_sleep_threshold=None):
+            module = current_module.get()
+            if module is not None:
+                for item in (request if isinstance(request, list) else (request,)):
+                    if type(item).__name__ in SEND_REQUESTS:
+                        self.record_send(module)
+            return await call(sender, request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+
+        client._call = guarded_call
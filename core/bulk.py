@@ -0,0 +1,247 @@
+"""
+Массовые операции с сообщениями Kbot 3.0
+Пакеты по максимуму ID на запрос, параллельный обход нескольких чатов,
+темп запросов подстраивается под FloodWait, прогресс сохраняется для продолжения
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telethon import errors, helpers, utils
+from telethon.tl import functions, types
+
+# Telegram принимает не больше 100 ID в одном запросе удаления/пересылки
+MAX_IDS_PER_REQUEST = 100
+HISTORY_PAGE_SIZE = 100
+
+
+def chunks(items: List[int], size: int = MAX_IDS_PER_REQUEST):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class AdaptivePacer:
+    """Пауза между запросами: растет после FloodWait и плавно уменьшается после успешных запросов
+
+    Один запрос повторяется не больше max_attempts раз и ждет FloodWait в сумме
+    не дольше max_wait секунд, затем FloodWaitError уходит вызывающему.
+    """
+
+    def __init__(self, name: str, min_delay: float = 0.0, max_delay: float = 5.0,
+                 max_attempts: int = 5, max_wait: float = 600.0):
+        self.name = name
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.delay = min_delay
+        self.flood_waits = 0
+        self.requests = 0
+        self._next_at = 0.0
+        self.logger = logging.getLogger("BulkOperations")
+
+    async def call(self, client, request):
+        """Выполняет запрос с учетом темпа; FloodWait не поглощается Telethon, а учитывается здесь"""
+        attempts = 0
+        waited = 0.0
+        while True:
+            wait = self._next_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_at = time.monotonic() + self.delay
+            try:
+                # client(...) в Telethon 1.x не передает flood_sleep_threshold дальше,
+                # поэтому вызываем _call напрямую, чтобы FloodWait дошел до нас
+                result = await client._call(client._sender, request, flood_sleep_threshold=0)
+            except errors.FloodWaitError as e:
+                self.flood_waits += 1
+                attempts += 1
+                # Мультипликативное увеличение паузы после лимита
+                self.delay = min(self.max_delay, max(self.delay * 2, 0.1))
+                # Следующие запросы этого типа тоже ждут окончания FloodWait
+                self._next_at = time.monotonic() + e.seconds + self.delay
+                if attempts >= self.max_attempts or waited + e.seconds > self.max_wait:
+                    self.logger.warning(f"⚠️ FloodWait {e.seconds}с ({self.name}): лимит ожидания исчерпан, "
+                                        f"попыток {attempts}, ожидание {waited:.0f}с")
+                    raise
+                waited += e.seconds
+                self.logger.info(f"⏳ FloodWait {e.seconds}с ({self.name}), пауза теперь {self.delay:.2f}с")
+                continue
+            self.requests += 1
+            # Аддитивное уменьшение паузы после успеха
+            self.delay = max(self.min_delay, self.delay - 0.01)
+            return result
+
+
+class BulkOperations:
+    """Массовое удаление, пересылка и чтение истории (bot.bulk)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("BulkOperations")
+        # Отдельный темп на каждый тип запросов: лимиты Telegram у них разные
+        self.pacers: Dict[str, AdaptivePacer] = {
+            'history': AdaptivePacer('history'),
+            'delete': AdaptivePacer('delete'),
+            'forward': AdaptivePacer('forward'),
+        }
+
+    @property
+    def client(self):
+        return self.bot.client
+
+    def _checkpoints(self):
+        db = getattr(self.bot, 'db', None)
+        return db.namespace('bulk') if db is not None else None
+
+    async def _pages(self, chat, min_id: int, from_user: Optional[int],
+                     offset_id: int) -> AsyncIterator[Tuple[List[types.Message], int]]:
+        """Страницы истории вместе с offset_id, с которого продолжать после страницы"""
+        input_chat = await self.client.get_input_entity(chat)
+        while True:
+            result = await self.pacers['history'].call(self.client, functions.messages.GetHistoryRequest(
+                peer=input_chat, offset_id=offset_id, offset_date=None, add_offset=0,
+                limit=HISTORY_PAGE_SIZE, max_id=0, min_id=max(0, min_id - 1), hash=0
+            ))
+            messages = [m for m in result.messages if not isinstance(m, types.MessageEmpty)]
+            if not messages:
+                break
+
+            entities = {utils.get_peer_id(x): x for x in itertools.chain(result.users, result.chats)}
+            for message in messages:
+                message._finish_init(self.client, entities, input_chat)
+            offset_id = min(m.id for m in messages)
+
+            if from_user is not None:
+                messages = [m for m in messages if m.sender_id == from_user]
+            # Пустые после фильтра страницы тоже отдаются: по ним двигается checkpoint
+            yield messages, offset_id
+            if offset_id <= min_id:
+                break
+
+    async def _start_offset(self, store, checkpoint: Optional[str], max_id: int) -> int:
+        offset_id = max_id + 1 if max_id else 0
+        if store:
+            offset_id = await store.get(checkpoint, offset_id)
+        return offset_id
+
+    async def history(self, chat, min_id: int = 0, max_id: int = 0, from_user: Optional[int] = None,
+                      checkpoint: Optional[str] = None) -> AsyncIterator[List[types.Message]]:
+        """Отдает историю чата страницами от новых к старым
+
+        С checkpoint позиция сохраняется после каждой страницы, и повторный
+        вызов с тем же именем продолжает с места остановки.
+        """
+        store = self._checkpoints() if checkpoint else None
+        offset_id = await self._start_offset(store, checkpoint, max_id)
+        async for messages, offset_id in self._pages(chat, min_id, from_user, offset_id):
+            if messages:
+                yield messages
+            if store:
+                store.set(checkpoint, offset_id)
+
+        if store:
+            store.delete(checkpoint)
+
+    async def delete(self, chat, message_ids: Iterable[int], revoke: bool = True) -> int:
+        """Удаляет сообщения пакетами по 100 ID"""
+        input_chat = await self.client.get_input_entity(chat)
+        deleted = 0
+        for batch in chunks(sorted(set(message_ids))):
+            if isinstance(input_chat, types.InputPeerChannel):
+                request = functions.channels.DeleteMessagesRequest(utils.get_input_channel(input_chat), batch)
+            else:
+                request = functions.messages.DeleteMessagesRequest(batch, revoke=revoke)
+            result = await self.pacers['delete'].call(self.client, request)
+            deleted += result.pts_count
+        return deleted
+
+    async def forward(self, to_chat, from_chat, message_ids: Iterable[int]) -> int:
+        """Пересылает сообщения пакетами по 100 ID"""
+        to_peer = await self.client.get_input_entity(to_chat)
+        from_peer = await self.client.get_input_entity(from_chat)
+        forwarded = 0
+        for batch in chunks(sorted(set(message_ids))):
+            await self.pacers['forward'].call(self.client, functions.messages.ForwardMessagesRequest(
+                from_peer=from_peer, id=batch, to_peer=to_peer,
+                random_id=[helpers.generate_random_long() for _ in batch]
+            ))
+            forwarded += len(batch)
+        return forwarded
+
+    async def purge(self, chat, min_id: int = 0, max_id: int = 0, from_user: Optional[int] = None,
+                    job_id: Optional[str] = None,
+                    progress: Optional[Callable[[int], None]] = None) -> int:
+        """Удаляет сообщения из диапазона, одновременно читая историю и удаляя прочитанное"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+        store = self._checkpoints() if job_id else None
+        deleted = 0
+
+        async def producer():
+            try:
+                offset_id = await self._start_offset(store, job_id, max_id)
+                async for page, offset_id in self._pages(chat, min_id, from_user, offset_id):
+                    await queue.put(([m.id for m in page], offset_id))
+            finally:
+                await queue.put(None)
+
+        async def consumer():
+            nonlocal deleted
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                ids, offset_id = item
+                if ids:
+                    deleted += await self.delete(chat, ids)
+                    if progress:
+                        progress(deleted)
+                # Позиция сохраняется только после удаления: страницы в очереди при сбое прочитаются снова
+                if store:
+                    store.set(job_id, offset_id)
+
+        producer_task = asyncio.create_task(producer())
+        try:
+            await consumer()
+            await producer_task
+        finally:
+            producer_task.cancel()
+        if store:
+            store.delete(job_id)
+        self.logger.info(f"🧹 Удалено сообщений: {deleted} в чате {chat}")
+        return deleted
+
+    async def scan(self, chats: Iterable, min_id: int = 0, concurrency: int = 4,
+                   checkpoint: Optional[str] = None) -> AsyncIterator[Tuple[object, types.Message]]:
+        """Параллельно обходит историю нескольких чатов, отдавая пары (чат, сообщение)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        semaphore = asyncio.Semaphore(concurrency)
+        chats = list(chats)
+
+        async def walk(chat):
+            async with semaphore:
+                name = f"{checkpoint}:{chat}" if checkpoint else None
+                async for page in self.history(chat, min_id=min_id, checkpoint=name):
+                    await queue.put((chat, page))
+
+        async def run_all():
+            try:
+                await asyncio.gather(*(walk(chat) for chat in chats))
+            finally:
+                await queue.put(None)
+
+        runner = asyncio.create_task(run_all())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                chat, page = item
+                for message in page:
+                    yield chat, message
+            await runner
+        finally:
+            runner.cancel()
@@ -0,0 +1,228 @@
+"""
+Кеш результатов для модулей Kbot 3.0
+LRU/TTL кеш с бюджетом по количеству записей и памяти для каждого модуля
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """Грубая оценка занимаемой памяти: объект и его элементы первого уровня"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class ModuleCache:
+    """Кеш одного модуля"""
+
+    def __init__(self, name: str, max_items: int = 1024, max_bytes: int = 4 * 1024 * 1024,
+                 default_ttl: Optional[float] = None):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # key -> (value, expires_at, size)
+        self._data: OrderedDict = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value: Any, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Значение больше всего бюджета модуля - не кешируем
+            return
+
+        if key in self._data:
+            self._remove(key)
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at, size)
+        self.size_bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self.size_bytes -= size
+
+    def _evict(self):
+        while len(self._data) > self.max_items or self.size_bytes > self.max_bytes:
+            # Сначала выбрасываем самые давно использованные записи
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+    def delete(self, key):
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self.size_bytes = 0
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'items': len(self._data),
+            'bytes': self.size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class CacheService:
+    """Кеши модулей и декораторы мемоизации (bot.cache)"""
+
+    def __init__(self, max_items: int = 1024, max_bytes: int = 4 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger("CacheService")
+        self.caches: Dict[str, ModuleCache] = {}
+
+    def namespace(self, module_name: str, max_items: Optional[int] = None,
+                  max_bytes: Optional[int] = None, default_ttl: Optional[float] = None) -> ModuleCache:
+        """Возвращает кеш модуля, при необходимости меняя его бюджет"""
+        cache = self.caches.get(module_name)
+        if cache is None:
+            cache = ModuleCache(
+                module_name,
+                max_items or self.max_items,
+                max_bytes or self.max_bytes,
+                default_ttl
+            )
+            self.caches[module_name] = cache
+        else:
+            if max_items:
+                cache.max_items = max_items
+            if max_bytes:
+                cache.max_bytes = max_bytes
+            if default_ttl is not None:
+                cache.default_ttl = default_ttl
+            cache._evict()
+        return cache
+
+    def memoize(self, ttl: Optional[float] = None, module: Optional[str] = None,
+                key: Optional[Callable] = None):
+        """Кеширует результат функции (обычной или async) по ее аргументам
+
+        Одновременные вызовы async-функции с одинаковыми аргументами
+        выполняются один раз, остальные ждут тот же результат.
+        """
+        def decorator(func):
+            # Подмодули пакета (weather.api) кешируются в кеше модуля weather: его чистит выгрузка модуля
+            cache_name = module or func.__module__.split('.')[0]
+            in_flight: Dict[Any, asyncio.Future] = {}
+
+            def make_key(args, kwargs):
+                if key is not None:
+                    return key(*args, **kwargs)
+                return (func.__qualname__, args, tuple(sorted(kwargs.items())))
+
+            def lookup(args, kwargs):
+                try:
+                    cache_key = make_key(args, kwargs)
+                    hash(cache_key)
+                except TypeError:
+                    # Нехешируемые аргументы - вызываем без кеша
+                    return None, _MISSING
+                return cache_key, self.namespace(cache_name).get(cache_key, _MISSING)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    cache_key, value = lookup(args, kwargs)
+                    if value is not _MISSING:
+                        return value
+                    if cache_key is None:
+                        return await func(*args, **kwargs)
+
+                    pending = in_flight.get(cache_key)
+                    if pending is not None:
+                        return await asyncio.shield(pending)
+
+                    future = asyncio.get_running_loop().create_future()
+                    in_flight[cache_key] = future
+                    try:
+                        value = await func(*args, **kwargs)
+                    except asyncio.CancelledError:
+                        future.cancel()
+                        raise
+                    except Exception as e:
+                        future.set_exception(e)
+                        # Исключение уже передано ожидающим, иначе asyncio
+                        # предупредит о непрочитанной ошибке future
+                        future.exception()
+                        raise
+                    else:
+                        self.namespace(cache_name).set(cache_key, value, ttl)
+                        future.set_result(value)
+                        return value
+                    finally:
+                        in_flight.pop(cache_key, None)
+
+                async_wrapper.cache_clear = lambda: self.clear_module(cache_name)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key, value = lookup(args, kwargs)
+                if value is not _MISSING:
+                    return value
+                value = func(*args, **kwargs)
+                if cache_key is not None:
+                    self.namespace(cache_name).set(cache_key, value, ttl)
+                return value
+
+            wrapper.cache_clear = lambda: self.clear_module(cache_name)
+            return wrapper
+
+        return decorator
+
+    def clear_module(self, module_name: str):
+        """Удаляет кеш модуля (вызывается при выгрузке модуля)"""
+        cache = self.caches.pop(module_name, None)
+        if cache is not None:
+            cache.clear()
+            self.logger.debug(f"🧹 Кеш модуля {module_name} очищен")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: cache.stats() for name, cache in self.caches.items()}
@@ -0,0 +1,304 @@
+"""
+Типизированная конфигурация Kbot 3.0
+Объединяет config.py и configs/kbot_settings.json, перечитывает их на лету
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .fileio import disk
+
+# type - тип значения, default - значение по умолчанию,
+# writable - можно ли менять через .settings set
+Setting = namedtuple('Setting', ['type', 'default', 'writable'])
+
+SETTINGS: Dict[str, Setting] = {
+    'api_id': Setting(int, None, False),
+    'api_hash': Setting(str, None, False),
+    'session_name': Setting(str, 'session_kbot', False),
+    'session_string': Setting(str, None, False),
+    # buffered - сессия в памяти с пакетной записью, sqlite - стандартная сессия Telethon
+    'session_backend': Setting(str, 'buffered', False),
+    'session_flush_interval': Setting(float, 30.0, False),
+    # Сколько сущностей (пользователей, чатов) хранить в файле сессии, 0 - все
+    'session_max_entities': Setting(int, 0, False),
+    'admin_id': Setting(int, None, True),
+    'chat_id': Setting(int, None, True),
+    'user_name': Setting(str, 'User', True),
+    'command_prefix': Setting(str, '.', True),
+    'edit_mode': Setting(bool, True, True),
+    'bot_username': Setting(str, None, True),
+    # Бот-компаньон для inline-меню (.menu); токен также читается из configs/bot_token.txt
+    'inline_bot': Setting(bool, False, False),
+    'bot_token': Setting(str, None, False),
+    # Сколько секунд Telegram может отдавать inline-результаты из своего кеша
+    'inline_cache_time': Setting(int, 60, True),
+    # Вывод длиннее стольких страниц отправляется файлом
+    'output_max_pages': Setting(int, 10, True),
+    # Потоков для файловых операций (общий пул процесса)
+    'io_workers': Setting(int, 4, False),
+    # Блокирующие файловые вызовы в цикле событий: off, warn (в лог) или raise (для тестов)
+    'io_strict': Setting(str, 'off', True),
+    'enable_backups': Setting(bool, True, True),
+    'backup_count': Setting(int, 5, True),
+    'enable_startup_notification': Setting(bool, False, True),
+    'enable_security_notifications': Setting(bool, False, True),
+    'log_level': Setting(str, 'INFO', True),
+    'log_to_file': Setting(bool, True, True),
+    'log_json': Setting(bool, False, True),
+    'log_max_bytes': Setting(int, 10 * 1024 * 1024, True),
+    'log_backup_count': Setting(int, 7, True),
+    # {"SecurityManager": 0.1} - писать каждую 10-ю запись ниже WARNING
+    'log_sampling': Setting(dict, {}, True),
+    # Скомпилированные модули и их команды в data/module_image.bin (быстрый холодный запуск)
+    'module_image': Setting(bool, True, False),
+    'module_max_size': Setting(int, 1024 * 1024, True),
+    'module_download_timeout': Setting(float, 30.0, True),
+    'media_part_size': Setting(int, 512 * 1024, True),
+    'media_workers': Setting(int, 4, True),
+    # Байт в секунду на все передачи, 0 - без ограничения
+    'media_bandwidth': Setting(int, 0, True),
+    # Получать пропущенные за время простоя обновления
+    'catch_up': Setting(bool, True, False),
+    # Накопившиеся команды старше этого возраста (секунды) не выполняются
+    'catch_up_max_age': Setting(float, 300.0, True),
+    'catch_up_batch': Setting(int, 50, True),
+    # Приостанавливать модули, превысившие бюджет (ошибки, время обработчиков, отправки)
+    'module_breaker': Setting(bool, True, True),
+    # {"*": {"sends": 60}, "spammy": {"error_rate": 0.2}} - см. core.breaker.DEFAULT_BUDGET
+    'module_budgets': Setting(dict, {}, True),
+    # Локальный индекс сообщений для .search: чаты задаются командой .index add
+    'search_index': Setting(bool, False, True),
+    'search_chats': Setting(list, [], True),
+    # Срок хранения (0 - без срока) и общий лимит сообщений в индексе
+    'search_retention_days': Setting(int, 365, True),
+    'search_max_messages': Setting(int, 500000, True),
+    # Сколько последних сообщений догружать при .index add
+    'search_backfill': Setting(int, 1000, True),
+    # Модули, которые не загружаются для этого аккаунта
+    'disabled_modules': Setting(list, [], True),
+    # Трассировка обработки событий (.trace)
+    'tracing': Setting(bool, True, True),
+    'trace_keep': Setting(int, 20, True),
+    # JSON lines с трассами не короче trace_export_min секунд, None - не сохранять
+    'trace_export_path': Setting(str, None, True),
+    'trace_export_min': Setting(float, 1.0, True),
+}
+
+# Старые имена ключей в kbot_settings.json
+JSON_ALIASES = {'prefix': 'command_prefix'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on', 'да', 'вкл'}
+FALSE_VALUES = {'0', 'false', 'no', 'off', 'нет', 'выкл'}
+
+
+def coerce_value(key: str, value: Any) -> Any:
+    """Приводит значение к типу настройки"""
+    setting = SETTINGS.get(key)
+    if setting is None or value is None:
+        return value
+
+    if isinstance(value, str) and value.strip().lower() in ('none', 'null'):
+        return None
+
+    if setting.type is bool:
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise ValueError(f"Ожидается логическое значение для {key}: {value}")
+
+    if setting.type is dict and isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f"Ожидается JSON-объект для {key}: {value}")
+
+    if setting.type is list and isinstance(value, str):
+        # Список задается JSON-массивом или через запятую
+        text = value.strip()
+        if text.startswith('['):
+            try:
+                value = json.loads(text)
+            except ValueError:
+                raise ValueError(f"Ожидается JSON-массив для {key}: {value}")
+        else:
+            value = [item.strip() for item in text.split(',') if item.strip()]
+
+    try:
+        return setting.type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Некорректное значение для {key}: {value}")
+
+
+class Config:
+    """Словарь настроек с подпиской на изменения"""
+
+    def __init__(self, config_path: str, settings_path: str):
+        self.config_path = config_path
+        self.settings_path = settings_path
+        self.logger = logging.getLogger("Config")
+        self.values: Dict[str, Any] = {}
+        self._overrides: Dict[str, Any] = {}
+        self._subscribers = []
+        self._mtimes = {}
+
+    # Доступ как к словарю - остальной код работает с config.get(...)
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.values.get(key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.values[key] = coerce_value(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+    def items(self):
+        return self.values.items()
+
+    def load(self):
+        """Загружает config.py и накладывает поверх kbot_settings.json"""
+        self.values = self._read_values()
+        self._mtimes = self._current_mtimes()
+        self.logger.info("✅ Конфигурация загружена")
+
+    def _read_values(self) -> Dict[str, Any]:
+        values = {key: setting.default for key, setting in SETTINGS.items()}
+
+        spec = importlib.util.spec_from_file_location("config", self.config_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for key in SETTINGS:
+            if hasattr(module, key):
+                values[key] = getattr(module, key)
+
+        self._overrides = self._read_overrides()
+        for raw_key, value in self._overrides.items():
+            values[JSON_ALIASES.get(raw_key, raw_key)] = value
+
+        return {key: coerce_value(key, value) for key, value in values.items()}
+
+    def _read_overrides(self) -> Dict[str, Any]:
+        if not os.path.exists(self.settings_path):
+            return {}
+        try:
+            with open(self.settings_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"⚠️ Не удалось прочитать {self.settings_path}: {e}")
+            return {}
+
+    def _current_mtimes(self) -> Dict[str, Optional[int]]:
+        mtimes = {}
+        for path in (self.config_path, self.settings_path):
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def subscribe(self, callback: Callable, keys: Optional[Iterable[str]] = None):
+        """Подписывает callback(changes) на изменения указанных ключей"""
+        self._subscribers.append((callback, set(keys) if keys else None))
+
+    def clear_subscribers(self):
+        self._subscribers = []
+
+    async def _notify(self, changes: Dict[str, Any]):
+        for callback, keys in list(self._subscribers):
+            relevant = {k: v for k, v in changes.items() if keys is None or k in keys}
+            if not relevant:
+                continue
+            try:
+                result = callback(relevant)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка применения настроек: {e}")
+
+    def _diff(self, new_values: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in new_values.items() if self.values.get(key) != value}
+
+    async def reload(self) -> Dict[str, Any]:
+        """Перечитывает файлы и применяет изменившиеся значения"""
+        new_values = await disk.run('read', self._read_values)
+        self._mtimes = await disk.run('stat', self._current_mtimes)
+        changes = self._diff(new_values)
+        self.values = new_values
+        if changes:
+            self.logger.info(f"🔄 Настройки обновлены: {', '.join(sorted(changes))}")
+            await self._notify(changes)
+        return changes
+
+    async def update(self, new_values: Dict[str, Any]) -> Dict[str, Any]:
+        """Меняет настройки, сохраняя их в kbot_settings.json только при реальных изменениях"""
+        coerced = {key: coerce_value(key, value) for key, value in new_values.items()}
+        changes = self._diff(coerced)
+        if not changes:
+            return {}
+
+        self.values.update(changes)
+        for key, value in changes.items():
+            # Сохраняем старое имя ключа, если оно уже используется в файле
+            raw_key = next((alias for alias, name in JSON_ALIASES.items()
+                            if name == key and alias in self._overrides), key)
+            self._overrides[raw_key] = value
+        # Снимок на цикле событий: следующий update() может менять _overrides, пока поток пишет файл
+        await disk.run('replace', self._write_overrides, dict(self._overrides))
+        await self._notify(changes)
+        return changes
+
+    async def set(self, key: str, value: Any) -> Dict[str, Any]:
+        """Меняет одну настройку (для команды .settings set)"""
+        setting = SETTINGS.get(key)
+        if setting is None:
+            raise KeyError(f"Неизвестная настройка: {key}")
+        if not setting.writable:
+            raise KeyError(f"Настройку {key} нельзя менять на лету")
+        return await self.update({key: value})
+
+    def _write_overrides(self, overrides: Dict[str, Any]):
+        """Атомарно записывает kbot_settings.json"""
+        directory = os.path.dirname(os.path.abspath(self.settings_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.kbot_settings.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(overrides, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.settings_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        # Собственная запись не должна вызывать повторную перезагрузку
+        self._mtimes = self._current_mtimes()
+
+    async def watch(self, interval: float = 2.0):
+        """Следит за изменением файлов конфигурации"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await disk.run('stat', self._current_mtimes) != self._mtimes:
+                    await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ждем следующего изменения файла, чтобы не повторять ошибку
+                self.logger.warning(f"⚠️ Не удалось перечитать конфигурацию: {e}")
+                self._mtimes = await disk.run('stat', self._current_mtimes)
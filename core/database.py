@@ -0,0 +1,334 @@
+"""
+Локальное хранилище состояния Kbot 3.0
+SQLite в режиме WAL, все операции выполняются в отдельном потоке,
+записи группируются в транзакции, чтения кешируются в памяти
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_MISSING = object()
+_STOP = object()
+
+
+def _check_identifier(name: str) -> str:
+    if not IDENTIFIER_RE.match(name):
+        raise ValueError(f"Некорректное имя: {name}")
+    return name
+
+
+class Database:
+    """SQLite хранилище с выделенным потоком ввода-вывода"""
+
+    def __init__(self, path: str = os.path.join("data", "kbot.db"), batch_size: int = 1000,
+                 cache_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.logger = logging.getLogger("Database")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_error: Optional[Exception] = None
+        self._cache: OrderedDict = OrderedDict()
+        # Растет при каждом изменении из set/delete/clear: чтение, во время которого он сменился, не кешируется
+        self._cache_writes = 0
+        self._namespaces: Dict[str, 'Namespace'] = {}
+        self.writes = 0
+        self.batches = 0
+
+    # region Поток ввода-вывода
+
+    def start(self):
+        """Открывает базу и запускает поток ввода-вывода"""
+        if self._thread is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="KbotDatabase", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._start_error is not None:
+            self._thread = None
+            raise self._start_error
+        self.logger.info(f"🗄️ База данных открыта: {self.path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Кеш подготовленных выражений: одинаковые SQL строки не компилируются повторно
+        connection = sqlite3.connect(self.path, isolation_level=None, cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        return connection
+
+    def _run(self, ready: threading.Event):
+        try:
+            connection = self._connect()
+        except Exception as e:
+            self._start_error = e
+            return
+        finally:
+            ready.set()
+        try:
+            while True:
+                op = self._queue.get()
+                if op is _STOP:
+                    break
+
+                # Собираем все накопившиеся записи в одну транзакцию
+                batch = [op]
+                while len(batch) < self.batch_size:
+                    try:
+                        next_op = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if next_op is _STOP:
+                        self._queue.put(_STOP)
+                        break
+                    batch.append(next_op)
+
+                self._execute_batch(connection, batch)
+        finally:
+            connection.close()
+
+    def _execute_batch(self, connection: sqlite3.Connection, batch: List[tuple]):
+        writes = [op for op in batch if op[0] == 'write']
+        if writes:
+            try:
+                connection.execute("BEGIN")
+                results = []
+                for _, sql, params, many, future in writes:
+                    cursor = connection.executemany(sql, params) if many else connection.execute(sql, params)
+                    results.append((future, cursor.rowcount))
+                connection.execute("COMMIT")
+                self.writes += len(writes)
+                self.batches += 1
+                for future, rowcount in results:
+                    self._resolve(future, rowcount)
+            except Exception as e:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                self.logger.warning(f"⚠️ Ошибка пакетной записи, повтор по одной: {e}")
+                # Одна ошибочная запись не должна отменять остальные
+                for _, sql, params, many, future in writes:
+                    try:
+                        cursor = connection.executemany(sql, params) if many else connection.execute(sql, params)
+                        self._resolve(future, cursor.rowcount)
+                        self.writes += 1
+                    except Exception as write_error:
+                        self.logger.error(f"❌ Ошибка записи в базу: {write_error}")
+                        self._reject(future, write_error)
+
+        for op in batch:
+            if op[0] == 'read':
+                _, sql, params, future = op
+                try:
+                    self._resolve(future, connection.execute(sql, params).fetchall())
+                except Exception as e:
+                    self._reject(future, e)
+            elif op[0] == 'call':
+                _, func, future = op
+                try:
+                    self._resolve(future, func(connection))
+                except Exception as e:
+                    self._reject(future, e)
+
+    def _resolve(self, future, result):
+        if future is not None:
+            self.loop.call_soon_threadsafe(self._set_result, future, result)
+
+    def _reject(self, future, error):
+        if future is not None:
+            self.loop.call_soon_threadsafe(self._set_exception, future, error)
+
+    @staticmethod
+    def _set_result(future, result):
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future, error):
+        if not future.done():
+            future.set_exception(error)
+
+    # endregion
+
+    # region Низкоуровневый доступ
+
+    def write(self, sql: str, params: Iterable = (), many: bool = False, wait: bool = False):
+        """Ставит запись в очередь; с wait=True возвращает future с rowcount"""
+        future = self.loop.create_future() if wait else None
+        self._queue.put(('write', sql, params, many, future))
+        return future
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        return await self.write(sql, params, wait=True)
+
+    async def executemany(self, sql: str, params: Iterable[Iterable]) -> int:
+        return await self.write(sql, list(params), many=True, wait=True)
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        future = self.loop.create_future()
+        self._queue.put(('read', sql, params, future))
+        return await future
+
+    async def run(self, func):
+        """Выполняет func(connection) в потоке базы"""
+        future = self.loop.create_future()
+        self._queue.put(('call', func, future))
+        return await future
+
+    async def flush(self):
+        """Дожидается записи всех операций, поставленных ранее"""
+        await self.run(lambda connection: None)
+
+    async def close(self):
+        """Дописывает очередь и закрывает базу"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+        self.logger.info("🗄️ База данных закрыта")
+
+    # endregion
+
+    # region Кеш
+
+    def _cache_get(self, cache_key):
+        value = self._cache.get(cache_key, _MISSING)
+        if value is not _MISSING:
+            self._cache.move_to_end(cache_key)
+        return value
+
+    def _cache_put(self, cache_key, value):
+        self._cache[cache_key] = value
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cache_write(self, cache_key, value):
+        self._cache_writes += 1
+        self._cache_put(cache_key, value)
+
+    def _cache_drop_namespace(self, namespace: str):
+        self._cache_writes += 1
+        for cache_key in [k for k in self._cache if k[0] == namespace]:
+            del self._cache[cache_key]
+
+    # endregion
+
+    def namespace(self, name: str) -> 'Namespace':
+        """Возвращает пространство имен модуля"""
+        if name not in self._namespaces:
+            self._namespaces[name] = Namespace(self, name)
+        return self._namespaces[name]
+
+
+class Namespace:
+    """Ключ-значение и таблицы одного модуля"""
+
+    def __init__(self, db: Database, name: str):
+        self.db = db
+        self.name = name
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        cache_key = (self.name, key)
+        value = self.db._cache_get(cache_key)
+        if value is _MISSING:
+            writes = self.db._cache_writes
+            rows = await self.db.fetchall(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.name, key)
+            )
+            value = json.loads(rows[0][0]) if rows else None
+            # Пока шло чтение, set() мог положить в кеш более новое значение - прочитанное его не заменяет
+            if self.db._cache_writes == writes:
+                self.db._cache_put(cache_key, value)
+        return default if value is None else value
+
+    def set(self, key: str, value: Any):
+        """Сохраняет значение; запись уходит в поток базы без ожидания"""
+        self.db._cache_write((self.name, key), value)
+        self.db.write(
+            "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+            (self.name, key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def delete(self, key: str):
+        self.db._cache_write((self.name, key), None)
+        self.db.write("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.name, key))
+
+    async def items(self) -> Dict[str, Any]:
+        rows = await self.db.fetchall("SELECT key, value FROM kv WHERE namespace = ?", (self.name,))
+        return {key: json.loads(value) for key, value in rows}
+
+    async def clear(self):
+        self.db._cache_drop_namespace(self.name)
+        await self.db.execute("DELETE FROM kv WHERE namespace = ?", (self.name,))
+
+    async def table(self, name: str, columns: Dict[str, str], indexes: Iterable[str] = ()) -> 'Table':
+        """Создает (при необходимости) таблицу модуля: columns = {'имя': 'ТИП'}"""
+        table = Table(self.db, f"{_check_identifier(self.name)}__{_check_identifier(name)}", columns)
+        await table.create(indexes)
+        return table
+
+
+class Table:
+    """Таблица модуля с заранее подготовленными SQL выражениями"""
+
+    def __init__(self, db: Database, name: str, columns: Dict[str, str]):
+        self.db = db
+        self.name = name
+        self.columns = [_check_identifier(column) for column in columns]
+        self.column_types = columns
+        placeholders = ', '.join('?' for _ in self.columns)
+        self._insert_sql = f"INSERT OR REPLACE INTO {name} ({', '.join(self.columns)}) VALUES ({placeholders})"
+
+    async def create(self, indexes: Iterable[str] = ()):
+        definition = ', '.join(f"{column} {self.column_types[column]}" for column in self.columns)
+        await self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.name} ({definition})")
+        for column in indexes:
+            _check_identifier(column)
+            await self.db.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_{column} ON {self.name} ({column})")
+
+    def _row(self, row: Dict[str, Any]) -> tuple:
+        return tuple(row.get(column) for column in self.columns)
+
+    def insert(self, row: Dict[str, Any]):
+        """Ставит вставку строки в очередь без ожидания"""
+        self.db.write(self._insert_sql, self._row(row))
+
+    def insert_many(self, rows: Iterable[Dict[str, Any]]):
+        self.db.write(self._insert_sql, [self._row(row) for row in rows], many=True)
+
+    async def select(self, where: str = '', params: Iterable = (), order_by: str = '',
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.name}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = await self.db.fetchall(sql, params)
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    async def delete(self, where: str, params: Iterable = ()) -> int:
+        return await self.db.execute(f"DELETE FROM {self.name} WHERE {where}", params)
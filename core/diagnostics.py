@@ -0,0 +1,292 @@
+"""
+Диагностика памяти Kbot 3.0
+tracemalloc со сравнением снимков, разбивка выделений по владельцу
+(модуль из modules/, ядро, Telethon), статистика gc и крупнейшие типы объектов
+"""
+
+import asyncio
+import gc
+import io
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import telethon
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TELETHON_ROOT = os.path.dirname(os.path.abspath(telethon.__file__))
+DEFAULT_FRAMES = 10
+TOP_LIMIT = 25
+
+
+def peak_rss() -> Optional[int]:
+    """Пиковый RSS процесса в байтах"""
+    try:
+        import resource
+    except ImportError:
+        # Windows: resource нет, пик есть только у psutil
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None) if psutil is not None else None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS отдает байты, Linux - килобайты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """RSS и VMS процесса в байтах; без psutil - из /proc (Linux) или только пиковый RSS
+
+    Читает /proc, поэтому из цикла событий вызывать через disk.run.
+    """
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return {'rss': info.rss, 'vms': info.vms, 'peak_rss': None}
+    try:
+        with open('/proc/self/statm') as f:
+            vms, rss = (int(value) * os.sysconf('SC_PAGE_SIZE') for value in f.read().split()[:2])
+        return {'rss': rss, 'vms': vms, 'peak_rss': peak_rss()}
+    except (OSError, ValueError, AttributeError):
+        return {'rss': None, 'vms': None, 'peak_rss': peak_rss()}
+
+
+def format_size(size: Optional[float]) -> str:
+    if size is None:
+        return '—'
+    for unit in ('Б', 'КБ', 'МБ'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} ГБ"
+
+
+class MemoryDiagnostics:
+    """Снимки tracemalloc и отчеты о памяти для команды .mem"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("MemoryDiagnostics")
+        self.modules_dir = os.path.abspath('modules')
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_time: Optional[float] = None
+        # tracemalloc общий для процесса: останавливаем только то, что запустили сами
+        self._started_here = False
+
+    # region Трассировка
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = DEFAULT_FRAMES) -> bool:
+        """Включает tracemalloc и запоминает исходный снимок"""
+        if self.tracing:
+            return False
+        tracemalloc.start(frames)
+        self._started_here = True
+        self.baseline = self._take_snapshot()
+        self.baseline_time = time.time()
+        self.logger.info(f"🔬 tracemalloc запущен (кадров: {frames})")
+        return True
+
+    def stop(self) -> bool:
+        if not self.tracing:
+            return False
+        tracemalloc.stop()
+        self._started_here = False
+        self.baseline = None
+        self.baseline_time = None
+        self.logger.info("🔬 tracemalloc остановлен")
+        return True
+
+    def reset(self):
+        """Новый исходный снимок: следующий отчет покажет прирост от этого момента"""
+        if self.tracing:
+            self.baseline = self._take_snapshot()
+            self.baseline_time = time.time()
+
+    def close(self):
+        if self._started_here:
+            self.stop()
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        # Выделения самого tracemalloc и импорта не интересны
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    # endregion
+
+    # region Владельцы выделений
+
+    def owner_of(self, filename: str) -> str:
+        """modules/<имя>, core, telethon или other для файла исходника"""
+        path = os.path.abspath(filename)
+        if path.startswith(self.modules_dir + os.sep):
+            return 'modules/' + os.path.splitext(os.path.relpath(path, self.modules_dir))[0].replace(os.sep, '/')
+        if path.startswith(TELETHON_ROOT + os.sep):
+            return 'telethon'
+        if path.startswith(PROJECT_ROOT + os.sep) and '-packages' not in path:
+            return 'core'
+        return 'other'
+
+    def attribute(self, traceback: tracemalloc.Traceback) -> str:
+        """Владелец выделения: ближайший к месту выделения модуль из modules/ в стеке,
+        иначе владелец самого внутреннего кадра"""
+        owners = [self.owner_of(frame.filename) for frame in traceback]
+        for owner in owners:
+            if owner.startswith('modules/'):
+                return owner
+        for owner in owners:
+            if owner != 'other':
+                return owner
+        return 'other'
+
+    def by_owner(self, snapshot: tracemalloc.Snapshot,
+                 baseline: Optional[tracemalloc.Snapshot] = None) -> List[Tuple[str, int, int]]:
+        """[(владелец, байт сейчас, прирост от исходного снимка)] по убыванию прироста"""
+        current: Dict[str, int] = defaultdict(int)
+        growth: Dict[str, int] = defaultdict(int)
+        for stat in snapshot.statistics('traceback'):
+            current[self.attribute(stat.traceback)] += stat.size
+        if baseline is not None:
+            for stat in snapshot.compare_to(baseline, 'traceback'):
+                growth[self.attribute(stat.traceback)] += stat.size_diff
+        owners = set(current) | set(growth)
+        return sorted(
+            ((owner, current[owner], growth[owner]) for owner in owners),
+            key=lambda item: (item[2], item[1]), reverse=True
+        )
+
+    # endregion
+
+    # region Сборщик мусора и типы объектов
+
+    @staticmethod
+    def gc_stats() -> Dict:
+        return {
+            'enabled': gc.isenabled(),
+            'counts': gc.get_count(),
+            'thresholds': gc.get_threshold(),
+            'generations': gc.get_stats(),
+            'garbage': len(gc.garbage),
+        }
+
+    @staticmethod
+    def largest_types(limit: int = TOP_LIMIT) -> List[Tuple[str, int, int]]:
+        """[(тип, объектов, собственный размер)] среди отслеживаемых gc объектов"""
+        counts: Dict[str, int] = defaultdict(int)
+        sizes: Dict[str, int] = defaultdict(int)
+        for obj in gc.get_objects():
+            name = f"{type(obj).__module__}.{type(obj).__qualname__}"
+            counts[name] += 1
+            try:
+                sizes[name] += sys.getsizeof(obj)
+            except TypeError:
+                pass
+        return sorted(((name, counts[name], sizes[name]) for name in counts),
+                      key=lambda item: item[2], reverse=True)[:limit]
+
+    # endregion
+
+    # region Отчет
+
+    def build_report(self) -> Dict:
+        """Собирает все данные отчета (синхронно, вызывать вне цикла событий)"""
+        report = {
+            'created_at': time.time(),
+            'process': process_memory(),
+            'gc': self.gc_stats(),
+            'types': self.largest_types(),
+            'tracing': self.tracing,
+        }
+        if self.tracing:
+            snapshot = self._take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            report.update({
+                'traced': current,
+                'traced_peak': peak,
+                'overhead': tracemalloc.get_tracemalloc_memory(),
+                'baseline_time': self.baseline_time,
+                'owners': self.by_owner(snapshot, self.baseline),
+                'top_lines': snapshot.compare_to(self.baseline, 'lineno')[:TOP_LIMIT]
+                if self.baseline is not None else snapshot.statistics('lineno')[:TOP_LIMIT],
+            })
+        return report
+
+    async def report(self) -> Dict:
+        # Обход всех объектов и снимка занимает заметное время - не держим цикл событий
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.build_report)
+
+    def summary(self, report: Dict) -> str:
+        process = report['process']
+        lines = ["💾 **Kbot 3.0 - Память**", ""]
+        if process['rss'] is not None:
+            lines.append(f"• RSS: {format_size(process['rss'])}, VMS: {format_size(process['vms'])}")
+        elif process['peak_rss'] is not None:
+            lines.append(f"• Пиковый RSS: {format_size(process['peak_rss'])} (psutil не установлен)")
+        gc_info = report['gc']
+        lines.append(f"• gc: счетчики {gc_info['counts']}, пороги {gc_info['thresholds']}, "
+                     f"мусор {gc_info['garbage']}")
+
+        if not report['tracing']:
+            lines += ["", "🔬 tracemalloc выключен", "💡 `.mem start` - начать отслеживание выделений"]
+            return "\n".join(lines)
+
+        since = int(time.time() - report['baseline_time']) if report.get('baseline_time') else 0
+        lines += [
+            f"• Отслежено: {format_size(report['traced'])} (пик {format_size(report['traced_peak'])}, "
+            f"накладные {format_size(report['overhead'])})",
+            "",
+            f"📈 **Прирост по владельцам за {since // 60}м {since % 60}с:**",
+        ]
+        for owner, size, growth in report['owners'][:8]:
+            lines.append(f"• `{owner}` - {format_size(size)} ({'+' if growth >= 0 else '−'}{format_size(abs(growth))})")
+        lines += ["", "💡 `.mem reset` - новый исходный снимок, `.mem stop` - выключить"]
+        return "\n".join(lines)
+
+    def render(self, report: Dict) -> str:
+        """Полный текстовый отчет для файла"""
+        out = io.StringIO()
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(report['created_at']))
+        out.write(f"Kbot 3.0 - отчет о памяти, {created}, PID {os.getpid()}\n\n")
+
+        out.write("== Процесс ==\n")
+        for key, value in report['process'].items():
+            out.write(f"{key}: {format_size(value)}\n")
+
+        gc_info = report['gc']
+        out.write("\n== Сборщик мусора ==\n")
+        out.write(f"включен: {gc_info['enabled']}, счетчики: {gc_info['counts']}, "
+                  f"пороги: {gc_info['thresholds']}, gc.garbage: {gc_info['garbage']}\n")
+        for generation, stats in enumerate(gc_info['generations']):
+            out.write(f"поколение {generation}: сборок {stats['collections']}, "
+                      f"собрано {stats['collected']}, неуничтожимых {stats['uncollectable']}\n")
+
+        out.write("\n== Крупнейшие типы объектов (собственный размер) ==\n")
+        for name, count, size in report['types']:
+            out.write(f"{format_size(size):>10}  {count:>9}  {name}\n")
+
+        if report['tracing']:
+            out.write(f"\n== tracemalloc ==\nотслежено: {format_size(report['traced'])}, "
+                      f"пик: {format_size(report['traced_peak'])}, накладные: {format_size(report['overhead'])}\n")
+            out.write("\n== По владельцам (сейчас / прирост) ==\n")
+            for owner, size, growth in report['owners']:
+                out.write(f"{format_size(size):>10}  {growth:+12d} Б  {owner}\n")
+            out.write("\n== Крупнейшие строки ==\n")
+            for stat in report['top_lines']:
+                out.write(f"{stat}\n")
+        return out.getvalue()
+
+    # endregion
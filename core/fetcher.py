@@ -0,0 +1,230 @@
+"""
+Асинхронная загрузка модулей Kbot 3.0 по URL
+Потоковое скачивание во временный файл, проверка и атомарная установка
+одного модуля (.py) или zip-пакета модулей (.kbz)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .fileio import disk
+from .module_manager.sources import module_sources
+
+MODULE_NAME_RE = re.compile(r'^\w+\.(py|kbz|zip)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(Exception):
+    """Ошибка скачивания или проверки модуля"""
+
+
+class ModuleFetcher:
+    def __init__(self, bot, modules_dir: str = "modules", max_size: int = 1024 * 1024,
+                 timeout: float = 30.0, concurrency: int = 4):
+        self.bot = bot
+        self.logger = logging.getLogger("ModuleFetcher")
+        self.modules_dir = Path(modules_dir)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Активация модулей выполняется по одному, скачивание - параллельно
+        self._install_lock = asyncio.Lock()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общий HTTP клиент с пулом соединений"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency * 2),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': 'Kbot-Loader-3.0'}
+            )
+        return self._session
+
+    async def close(self):
+        """Закрывает HTTP клиент"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def parse_url(url: str) -> Tuple[str, str, Optional[str]]:
+        """Разбирает URL вида https://host/name.py#sha256=<hex> (или name.kbz)"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise FetchError(f"Неподдерживаемая схема URL: {parts.scheme or '-'}")
+
+        checksum = None
+        if parts.fragment.startswith('sha256='):
+            checksum = parts.fragment[len('sha256='):].lower()
+
+        name = parts.path.rsplit('/', 1)[-1]
+        if not MODULE_NAME_RE.match(name):
+            raise FetchError(f"Некорректное имя файла модуля: {name or '-'}")
+
+        return parts._replace(fragment='').geturl(), name, checksum
+
+    async def fetch(self, url: str, expected_sha256: Optional[str] = None, suffix: str = '.py') -> Path:
+        """Скачивает файл потоком во временный файл в папке модулей"""
+        await disk.makedirs(self.modules_dir)
+        # Точка в начале имени скрывает файл от загрузчика модулей
+        temp_path = self.modules_dir / f".{uuid.uuid4().hex}.part{suffix}"
+        digest = hashlib.sha256()
+        size = 0
+
+        session = await self.get_session()
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise FetchError(f"HTTP {response.status}")
+                if response.content_length and response.content_length > self.max_size:
+                    raise FetchError(f"Файл слишком большой: {response.content_length} байт")
+
+                f = await disk.run('open', open, temp_path, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_size:
+                            raise FetchError(f"Файл больше лимита {self.max_size} байт")
+                        digest.update(chunk)
+                        await disk.run('write', f.write, chunk)
+                finally:
+                    await disk.run('close', f.close)
+
+            if expected_sha256 and digest.hexdigest() != expected_sha256:
+                raise FetchError("Контрольная сумма не совпадает")
+
+            return temp_path
+        except asyncio.TimeoutError:
+            await self._discard(temp_path)
+            raise FetchError(f"Таймаут скачивания ({self.timeout:.0f}с)")
+        except aiohttp.ClientError as e:
+            await self._discard(temp_path)
+            raise FetchError(f"Ошибка сети: {e}")
+        except BaseException:
+            await self._discard(temp_path)
+            raise
+
+    async def _discard(self, path: Path):
+        try:
+            await disk.remove(path)
+        except OSError as e:
+            self.logger.warning(f"⚠️ Не удалось удалить временный файл {path}: {e}")
+
+    async def validate(self, temp_path: Path, module_name: str):
+        """Проверяет скачанный модуль через ModuleManager до активации"""
+        if temp_path.suffix == '.py':
+            sources = None
+            names = [module_name]
+        else:
+            try:
+                sources = await disk.run('scan', module_sources, temp_path)
+            except Exception as e:
+                raise FetchError(f"Неверный пакет модулей: {e}")
+            names = [source.name for source in sources]
+        if any(name in self.bot.system_modules for name in names):
+            raise FetchError("Имя совпадает с системным модулем")
+
+        manager = self.bot.module_manager
+        if sources is None:
+            safe = await manager.check_module_safety(temp_path)
+        else:
+            # Архив не текст: проверяются исходники каждого модуля пакета, как при загрузке
+            safe = True
+            for source in sources:
+                try:
+                    texts = await disk.run('read', source.read_sources)
+                except Exception as e:
+                    raise FetchError(f"Неверный пакет модулей: {e}")
+                if not await manager.check_module_safety(source.location, "\n".join(texts.values())):
+                    safe = False
+                    break
+        if not safe:
+            raise FetchError("Модуль не прошел проверку безопасности")
+
+        conflicts = await manager.check_module_conflicts(temp_path, self.bot.system_commands)
+        if conflicts:
+            raise FetchError(f"Конфликт с системными командами: {', '.join(conflicts)}")
+
+    async def install(self, url: str) -> Dict:
+        """Скачивает, проверяет и активирует один модуль"""
+        result = {'url': url, 'name': None, 'success': False, 'commands': [], 'error': None}
+        temp_path = None
+        try:
+            clean_url, file_name, checksum = self.parse_url(url)
+            module_name, suffix = os.path.splitext(file_name)
+            result['name'] = module_name if suffix == '.py' else file_name
+
+            async with self._semaphore:
+                temp_path = await self.fetch(clean_url, checksum, suffix)
+            await self.validate(temp_path, module_name)
+
+            async with self._install_lock:
+                await self.activate(temp_path, file_name)
+            temp_path = None
+
+            manager = self.bot.module_manager
+            result['commands'] = [
+                command for name in await manager.modules_from(self.modules_dir / file_name)
+                for command in manager.get_module_commands(name)
+            ]
+            result['success'] = True
+        except FetchError as e:
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка установки модуля {url}: {e}")
+            result['error'] = str(e)
+        finally:
+            if temp_path is not None:
+                await self._discard(temp_path)
+        return result
+
+    async def activate(self, temp_path: Path, file_name: str):
+        """Атомарно переносит модуль (или пакет) в папку modules и загружает его"""
+        manager = self.bot.module_manager
+        module_name = os.path.splitext(file_name)[0]
+        final_path = self.modules_dir / file_name
+        backup_path = self.modules_dir / f".{file_name}.bak"
+
+        had_previous = await disk.exists(final_path)
+        if had_previous:
+            await disk.run('replace', os.replace, final_path, backup_path)
+        await disk.run('replace', os.replace, temp_path, final_path)
+
+        # Прежние модули этого файла (для пакета - все, что он содержал)
+        previous = set(await manager.modules_from(final_path))
+        if final_path.suffix == '.py' and module_name in manager.list_modules():
+            previous.add(module_name)
+        for name in previous:
+            await manager.unload_module(name)
+
+        if await manager.load_module_from_file(final_path):
+            if had_previous:
+                await self._discard(backup_path)
+            self.bot.security.scan_and_secure_modules()
+            self.logger.info(f"📥 Модуль {file_name} установлен по URL")
+            return
+
+        # Возвращаем предыдущую версию, если новая не загрузилась
+        for name in await manager.modules_from(final_path):
+            await manager.unload_module(name)
+        if had_previous:
+            await disk.run('replace', os.replace, backup_path, final_path)
+            await manager.load_module_from_file(final_path)
+        else:
+            await self._discard(final_path)
+        raise FetchError("Ошибка загрузки модуля")
+
+    async def install_many(self, urls: List[str]) -> List[Dict]:
+        """Параллельно устанавливает несколько модулей"""
+        return list(await asyncio.gather(*(self.install(url) for url in urls)))
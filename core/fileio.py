@@ -0,0 +1,268 @@
+"""
+Файловый ввод-вывод Kbot 3.0 вне цикла событий
+Общий для процесса пул потоков ограниченного размера, асинхронные
+чтение/запись/атомарная замена/копирование и замер каждой операции.
+Строгий режим ловит блокирующие файловые вызовы в потоке цикла событий
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .tracing import span
+
+# Аудит-события Python, которые означают обращение к диску
+BLOCKING_EVENTS = {
+    'open', 'os.remove', 'os.rmdir', 'os.rename', 'os.mkdir', 'os.listdir', 'os.scandir',
+    'os.truncate', 'shutil.copyfile', 'shutil.copytree', 'shutil.rmtree', 'shutil.move',
+}
+STRICT_MODES = ('off', 'warn', 'raise')
+
+_allowed: contextvars.ContextVar = contextvars.ContextVar('kbot_blocking_allowed', default=False)
+
+
+class BlockingCallError(RuntimeError):
+    """Блокирующая файловая операция в потоке цикла событий (строгий режим)"""
+
+
+class FileIO:
+    """Асинхронные файловые операции на выделенном пуле потоков"""
+
+    def __init__(self, workers: int = 4):
+        self.logger = logging.getLogger("FileIO")
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # операция -> [количество, суммарное время, максимум, ошибки]
+        self.timings: Dict[str, List[float]] = {}
+        self.strict = 'off'
+        self._loop_thread: Optional[int] = None
+        self._hook_installed = False
+        self._reported = set()
+        # Импорты стандартной библиотеки и пакетов читают файлы - это не ошибка кода бота
+        self._exempt_roots = tuple({os.path.abspath(p) + os.sep for p in (sys.prefix, sys.base_prefix)})
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='kbot-io')
+        return self._executor
+
+    def configure(self, workers: Optional[int] = None):
+        """Меняет размер пула; вызывается до первой операции"""
+        if workers and workers != self.workers and self._executor is None:
+            self.workers = max(1, workers)
+
+    # region Выполнение и замеры
+
+    async def run(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет func в пуле ввода-вывода с замером времени"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        started = time.perf_counter()
+        failed = False
+        with span(f"io.{operation}"):
+            try:
+                return await loop.run_in_executor(self.executor, call)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._record(operation, time.perf_counter() - started, failed)
+
+    def _record(self, operation: str, duration: float, failed: bool):
+        timing = self.timings.get(operation)
+        if timing is None:
+            timing = self.timings[operation] = [0, 0.0, 0.0, 0]
+        timing[0] += 1
+        timing[1] += duration
+        timing[2] = max(timing[2], duration)
+        timing[3] += failed
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            operation: {
+                'count': count,
+                'avg_ms': total / count * 1000 if count else 0.0,
+                'max_ms': peak * 1000,
+                'errors': errors,
+            }
+            for operation, (count, total, peak, errors) in sorted(self.timings.items())
+        }
+
+    async def close(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(executor.shutdown, wait=True))
+
+    # endregion
+
+    # region Примитивы
+
+    async def read_text(self, path, encoding: str = 'utf-8') -> str:
+        return await self.run('read', _read_text, path, encoding)
+
+    async def read_bytes(self, path) -> bytes:
+        return await self.run('read', _read_bytes, path)
+
+    async def write_text(self, path, data: str, encoding: str = 'utf-8', atomic: bool = True):
+        """Записывает текст; по умолчанию атомарно (временный файл, fsync, замена)"""
+        await self.write_bytes(path, data.encode(encoding), atomic=atomic)
+
+    async def write_bytes(self, path, data: bytes, atomic: bool = True):
+        if atomic:
+            await self.run('replace', atomic_write, path, data)
+        else:
+            await self.run('write', _write_bytes, path, data)
+
+    async def append_text(self, path, data: str, encoding: str = 'utf-8'):
+        await self.run('append', _append_text, path, data, encoding)
+
+    async def exists(self, path) -> bool:
+        return await self.run('stat', os.path.exists, path)
+
+    async def listdir(self, path) -> List[str]:
+        return await self.run('listdir', os.listdir, path)
+
+    async def makedirs(self, path):
+        await self.run('mkdir', os.makedirs, path, exist_ok=True)
+
+    async def remove(self, path, missing_ok: bool = True):
+        await self.run('remove', _remove, path, missing_ok)
+
+    async def copy(self, source, destination):
+        await self.run('copy', shutil.copy2, source, destination)
+
+    async def copytree(self, source, destination):
+        await self.run('copytree', shutil.copytree, source, destination)
+
+    async def rmtree(self, path):
+        await self.run('rmtree', shutil.rmtree, path, ignore_errors=True)
+
+    # endregion
+
+    # region Строгий режим
+
+    def arm(self, mode: str = 'raise'):
+        """Включает проверку блокирующих файловых вызовов в текущем потоке цикла событий"""
+        if mode not in STRICT_MODES:
+            raise ValueError(f"Неизвестный режим io_strict: {mode}")
+        self.strict = mode
+        if mode == 'off':
+            return
+        self._loop_thread = threading.get_ident()
+        if not self._hook_installed:
+            # Аудит-хук нельзя снять, поэтому он один на процесс и проверяет self.strict
+            sys.addaudithook(self._audit)
+            self._hook_installed = True
+        self.logger.info(f"🔎 Строгий режим ввода-вывода: {mode}")
+
+    def disarm(self):
+        self.strict = 'off'
+
+    @contextlib.contextmanager
+    def allow_blocking(self):
+        """Разрешает блокирующий ввод-вывод в цикле (выполнение кода модулей, выключение)"""
+        token = _allowed.set(True)
+        try:
+            yield
+        finally:
+            _allowed.reset(token)
+
+    def _audit(self, event: str, args: tuple):
+        if self.strict == 'off' or event not in BLOCKING_EVENTS:
+            return
+        if threading.get_ident() != self._loop_thread or _allowed.get():
+            return
+        path = str(args[0]) if args and isinstance(args[0], (str, bytes, os.PathLike)) else ''
+        if path and os.path.abspath(path).startswith(self._exempt_roots):
+            return
+        if path.endswith('.pyc'):
+            return
+
+        # Место вызова без чтения исходников, иначе linecache сам вызовет этот хук
+        site = None
+        frame = sys._getframe(1)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith('<frozen importlib'):
+                # Импорт (в том числе отложенный) читает файлы один раз - не ошибка
+                return
+            if site is None and filename != __file__ and not filename.startswith(self._exempt_roots):
+                site = f"{filename}:{frame.f_lineno}"
+            frame = frame.f_back
+
+        message = f"Блокирующий вызов {event}({path}) в потоке цикла событий"
+        if self.strict == 'raise':
+            raise BlockingCallError(message)
+        # В режиме warn сообщаем о каждом месте вызова один раз
+        site = site or '?'
+        if (event, site) not in self._reported:
+            self._reported.add((event, site))
+            token = _allowed.set(True)
+            try:
+                self.logger.warning(f"⚠️ {message} ({site})")
+            finally:
+                _allowed.reset(token)
+
+    # endregion
+
+
+def atomic_write(path, data: bytes):
+    """Атомарная запись: временный файл в той же папке, fsync, замена"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.kbot.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _read_text(path, encoding: str) -> str:
+    with open(path, 'r', encoding=encoding) as f:
+        return f.read()
+
+
+def _read_bytes(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_bytes(path, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _append_text(path, data: str, encoding: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding=encoding) as f:
+        f.write(data)
+
+
+def _remove(path, missing_ok: bool):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        if not missing_ok:
+            raise
+
+
+# Один пул на процесс: его разделяют все аккаунты и модули (bot.io)
+disk = FileIO()
@@ -0,0 +1,255 @@
+"""
+Inline-бот Kbot 3.0
+Бот-компаньон (bot_username) отвечает на inline-запросы владельца меню
+помощи, модулей и настроек с кнопками. Отрисованные страницы и готовые
+результаты кешируются, пока не изменятся модули или настройки
+"""
+
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from telethon import Button, TelegramClient, events
+
+from .session import BufferedSession
+
+CALLBACK_PREFIX = 'kb'
+PAGE_SIZE = 8
+# Ограничение Telegram на данные callback-кнопки
+MAX_CALLBACK_DATA = 64
+# Логические настройки, которые можно переключать кнопками
+TOGGLES = (
+    ('edit_mode', 'Редактировать команды'),
+    ('enable_backups', 'Бэкапы модулей'),
+    ('enable_startup_notification', 'Уведомление о запуске'),
+    ('enable_security_notifications', 'Уведомления безопасности'),
+    ('tracing', 'Трассировка'),
+)
+
+Page = Tuple[str, Optional[List[list]]]
+
+
+class InlineMenus:
+    """Меню Kbot через inline-режим бота-компаньона"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("InlineMenus")
+        self.client: Optional[TelegramClient] = None
+        self.cache = bot.cache.namespace('core.inline', max_items=256)
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None and self.client.is_connected()
+
+    @property
+    def username(self) -> Optional[str]:
+        username = self.bot.config.get('bot_username')
+        return username.lstrip('@') if username else None
+
+    def token(self) -> Optional[str]:
+        """Токен из настройки bot_token или configs/bot_token.txt"""
+        token = self.bot.config.get('bot_token')
+        if token:
+            return token
+        path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'bot_token.txt')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read().strip() or None
+        return None
+
+    # region Запуск
+
+    async def start(self):
+        if not self.bot.config.get('inline_bot', False):
+            return
+        token = self.token()
+        if not token or not self.username:
+            self.logger.warning("⚠️ Inline-бот включен, но не заданы bot_username и bot_token")
+            return
+
+        session_name = f"{self.bot.session_name()}_inline"
+        session = session_name if self.bot.config.get('session_backend', 'buffered') == 'sqlite' else BufferedSession(session_name)
+        self.client = TelegramClient(session, self.bot.config['api_id'], self.bot.config['api_hash'])
+        try:
+            await self.client.start(bot_token=token)
+        except Exception as e:
+            self.logger.error(f"❌ Не удалось запустить inline-бота: {e}")
+            self.client = None
+            return
+
+        self.client.add_event_handler(self.on_inline_query, events.InlineQuery())
+        self.client.add_event_handler(self.on_callback, events.CallbackQuery(pattern=rf'^{CALLBACK_PREFIX}:'.encode()))
+        self.logger.info(f"🤖 Inline-бот @{self.username} запущен (включите inline-режим в @BotFather)")
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.disconnect()
+            self.client = None
+
+    # endregion
+
+    # region Ключи кеша
+
+    def modules_key(self) -> int:
+        # Поколение меняется при каждой загрузке и выгрузке модуля
+        return self.bot.module_manager.generation
+
+    def settings_key(self) -> tuple:
+        return tuple(self.bot.config.get(key) for key, _ in TOGGLES) + (
+            self.bot.config.get('command_prefix', '.'),
+        )
+
+    # endregion
+
+    # region Страницы
+
+    def render(self, menu: str, argument: str = '') -> Page:
+        """Страница меню из кеша; отрисовывается только при изменении данных"""
+        if menu == 'settings':
+            key = ('page', menu, argument, self.settings_key())
+        else:
+            key = ('page', menu, argument, self.modules_key())
+        page = self.cache.get(key)
+        if page is None:
+            page = self._render(menu, argument)
+            self.cache.set(key, page)
+        return page
+
+    def _render(self, menu: str, argument: str) -> Page:
+        if menu == 'modules':
+            return self.render_modules(int(argument or 0))
+        if menu == 'mod':
+            return self.render_module(argument)
+        if menu == 'settings':
+            return self.render_settings()
+        return self.render_help()
+
+    @staticmethod
+    def button(text: str, *parts: str):
+        data = ':'.join((CALLBACK_PREFIX,) + parts).encode()
+        return Button.inline(text, data) if len(data) <= MAX_CALLBACK_DATA else None
+
+    def navigation(self) -> list:
+        return [self.button('❓ Помощь', 'help', ''), self.button('📦 Модули', 'modules', '0'),
+                self.button('⚙️ Настройки', 'settings', '')]
+
+    def user_modules(self) -> list:
+        commands = self.bot.module_manager.get_all_commands()
+        return sorted((name, info) for name, info in commands.items() if name not in self.bot.system_modules)
+
+    def render_help(self) -> Page:
+        text = "🛠 **Kbot 3.0 - Система помощи**\n\n⚙️ **Системные команды:**\n"
+        text += "".join(f"• `{command}` - {description}\n" for command, description in self.bot.system_command_help())
+        text += f"\n📦 Пользовательских модулей: {len(self.user_modules())}"
+        return text, [self.navigation()]
+
+    def render_modules(self, page: int) -> Page:
+        modules = self.user_modules()
+        pages = max(1, (len(modules) + PAGE_SIZE - 1) // PAGE_SIZE)
+        page = max(0, min(page, pages - 1))
+        chunk = modules[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+
+        text = f"📦 **Модули** ({len(modules)}), страница {page + 1}/{pages}\n\n"
+        if not chunk:
+            text += "• Нет установленных модулей\n• Используйте `.klm` для установки"
+        for name, info in chunk:
+            text += f"• `{name}` - {len(info['commands'])} команд\n"
+
+        rows = []
+        module_buttons = [self.button(name, 'mod', name) for name, _ in chunk]
+        module_buttons = [button for button in module_buttons if button is not None]
+        rows += [module_buttons[i:i + 2] for i in range(0, len(module_buttons), 2)]
+        pager = []
+        if page > 0:
+            pager.append(self.button('◀️', 'modules', str(page - 1)))
+        if page < pages - 1:
+            pager.append(self.button('▶️', 'modules', str(page + 1)))
+        if pager:
+            rows.append(pager)
+        rows.append(self.navigation())
+        return text, rows
+
+    def render_module(self, name: str) -> Page:
+        info = self.bot.module_manager.get_module_info(name)
+        if not info or name in self.bot.system_modules:
+            return f"❌ Модуль `{name}` не найден", [self.navigation()]
+        text = f"📚 **Модуль {name}**\n\n📖 Описание: {info.get('description', 'Нет описания')}\n\n"
+        commands = info.get('commands', [])
+        text += "🛠 **Команды:**\n" + "\n".join(f"• `{command}`" for command in commands) if commands else "🛠 Команды не найдены"
+        return text, [[self.button('⬅️ К модулям', 'modules', '0')], self.navigation()]
+
+    def render_settings(self) -> Page:
+        config = self.bot.config
+        text = (
+            "⚙️ **Kbot 3.0 - Настройки**\n\n"
+            f"• Префикс команд: `{config.get('command_prefix', '.')}`\n"
+        )
+        rows = []
+        for key, title in TOGGLES:
+            value = bool(config.get(key))
+            text += f"• {title}: {'✅' if value else '❌'}\n"
+            rows.append([self.button(f"{'✅' if value else '❌'} {title}", 'set', key)])
+        text += "\n💡 Остальные настройки: `.settings set <ключ> <значение>`"
+        rows.append(self.navigation())
+        return text, rows
+
+    # endregion
+
+    # region Обработчики бота
+
+    def parse_query(self, query: str) -> Tuple[str, str]:
+        words = query.strip().lower().split()
+        if not words:
+            return 'help', ''
+        if words[0] in ('modules', 'модули'):
+            return 'modules', words[1] if len(words) > 1 and words[1].isdigit() else '0'
+        if words[0] in ('settings', 'настройки'):
+            return 'settings', ''
+        if words[0] in ('help', 'помощь'):
+            return ('mod', words[1]) if len(words) > 1 else ('help', '')
+        return 'mod', words[0]
+
+    async def on_inline_query(self, event):
+        if not self.bot.is_admin(event.sender_id):
+            await event.answer([], cache_time=0, private=True)
+            return
+
+        menu, argument = self.parse_query(event.text)
+        state = self.settings_key() if menu == 'settings' else self.modules_key()
+        key = ('results', menu, argument, state)
+        results = self.cache.get(key)
+        if results is None:
+            text, buttons = self.render(menu, argument)
+            title = text.split('\n', 1)[0].replace('*', '')
+            # Готовые TL-объекты: повторный запрос не разбирает разметку заново
+            results = [await event.builder.article(title, text=text, buttons=buttons, id=f"{menu}:{argument}"[:64])]
+            self.cache.set(key, results)
+        # Telegram сам отвечает на повторы в пределах cache_time, не спрашивая бота
+        await event.answer(results, cache_time=self.bot.config.get('inline_cache_time', 60), private=True)
+
+    async def on_callback(self, event):
+        if not self.bot.is_admin(event.sender_id):
+            await event.answer("⛔ Меню доступно только владельцу", alert=True)
+            return
+
+        _, menu, argument = event.data.decode().split(':', 2)
+        if menu == 'set':
+            if argument not in dict(TOGGLES):
+                await event.answer("❌ Неизвестная настройка", alert=True)
+                return
+            value = not bool(self.bot.config.get(argument))
+            await self.bot.config.set(argument, value)
+            await event.answer(f"{'✅' if value else '❌'} {dict(TOGGLES)[argument]}")
+            menu, argument = 'settings', ''
+        else:
+            await event.answer()
+
+        text, buttons = self.render(menu, argument)
+        try:
+            await event.edit(text, buttons=buttons)
+        except Exception as e:
+            # Та же страница (MessageNotModified) - ничего не делаем
+            self.logger.debug(f"Страница не изменена: {e}")
+
+    # endregion
@@ -0,0 +1,312 @@
+"""
+Передача медиа Kbot 3.0
+Параллельная загрузка и выгрузка файлов частями, общий лимит
+скорости и количества одновременных передач, прогресс в одном сообщении
+"""
+
+import asyncio
+import io
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Union
+
+from telethon import helpers
+from telethon.tl import functions, types
+
+from .fileio import disk
+from .tracing import span
+
+# Ограничения Telegram: часть кратна 4 КБ (1 КБ для выгрузки), не больше 512 КБ
+MIN_PART_SIZE = 4 * 1024
+MAX_PART_SIZE = 512 * 1024
+# Файлы больше 10 МБ выгружаются как "большие"
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+def _write_at(output, lock: threading.Lock, position: int, data: bytes):
+    # Части пишутся из потоков пула, поэтому seek+write под блокировкой
+    with lock:
+        output.seek(position)
+        output.write(data)
+
+
+def _read_at(source, lock: threading.Lock, position: int, size: int) -> bytes:
+    with lock:
+        source.seek(position)
+        return source.read(size)
+
+
+def part_path(path: str) -> str:
+    """Временный файл рядом с целевым; точка в начале скрывает его от загрузчика модулей"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{uuid.uuid4().hex}.part{os.path.splitext(name)[1]}")
+
+
+def normalize_part_size(part_size: int) -> int:
+    """Подбирает допустимый размер части: делитель 512 КБ, кратный 4 КБ"""
+    part_size = max(MIN_PART_SIZE, min(MAX_PART_SIZE, part_size))
+    size = MIN_PART_SIZE
+    while size * 2 <= part_size:
+        size *= 2
+    return size
+
+
+class TransferLimiter:
+    """Общий для всех передач лимит одновременных запросов частей и скорости"""
+
+    def __init__(self, max_parallel_parts: int = 16, bandwidth: int = 0):
+        self.slots = asyncio.Semaphore(max_parallel_parts)
+        # Байт в секунду, 0 - без ограничения
+        self.bandwidth = bandwidth
+        self._allowance = 0.0
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def throttle(self, size: int):
+        """Ждет, пока лимит скорости позволит передать size байт"""
+        if not self.bandwidth:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            # Ведро токенов: за секунду накапливается bandwidth байт, не больше секунды запаса
+            self._allowance = min(self.bandwidth, self._allowance + (now - self._last) * self.bandwidth)
+            self._last = now
+            self._allowance -= size
+            if self._allowance < 0:
+                await asyncio.sleep(-self._allowance / self.bandwidth)
+
+
+class ProgressReporter:
+    """Показывает прогресс передачи, редактируя сообщение не чаще раза в interval секунд"""
+
+    def __init__(self, bot, event, label: str, interval: float = 2.0):
+        self.bot = bot
+        self.event = event
+        self.label = label
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self._shown = None
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def __call__(self, done: int, total: int):
+        self.done = done
+        self.total = total
+        # Вместо правки на каждую часть планируем одну отложенную правку
+        if self._task is None or self._task.done():
+            delay = max(0.0, self._last_edit + self.interval - time.monotonic())
+            self._task = asyncio.create_task(self._edit_later(delay))
+
+    def render(self) -> str:
+        if not self.total:
+            return f"{self.label}..."
+        percent = self.done * 100 // self.total
+        filled = percent // 10
+        return (f"{self.label} [{'█' * filled}{'░' * (10 - filled)}] {percent}% "
+                f"({self.done / 1048576:.1f}/{self.total / 1048576:.1f} МБ)")
+
+    async def _edit_later(self, delay: float):
+        await asyncio.sleep(delay)
+        text = self.render()
+        if text == self._shown:
+            return
+        self._shown = text
+        self._last_edit = time.monotonic()
+        await self.bot.safe_reply(self.event, text)
+
+    async def finish(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+class MediaTransfer:
+    """Сервис передачи файлов (bot.media)"""
+
+    def __init__(self, bot, part_size: int = MAX_PART_SIZE, workers: int = 4,
+                 max_transfers: int = 3, max_parallel_parts: int = 16, bandwidth: int = 0,
+                 memory_limit: int = 4 * 1024 * 1024):
+        self.bot = bot
+        self.logger = logging.getLogger("MediaTransfer")
+        self.part_size = normalize_part_size(part_size)
+        self.workers = workers
+        # Файлы не больше memory_limit по умолчанию скачиваются в память
+        self.memory_limit = memory_limit
+        self.transfers = asyncio.Semaphore(max_transfers)
+        self.limiter = TransferLimiter(max_parallel_parts, bandwidth)
+
+    def progress_message(self, event, label: str = "📥 Загрузка", interval: float = 2.0) -> ProgressReporter:
+        """Создает callback прогресса, который правит сообщение с командой"""
+        return ProgressReporter(self.bot, event, label, interval)
+
+    async def download(self, message, file: Union[None, str, io.IOBase] = None,
+                       progress: Optional[Callable[[int, int], None]] = None,
+                       part_size: Optional[int] = None, workers: Optional[int] = None):
+        """Скачивает медиа сообщения параллельными частями (см. _download)"""
+        with span('media.download', size=getattr(getattr(message, 'file', None), 'size', None)):
+            return await self._download(message, file, progress, part_size, workers)
+
+    async def _download(self, message, file: Union[None, str, io.IOBase] = None,
+                        progress: Optional[Callable[[int, int], None]] = None,
+                        part_size: Optional[int] = None, workers: Optional[int] = None):
+        """Скачивает медиа сообщения параллельными частями
+
+        file=None - в BytesIO (для небольших файлов) или в папку downloads,
+        строка - путь к файлу, объект с write/seek - запись в него.
+        Возвращает путь или файловый объект.
+        """
+        media = getattr(message, 'media', message)
+        size = getattr(getattr(message, 'file', None), 'size', None)
+        if size is None:
+            # Размер неизвестен (например, фото без размеров) - обычная загрузка
+            if not isinstance(file, str):
+                return await self.bot.client.download_media(message, file=file if file is not None else bytes)
+            target = part_path(file)
+            try:
+                target = await self.bot.client.download_media(message, file=target)
+                await disk.run('replace', os.replace, target, file)
+            except BaseException:
+                await disk.remove(target)
+                raise
+            return file
+
+        part_size = normalize_part_size(part_size or self.part_size)
+        total_parts = max(1, math.ceil(size / part_size))
+        workers = max(1, min(workers or self.workers, total_parts))
+
+        if file is None:
+            if size <= self.memory_limit:
+                file = io.BytesIO()
+            else:
+                name = getattr(message.file, 'name', None) or f"file_{getattr(message, 'id', 0)}"
+                await disk.makedirs("downloads")
+                file = os.path.join("downloads", name)
+
+        # Файл на диске открывается и пишется в пуле ввода-вывода, буфер в памяти - на месте.
+        # Пишется временный файл: недокачанный файл не должен выглядеть готовым (как в fetcher)
+        on_disk = isinstance(file, str)
+        target = part_path(file) if on_disk else None
+        output = await disk.run('open', open, target, 'wb') if on_disk else file
+        lock = threading.Lock()
+        done = 0
+        started = time.perf_counter()
+
+        async def worker(index: int):
+            nonlocal done
+            parts = len(range(index, total_parts, workers))
+            position = index * part_size
+            # Итератор сам запрашивает части, поэтому слот занимается на весь поток
+            async with self.limiter.slots:
+                async for chunk in self.bot.client.iter_download(
+                        media, offset=position, stride=part_size * workers, limit=parts,
+                        chunk_size=part_size, request_size=part_size, file_size=size):
+                    await self.limiter.throttle(len(chunk))
+                    if on_disk:
+                        await disk.run('write', _write_at, output, lock, position, chunk)
+                    else:
+                        # Буфер в памяти пишется из потока цикла, seek+write не перемешиваются
+                        output.seek(position)
+                        output.write(chunk)
+                    position += part_size * workers
+                    done += len(chunk)
+                    if progress:
+                        progress(min(done, size), size)
+
+        completed = False
+        try:
+            async with self.transfers:
+                tasks = [asyncio.create_task(worker(i)) for i in range(workers)]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # Остальные потоки не должны дописывать в файл после ошибки или отмены
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+            completed = True
+        finally:
+            if on_disk:
+                await disk.run('close', output.close)
+                if completed:
+                    await disk.run('replace', os.replace, target, file)
+                else:
+                    await disk.remove(target)
+            if isinstance(progress, ProgressReporter):
+                await progress.finish()
+
+        elapsed = time.perf_counter() - started
+        self.logger.debug(f"📥 Скачано {size} байт за {elapsed:.2f}с ({workers} потоков)")
+        if not isinstance(file, str):
+            file.seek(0)
+        return file
+
+    async def upload(self, file: Union[str, bytes, io.IOBase], file_name: Optional[str] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     part_size: Optional[int] = None, workers: Optional[int] = None):
+        """Выгружает файл параллельными частями
+
+        Возвращает InputFile/InputFileBig для send_file(...).
+        """
+        if isinstance(file, bytes):
+            file = io.BytesIO(file)
+        on_disk = isinstance(file, str)
+        source = await disk.run('open', open, file, 'rb') if on_disk else file
+        lock = threading.Lock()
+        try:
+            if on_disk:
+                size = await disk.run('stat', os.path.getsize, file)
+            else:
+                source.seek(0, io.SEEK_END)
+                size = source.tell()
+            if not file_name:
+                file_name = os.path.basename(file) if isinstance(file, str) else getattr(file, 'name', 'file')
+
+            part_size = normalize_part_size(part_size or self.part_size)
+            total_parts = max(1, math.ceil(size / part_size))
+            workers = max(1, min(workers or self.workers, total_parts))
+            is_big = size > BIG_FILE_SIZE
+            file_id = helpers.generate_random_long()
+
+            queue = asyncio.Queue()
+            for index in range(total_parts):
+                queue.put_nowait(index)
+            done = 0
+
+            async def worker():
+                nonlocal done
+                while not queue.empty():
+                    index = queue.get_nowait()
+                    if on_disk:
+                        data = await disk.run('read', _read_at, source, lock, index * part_size, part_size)
+                    else:
+                        source.seek(index * part_size)
+                        data = source.read(part_size)
+                    await self.limiter.throttle(len(data))
+                    if is_big:
+                        request = functions.upload.SaveBigFilePartRequest(file_id, index, total_parts, data)
+                    else:
+                        request = functions.upload.SaveFilePartRequest(file_id, index, data)
+                    async with self.limiter.slots:
+                        accepted = await self.bot.client(request)
+                    if not accepted:
+                        raise RuntimeError(f"Telegram не принял часть {index}")
+                    done += len(data)
+                    if progress:
+                        progress(done, size)
+
+            async with self.transfers:
+                await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            if on_disk:
+                await disk.run('close', source.close)
+            if isinstance(progress, ProgressReporter):
+                await progress.finish()
+
+        if is_big:
+            return types.InputFileBig(file_id, total_parts, file_name)
+        return types.InputFile(file_id, total_parts, file_name, md5_checksum='')
@@ -0,0 +1,145 @@
+"""
+Образ модулей Kbot 3.0
+Один файл с скомпилированным кодом и метаданными (команды, описание) всех
+загруженных модулей. Запуск читает образ целиком одним чтением и сверяет
+каждую запись со временем изменения и размером исходников; при расхождении
+исходники хешируются, и перекомпилируется только изменившийся модуль
+"""
+
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+from typing import Dict, Iterable, Optional
+
+from ..fileio import atomic_write
+from .sources import ModuleSource
+
+IMAGE_PATH = os.path.join('data', 'module_image.bin')
+# Меняется вместе с форматом записей и правилами проверки безопасности модулей
+IMAGE_VERSION = 1
+HEADER = b'KBIMG' + bytes([IMAGE_VERSION]) + importlib.util.MAGIC_NUMBER
+
+
+def source_hash(sources: Dict[str, str]) -> str:
+    """Хеш всех исходников модуля вместе с их относительными путями"""
+    digest = hashlib.sha256()
+    for name in sorted(sources):
+        digest.update(name.encode('utf-8') + b'\0' + sources[name].encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+class ModuleImage:
+    """Скомпилированные модули процесса; синхронные методы выполняются в пуле ввода-вывода"""
+
+    def __init__(self, path: str = IMAGE_PATH):
+        self.logger = logging.getLogger("ModuleImage")
+        self.path = path
+        # ключ источника -> {'path', 'hash', 'stamps', 'code', 'commands', 'description'}
+        self.entries: Dict[str, dict] = {}
+        self.loaded = False
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source: ModuleSource) -> str:
+        kind, path = source.identity
+        return f"{kind}:{path}:{source.name}"
+
+    # region Файл образа
+
+    def load(self):
+        """Читает образ один раз за процесс; несовместимый или битый образ игнорируется"""
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            self.logger.warning(f"⚠️ Не удалось прочитать образ модулей: {e}")
+            return
+        if not data.startswith(HEADER):
+            self.logger.info("🧊 Образ модулей от другой версии Python или Kbot, будет пересобран")
+            return
+        try:
+            entries = marshal.loads(data[len(HEADER):])
+        except (EOFError, ValueError, TypeError) as e:
+            self.logger.warning(f"⚠️ Образ модулей поврежден, будет пересобран: {e}")
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def save(self):
+        """Атомарно записывает образ, если он менялся"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        # Снимок: другой аккаунт может добавлять записи, пока образ пишется в потоке пула
+        entries = dict(self.entries)
+        # Записи удаленных модулей больше не нужны
+        for key in [key for key, entry in entries.items() if not os.path.exists(entry['path'])]:
+            del entries[key]
+            self.entries.pop(key, None)
+        atomic_write(self.path, HEADER + marshal.dumps(entries))
+
+    # endregion
+
+    # region Записи
+
+    def validate(self, sources: Iterable[ModuleSource]) -> Dict[str, dict]:
+        """Записи, совпадающие с исходниками на диске (ключ источника -> запись)"""
+        valid = {}
+        for source in sources:
+            entry = self.check(source)
+            if entry is not None:
+                valid[self.key(source)] = entry
+        if not self.dirty and any(not os.path.exists(entry['path']) for entry in self.entries.values()):
+            # Модуль удален - образ перезапишется без его записи
+            self.dirty = True
+        return valid
+
+    def check(self, source: ModuleSource) -> Optional[dict]:
+        """Запись модуля, если исходники не менялись; иначе None"""
+        if source.kind == 'bundle':
+            return None
+        key = self.key(source)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            stamps = source.stamps()
+            if stamps == entry['stamps']:
+                return entry
+            # Файл трогали (git checkout, копирование), но содержимое могло не измениться
+            if source_hash(source.read_sources()) == entry['hash']:
+                entry['stamps'] = stamps
+                self.dirty = True
+                return entry
+        except OSError:
+            pass
+        del self.entries[key]
+        self.dirty = True
+        return None
+
+    def store(self, source: ModuleSource, stamps: Dict, sources: Dict[str, str], code,
+              commands, description: str):
+        self.entries[self.key(source)] = {
+            'path': source.identity[1],
+            'hash': source_hash(sources),
+            'stamps': stamps,
+            'code': code,
+            'commands': list(commands),
+            'description': description,
+        }
+        self.dirty = True
+
+    # endregion
+
+
+# Один образ на процесс: модули общие для всех аккаунтов
+module_image = ModuleImage()
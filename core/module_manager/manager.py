@@ -1,11 +1,45 @@
-import importlib.util
 import os
-import sys
 import inspect
 import ast
+import functools
+import itertools
+import time
 from pathlib import Path
 import logging
 from typing import Dict, List, Any, Optional
+from telethon import events
+from .registry import ModuleRegistry, shared_modules
+from .sources import ModuleSource, discover_modules, module_sources
+from .image import ModuleImage, module_image
+from ..tracing import span
+from ..breaker import current_module
+from ..fileio import disk
+
+# Поколения списка команд общие для всех менеджеров (мягкий перезапуск создает новый)
+_generations = itertools.count(1)
+
+
+def command_name(event, prefix: str = '.') -> Optional[str]:
+    """Возвращает команду из текста события (первое слово с префиксом)"""
+    text = getattr(event, 'raw_text', None) or getattr(event, 'text', None)
+    if not text or not text.startswith((prefix, '.')):
+        return None
+    return text.split(maxsplit=1)[0]
+
+
+def matched_command(match, event, prefix: str = '.') -> Optional[str]:
+    """Команда, которую распознал шаблон обработчика (pattern_match), с запасным разбором текста"""
+    matched = match.group(0).split(maxsplit=1) if hasattr(match, 'group') else []
+    if matched and matched[0].startswith((prefix, '.')):
+        return matched[0]
+    return command_name(event, prefix)
+
+
+def _located_at(path, paths: Dict[str, Path]) -> List[str]:
+    """Имена из paths (имя -> путь источника), указывающие на тот же файл, что и path"""
+    resolved = Path(path).resolve()
+    return [name for name, source_path in paths.items() if source_path.resolve() == resolved]
+
 
 class ModuleManager:
     def __init__(self, bot):
@@ -13,25 +47,82 @@ class ModuleManager:
         self.modules: Dict[str, Any] = {}
         self.logger = logging.getLogger("ModuleManager")
         self.all_commands = {}
+        # Меняется при каждом изменении списка команд (ключ для кешей меню)
+        self.generation = next(_generations)
+        self.defer_commands = False
         
     async def load_all_modules(self):
-        """Загружает все модули из папки modules"""
+        """Загружает все модули из папки modules: файлы .py, пакеты и zip-пакеты"""
         modules_path = Path("modules")
-        modules_path.mkdir(exist_ok=True)
+        await disk.makedirs(modules_path)
+        
+        # Модули, отключенные в настройках этого аккаунта
+        disabled = set(self.bot.config.get('disabled_modules', []))
         
-        for file in modules_path.glob("*.py"):
-            if file.name.startswith("_"):
+        sources, skipped = await disk.run('scan', discover_modules, modules_path)
+        for path, reason in skipped:
+            self.logger.warning(f"⚠️ {path} пропущен: {reason}")
+        
+        seen = set()
+        enabled = []
+        for source in sources:
+            if source.name in seen:
+                self.logger.warning(f"⚠️ Модуль {source.name} из {source.path} пропущен: имя уже занято")
+                continue
+            seen.add(source.name)
+            if source.name in disabled and source.name not in self.bot.system_modules:
+                self.logger.info(f"⏸️ Модуль {source.name} отключен для этого аккаунта")
                 continue
-            await self.load_module_from_file(file)
+            enabled.append(source)
+        
+        # Образ читается одним чтением, записи сверяются с диском одним заходом в пул
+        image = self.image()
+        cached = {}
+        if image is not None:
+            await disk.run('read', image.load)
+            cached = await disk.run('stat', image.validate, enabled)
+            hits, misses = image.hits, image.misses
+        
+        # Список команд пересобирается один раз после загрузки всех модулей
+        self.defer_commands = True
+        try:
+            for source in enabled:
+                await self.load_module(source, cached.get(ModuleImage.key(source)))
+        finally:
+            self.defer_commands = False
+            self.update_all_commands()
+        
+        if image is not None:
+            await self.save_image()
+            self.logger.info(f"🧊 Образ модулей: из образа {image.hits - hits}, скомпилировано {image.misses - misses}")
+    
+    def image(self) -> Optional[ModuleImage]:
+        """Образ модулей процесса, если он включен (module_image)"""
+        return module_image if self.bot.config.get('module_image', True) else None
+    
+    async def save_image(self):
+        image = self.image()
+        if image is not None and image.dirty:
+            try:
+                await disk.run('replace', image.save)
+            except OSError as e:
+                self.logger.warning(f"⚠️ Не удалось записать образ модулей: {e}")
     
     async def check_module_conflicts(self, file_path, system_commands: set) -> List[str]:
-        """Проверяет модуль на конфликты с системными командами"""
+        """Проверяет модуль (или все модули zip-пакета) на конфликты с системными командами"""
         conflicts = []
         try:
             file_path = Path(file_path)
             
-            # Извлекаем команды из кода файла
-            commands = self.extract_commands_from_code(file_path)
+            commands = []
+            for source in await disk.run('scan', module_sources, file_path):
+                if source.meta and 'commands' in source.meta:
+                    commands += source.meta['commands']
+                    continue
+                # Извлекаем команды из кода модуля
+                sources = await disk.run('read', source.read_sources)
+                with span('module.conflicts', module=source.name):
+                    commands += self.extract_commands_from_sources(source.location, sources)
             
             # Проверяем каждую команду на конфликт
             for command in commands:
@@ -46,35 +137,94 @@ class ModuleManager:
             return [f"Ошибка проверки: {e}"]
     
     async def load_module_from_file(self, file_path) -> bool:
-        """Загружает модуль из файла"""
+        """Загружает модуль из файла .py, папки пакета или все модули zip-пакета"""
         try:
-            # Преобразуем в Path если это строка
-            file_path = Path(file_path)
-            module_name = file_path.stem
+            sources = await disk.run('scan', module_sources, Path(file_path))
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка загрузки модуля {file_path}: {e}")
+            return False
+        results = [await self.load_module(source) for source in sources]
+        await self.save_image()
+        return bool(results) and all(results)
+
+    async def load_module(self, source: ModuleSource, cached: Optional[dict] = None) -> bool:
+        """Загружает один модуль из его источника (cached - проверенная запись образа)"""
+        with span('module.load', module=source.name):
+            return await self._load_module(source, cached)
+
+    async def _load_module(self, source: ModuleSource, cached: Optional[dict] = None) -> bool:
+        module = None
+        module_name = source.name
+        file_path = source.location
+        # Zip-пакеты в образ не входят: у них свой манифест и одно чтение архива
+        image = self.image() if source.kind != 'bundle' else None
+        try:
+            if image is not None and cached is None:
+                # Отдельная загрузка (.klm, URL): запись образа сверяется с диском
+                await disk.run('read', image.load)
+                if ModuleImage.key(source) in image.entries:
+                    cached = await disk.run('stat', image.check, source)
             
-            # Проверяем безопасность модуля (кроме системных модулей)
-            if module_name not in ['loader', 'system_utils', 'stats']:  # Белый список системных модулей
-                if not await self.check_module_safety(file_path):
-                    self.logger.warning(f"🚨 Модуль {module_name} не прошел проверку безопасности")
-                    return False
+            code = None
+            if cached is not None:
+                # Код и метаданные из образа: исходники не читаются, не проверяются и не разбираются
+                image.hits += 1
+                sources = main_source = stamps = None
+                manifest = {'commands': cached['commands'], 'description': cached['description']}
+                code = cached['code']
+            else:
+                # Отметки времени берутся до чтения: изменение во время чтения заметит следующий запуск
+                stamps = await disk.run('stat', source.stamps) if image is not None else None
+                # Исходники читаются один раз вне цикла событий, анализаторы работают с ними
+                sources = await disk.run('read', source.read_sources)
+                main_source = sources[source.main]
+                # Команды и описание из манифеста zip-пакета заменяют разбор исходников
+                manifest = source.meta or {}
+                
+                # Проверяем безопасность модуля (кроме системных модулей)
+                if module_name not in ['loader', 'system_utils', 'stats']:  # Белый список системных модулей
+                    with span('module.safety'):
+                        safe = await self.check_module_safety(file_path, "\n".join(sources.values()))
+                    if not safe:
+                        self.logger.warning(f"🚨 Модуль {module_name} не прошел проверку безопасности")
+                        return False
+                
+                if image is not None:
+                    code = await disk.run('compile', compile, main_source, str(source.origin), 'exec', dont_inherit=True)
             
-            spec = importlib.util.spec_from_file_location(module_name, file_path)
-            module = importlib.util.module_from_spec(spec)
-            sys.modules[module_name] = module
+            # Повторная загрузка заменяет прежнюю версию модуля этого аккаунта
+            if module_name in self.modules:
+                await self.unload_module(module_name)
             
             # Извлекаем команды ДО выполнения модуля
-            commands_before = self.extract_commands_from_code(file_path)
+            if 'commands' in manifest:
+                commands_before = list(manifest['commands'])
+            else:
+                with span('module.extract_commands'):
+                    commands_before = self.extract_commands_from_sources(file_path, sources)
             
-            spec.loader.exec_module(module)
+            # Код модуля общий для всех аккаунтов процесса, обработчики - свои у каждого
+            # Импорт модуля выполняется в цикле событий: его код регистрирует обработчики
+            version = await disk.run('stat', ModuleRegistry.version, source)
+            with span('module.exec'), disk.allow_blocking():
+                module = shared_modules.acquire(source, code, version)
             
             # Регистрируем модуль
             registered_commands = []
+            handlers = []
             if hasattr(module, "register"):
                 # Новая система с функцией register
-                await module.register(self.bot)
+                handlers_before = len(self.bot.client._event_builders)
+                with span('module.register'):
+                    await module.register(self.bot)
+                # Запоминаем обработчики модуля, чтобы снять их при выгрузке
+                # (только новые записи, без копирования всего списка обработчиков)
+                handlers = [(callback, event) for event, callback in self.bot.client._event_builders[handlers_before:]]
+                handlers = self.instrument_handlers(module_name, handlers)
                 self.logger.info(f"✅ Модуль {module_name} загружен (новая система)")
                 # Для новых модулей извлекаем команды из register
-                registered_commands = self.extract_commands_from_register(module)
+                registered_commands = list(manifest['commands']) if 'commands' in manifest \
+                    else self.extract_commands_from_register(module, main_source)
             else:
                 # Старая система - просто выполняем файл
                 self.logger.info(f"✅ Модуль {module_name} загружен (старая система)")
@@ -82,16 +232,22 @@ class ModuleManager:
                 registered_commands = commands_before
             
             # Получаем описание модуля
-            module_description = self.get_module_description(module, file_path)
+            module_description = manifest.get('description') or self.get_module_description(module, file_path, main_source)
             
             self.modules[module_name] = {
                 'module': module,
                 'path': file_path,
+                'source': source,
                 'loaded': True,
                 'commands': registered_commands,
-                'description': module_description
+                'description': module_description,
+                'handlers': handlers
             }
             
+            if image is not None and cached is None:
+                image.misses += 1
+                image.store(source, stamps, sources, code, registered_commands, module_description)
+            
             # Обновляем общий список команд
             self.update_all_commands()
             
@@ -99,10 +255,70 @@ class ModuleManager:
             return True
                 
         except Exception as e:
+            if module is not None:
+                shared_modules.release(module_name)
             self.logger.error(f"❌ Ошибка загрузки модуля {file_path}: {e}")
             return False
     
-    def get_module_description(self, module, file_path: Path) -> str:
+    def instrument_handlers(self, module_name: str, handlers: List[tuple]) -> List[tuple]:
+        """Заменяет обработчики модуля обертками с учетом статистики"""
+        client = self.bot.client
+        instrumented = []
+        for callback, event in handlers:
+            wrapped = self.instrument_handler(module_name, callback, event)
+            client.remove_event_handler(callback, event)
+            client.add_event_handler(wrapped, event)
+            instrumented.append((wrapped, event))
+        return instrumented
+    
+    def instrument_handler(self, module_name: str, callback, builder=None):
+        """Оборачивает обработчик: замеряет время выполнения команды и учитывает бюджет модуля"""
+        bot = self.bot
+        # Команду засчитываем, только если сработал собственный шаблон обработчика:
+        # обработчики без шаблона (все сообщения, incoming) получают и чужие команды
+        counts_commands = getattr(builder, 'pattern', None) is not None
+        span_name = f"handler {module_name}:{callback.__name__}"
+        # Системные обработчики предохранитель не отключает
+        breakers = getattr(bot, 'breakers', None)
+        if module_name == 'system' or module_name in getattr(bot, 'system_modules', ()):
+            breakers = None
+        
+        @functools.wraps(callback)
+        async def handler(event):
+            if breakers is not None and not breakers.allow(module_name):
+                return
+            # Событие общее для всех обработчиков, pattern_match перезаписывает следующий шаблон
+            match = getattr(event, 'pattern_match', None) if counts_commands else None
+            token = current_module.set(module_name)
+            started = time.perf_counter()
+            failed = False
+            try:
+                with span(span_name):
+                    return await callback(event)
+            except events.StopPropagation:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                current_module.reset(token)
+                if breakers is not None:
+                    breakers.record(module_name, duration, failed)
+                if match is not None and getattr(bot, 'stats', None) is not None:
+                    command = matched_command(match, event, bot.config.get('command_prefix', '.'))
+                    if command:
+                        bot.stats.record(module_name, command, duration, failed)
+        
+        return handler
+    
+    @staticmethod
+    def read_source(file_path: Path) -> str:
+        """Синхронное чтение исходника (для вызовов вне load_module_from_file)"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    def get_module_description(self, module, file_path: Path, source: Optional[str] = None) -> str:
         """Получает описание модуля из docstring или создает автоматическое"""
         # Пробуем получить docstring модуля
         module_doc = getattr(module, '__doc__', '')
@@ -115,8 +331,7 @@ class ModuleManager:
         
         # Если docstring нет, пытаемся извлечь из файла
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = source if source is not None else self.read_source(file_path)
             
             tree = ast.parse(content)
             for node in ast.walk(tree):
@@ -136,12 +351,11 @@ class ModuleManager:
         # Если ничего не нашли, возвращаем стандартное описание
         return "Модуль без описания"
     
-    def extract_commands_from_code(self, file_path: Path) -> List[str]:
+    def extract_commands_from_code(self, file_path: Path, source: Optional[str] = None) -> List[str]:
         """Извлекает команды из кода файла (для старых модулей)"""
         commands = []
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = source if source is not None else self.read_source(file_path)
             
             # Парсим AST для поиска паттернов команд
             tree = ast.parse(content)
@@ -171,15 +385,32 @@ class ModuleManager:
         
         return commands
     
-    def extract_commands_from_register(self, module) -> List[str]:
+    def extract_commands_from_sources(self, file_path: Path, sources: Dict[str, str]) -> List[str]:
+        """Команды из всех исходников модуля (файлы пакета разбираются по отдельности)"""
+        commands = []
+        for source in sources.values():
+            commands += self.extract_commands_from_code(file_path, source)
+        return commands
+    
+    def extract_commands_from_register(self, module, source: Optional[str] = None) -> List[str]:
         """Извлекает команды из функции register (для новых модулей)"""
         commands = []
         try:
-            register_func = module.register
-            source = inspect.getsource(register_func)
-            
-            # Парсим AST функции register
-            tree = ast.parse(source)
+            if source is not None:
+                # Функция register из уже прочитанного исходника, без повторного чтения файла
+                tree = next(
+                    (node for node in ast.parse(source).body
+                     if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'register'),
+                    None
+                )
+                if tree is None:
+                    if module is None:
+                        return commands
+                    # register импортирована из подмодуля пакета
+                    tree = ast.parse(inspect.getsource(module.register))
+            else:
+                # Парсим AST функции register
+                tree = ast.parse(inspect.getsource(module.register))
             
             for node in ast.walk(tree):
                 if isinstance(node, ast.Call):
@@ -213,11 +444,10 @@ class ModuleManager:
         
         return commands
     
-    async def check_module_safety(self, file_path: Path) -> bool:
+    async def check_module_safety(self, file_path: Path, source: Optional[str] = None) -> bool:
         """Проверяет модуль на безопасность - УЛУЧШЕННАЯ ВЕРСИЯ"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = source if source is not None else await disk.read_text(file_path)
             
             # Белый список системных модулей
             module_name = file_path.stem
@@ -258,12 +488,23 @@ class ModuleManager:
                 if hasattr(module, 'unregister'):
                     await module.unregister(self.bot)
                 
-                # Удаляем из системных модулей
-                if module_name in sys.modules:
-                    del sys.modules[module_name]
+                # Снимаем обработчики, зарегистрированные модулем
+                for callback, event in self.modules[module_name].get('handlers', []):
+                    self.bot.client.remove_event_handler(callback, event)
+                
+                # Модуль удаляется из процесса, когда его не использует ни один аккаунт
+                shared_modules.release(module_name)
                 
                 del self.modules[module_name]
                 
+                # Кешированные результаты модуля больше не нужны
+                cache = getattr(self.bot, 'cache', None)
+                if cache is not None:
+                    cache.clear_module(module_name)
+                breakers = getattr(self.bot, 'breakers', None)
+                if breakers is not None:
+                    breakers.forget(module_name)
+                
                 # Обновляем список команд
                 self.update_all_commands()
                 
@@ -284,6 +525,12 @@ class ModuleManager:
             return self.modules[module_name].get('commands', [])
         return []
     
+    async def modules_from(self, path) -> List[str]:
+        """Загруженные модули из файла, папки пакета или zip-пакета path"""
+        paths = {name: info['source'].path for name, info in self.modules.items() if info.get('source') is not None}
+        # resolve() обращается к файловой системе (ссылки, относительные пути) - вне цикла событий
+        return await disk.run('stat', _located_at, path, paths)
+    
     def get_all_commands(self) -> Dict[str, Any]:
         """Возвращает все команды всех модулей"""
         return self.all_commands
@@ -296,6 +543,9 @@ class ModuleManager:
     
     def update_all_commands(self):
         """Обновляет общий список всех команд"""
+        if self.defer_commands:
+            return
+        self.generation = next(_generations)
         self.all_commands = {}
         for module_name, module_info in self.modules.items():
             if module_info['loaded']:
@@ -0,0 +1,108 @@
+"""
+Общий для процесса реестр импортированных модулей Kbot 3.0
+Код модуля выполняется один раз, а каждый аккаунт получает
+свои обработчики через module.register(bot)
+"""
+
+import importlib
+import importlib.util
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from .sources import ModuleSource
+
+
+class ModuleRegistry:
+    """Импортированные модули со счетчиком ссылок от менеджеров аккаунтов"""
+
+    def __init__(self):
+        self.logger = logging.getLogger("ModuleRegistry")
+        # имя -> {'module', 'path', 'mtime', 'refs'}
+        self.entries: Dict[str, dict] = {}
+
+    @staticmethod
+    def version(source: ModuleSource) -> Tuple[Tuple[str, str], int]:
+        """Путь и время изменения модуля (синхронно, для пула ввода-вывода)"""
+        return source.identity, source.mtime()
+
+    def acquire(self, source: Union[ModuleSource, Path], code=None,
+                version: Optional[Tuple[Tuple[str, str], int]] = None):
+        """Возвращает модуль, импортируя его только если он еще не загружен или изменился
+
+        code - готовый объект кода из образа модулей: файл не читается и не компилируется.
+        version - результат version(source), полученный заранее вне цикла событий.
+        """
+        if not isinstance(source, ModuleSource):
+            source = ModuleSource(Path(source).stem, 'file', Path(source))
+        module_name = source.name
+        identity, mtime = version if version is not None else self.version(source)
+        entry = self.entries.get(module_name)
+
+        if entry is not None and entry['path'] == identity and entry['mtime'] == mtime:
+            entry['refs'] += 1
+            self.logger.debug(f"♻️ Модуль {module_name} уже импортирован, ссылок: {entry['refs']}")
+            return entry['module']
+
+        if entry is not None:
+            # Новая версия: искатели путей могли запомнить старое содержимое папки или архива
+            importlib.invalidate_caches()
+        spec = source.spec()
+        if spec is None:
+            raise ImportError(f"Модуль {module_name} не найден в {source.path}")
+        module = importlib.util.module_from_spec(spec)
+        # Подмодули прежней версии пакета импортируются заново (у простых модулей их нет)
+        packaged = spec.submodule_search_locations is not None or (
+            entry is not None and hasattr(entry['module'], '__path__'))
+        stale = self._pop_submodules(module_name) if packaged else {}
+        sys.modules[module_name] = module
+        try:
+            if code is not None:
+                exec(code, module.__dict__)
+            else:
+                spec.loader.exec_module(module)
+        except BaseException:
+            if packaged:
+                self._pop_submodules(module_name)
+                sys.modules.update(stale)
+            if entry is not None:
+                sys.modules[module_name] = entry['module']
+            else:
+                sys.modules.pop(module_name, None)
+            raise
+
+        # Аккаунты, загрузившие старую версию, держат ее до своей перезагрузки
+        refs = entry['refs'] + 1 if entry is not None else 1
+        self.entries[module_name] = {
+            'module': module,
+            'path': identity,
+            'mtime': mtime,
+            'refs': refs
+        }
+        return module
+
+    def release(self, module_name: str):
+        """Отпускает ссылку; последний аккаунт удаляет модуль из процесса"""
+        entry = self.entries.get(module_name)
+        if entry is None:
+            sys.modules.pop(module_name, None)
+            return
+
+        entry['refs'] -= 1
+        if entry['refs'] <= 0:
+            del self.entries[module_name]
+            if sys.modules.get(module_name) is entry['module']:
+                del sys.modules[module_name]
+                if hasattr(entry['module'], '__path__'):
+                    self._pop_submodules(module_name)
+
+    @staticmethod
+    def _pop_submodules(module_name: str) -> Dict[str, object]:
+        """Убирает из sys.modules подмодули пакета (name.*) и возвращает их"""
+        prefix = module_name + '.'
+        return {name: sys.modules.pop(name) for name in [name for name in sys.modules if name.startswith(prefix)]}
+
+
+# Один реестр на процесс: его разделяют все аккаунты
+shared_modules = ModuleRegistry()
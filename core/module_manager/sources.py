@@ -0,0 +1,185 @@
+"""
+Источники модулей Kbot 3.0
+Модуль может быть одним файлом (modules/name.py), пакетом
+(modules/name/__init__.py) или входить в zip-пакет (modules/pack.kbz).
+Zip-пакет импортируется через zipimport и несет манифест kbot.json
+с заранее посчитанными командами и описаниями модулей
+"""
+
+import importlib.util
+import json
+import os
+import zipfile
+import zipimport
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BUNDLE_SUFFIXES = ('.kbz', '.zip')
+MANIFEST_NAME = 'kbot.json'
+MANIFEST_FORMAT = 1
+
+
+class ModuleSource:
+    """Где лежит модуль и как его импортировать"""
+
+    def __init__(self, name: str, kind: str, path: Path, member: Optional[str] = None,
+                 meta: Optional[Dict] = None):
+        self.name = name
+        # 'file', 'package' или 'bundle'
+        self.kind = kind
+        # Файл модуля, папка пакета или архив
+        self.path = Path(path)
+        # Главный файл модуля внутри архива: name.py или name/__init__.py
+        self.member = member
+        # Команды и описание из манифеста zip-пакета
+        self.meta = meta
+
+    def __repr__(self):
+        return f"ModuleSource({self.name!r}, {self.kind!r}, {str(self.path)!r})"
+
+    @property
+    def location(self) -> Path:
+        """Путь для сообщений и проверок; его stem всегда совпадает с именем модуля"""
+        if self.kind == 'bundle':
+            return self.path / (self.name if self.member.endswith('/__init__.py') else self.member)
+        return self.path
+
+    @property
+    def main(self) -> str:
+        """Ключ главного исходника в read_sources()"""
+        if self.kind == 'file':
+            return self.path.name
+        if self.kind == 'package':
+            return '__init__.py'
+        return self.member
+
+    @property
+    def identity(self) -> Tuple[str, str]:
+        return self.kind, str(self.path.resolve())
+
+    @property
+    def origin(self) -> Optional[Path]:
+        """Главный файл модуля на диске (для zip-пакета - нет)"""
+        if self.kind == 'file':
+            return self.path
+        if self.kind == 'package':
+            return self.path / '__init__.py'
+        return None
+
+    def stamps(self) -> Dict[str, Tuple[int, int]]:
+        """Время изменения и размер каждого исходника: относительный путь -> (mtime_ns, size)"""
+        if self.kind == 'file':
+            files = [self.path]
+        elif self.kind == 'package':
+            files = [file for file in sorted(self.path.rglob('*.py')) if '__pycache__' not in file.parts]
+        else:
+            files = [self.path]
+        stamps = {}
+        for file in files:
+            stat = os.stat(file)
+            key = file.name if self.kind != 'package' else file.relative_to(self.path).as_posix()
+            stamps[key] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def read_sources(self) -> Dict[str, str]:
+        """Все исходники модуля: относительный путь -> текст (синхронно, для пула ввода-вывода)"""
+        if self.kind == 'file':
+            return {self.path.name: self.path.read_text(encoding='utf-8')}
+        if self.kind == 'package':
+            return {
+                file.relative_to(self.path).as_posix(): file.read_text(encoding='utf-8')
+                for file in sorted(self.path.rglob('*.py')) if '__pycache__' not in file.parts
+            }
+        prefix = f"{self.name}/" if self.member.endswith('/__init__.py') else self.member
+        with zipfile.ZipFile(self.path) as archive:
+            return {
+                name: archive.read(name).decode('utf-8')
+                for name in archive.namelist() if name.startswith(prefix) and name.endswith('.py')
+            }
+
+    def mtime(self) -> int:
+        """Время изменения; для пакета - самого свежего файла внутри"""
+        if self.kind == 'package':
+            return max(
+                (os.stat(file).st_mtime_ns for file in self.path.rglob('*.py') if '__pycache__' not in file.parts),
+                default=os.stat(self.path).st_mtime_ns
+            )
+        return os.stat(self.path).st_mtime_ns
+
+    def spec(self):
+        if self.kind == 'file':
+            return importlib.util.spec_from_file_location(self.name, self.path)
+        if self.kind == 'package':
+            return importlib.util.spec_from_file_location(
+                self.name, self.path / '__init__.py', submodule_search_locations=[str(self.path)]
+            )
+        importer = zipimport.zipimporter(str(self.path))
+        # Архив мог быть заменен новой версией - перечитываем его оглавление
+        importer.invalidate_caches()
+        return importer.find_spec(self.name)
+
+
+def read_manifest(archive: zipfile.ZipFile) -> Dict:
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME).decode('utf-8'))
+    except KeyError:
+        raise ValueError(f"В архиве нет {MANIFEST_NAME}")
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('modules'), list):
+        raise ValueError(f"Неверный {MANIFEST_NAME}: нужен список modules")
+    if manifest.get('format', MANIFEST_FORMAT) > MANIFEST_FORMAT:
+        raise ValueError(f"Формат пакета {manifest['format']} новее поддерживаемого {MANIFEST_FORMAT}")
+    return manifest
+
+
+def bundle_sources(path: Path) -> List[ModuleSource]:
+    """Модули zip-пакета по его манифесту"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = read_manifest(archive)
+        names = set(archive.namelist())
+
+    sources = []
+    for entry in manifest['modules']:
+        name = entry.get('name') if isinstance(entry, dict) else None
+        if not name or not name.isidentifier():
+            raise ValueError(f"Неверное имя модуля в {MANIFEST_NAME}: {name!r}")
+        if f"{name}/__init__.py" in names:
+            member = f"{name}/__init__.py"
+        elif f"{name}.py" in names:
+            member = f"{name}.py"
+        else:
+            raise ValueError(f"Модуль {name} указан в {MANIFEST_NAME}, но его нет в архиве")
+        meta = {key: entry[key] for key in ('commands', 'description') if key in entry}
+        sources.append(ModuleSource(name, 'bundle', path, member, meta))
+    return sources
+
+
+def module_sources(path: Path) -> List[ModuleSource]:
+    """Модули по пути: файл .py, папка пакета или zip-пакет (может дать несколько)"""
+    path = Path(path)
+    if path.is_dir():
+        if not (path / '__init__.py').exists():
+            raise ValueError(f"{path} не пакет: нет __init__.py")
+        return [ModuleSource(path.name, 'package', path)]
+    if path.suffix in BUNDLE_SUFFIXES:
+        return bundle_sources(path)
+    if path.suffix == '.py':
+        return [ModuleSource(path.stem, 'file', path)]
+    raise ValueError(f"Неизвестный формат модуля: {path.name}")
+
+
+def discover_modules(modules_path: Path) -> Tuple[List[ModuleSource], List[Tuple[Path, str]]]:
+    """Все модули папки и пропущенные записи с причиной (папка без __init__.py, битый архив)"""
+    sources: List[ModuleSource] = []
+    skipped: List[Tuple[Path, str]] = []
+    for entry in sorted(Path(modules_path).iterdir()):
+        if entry.name.startswith(('_', '.')):
+            continue
+        if not entry.is_dir() and entry.suffix not in BUNDLE_SUFFIXES + ('.py',):
+            continue
+        try:
+            sources.extend(module_sources(entry))
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            skipped.append((entry, str(e)))
+    # Сначала файлы и пакеты, потом zip-пакеты: при совпадении имен побеждает распакованный модуль
+    sources.sort(key=lambda source: source.kind == 'bundle')
+    return sources, skipped
@@ -0,0 +1,198 @@
+"""
+Вывод больших результатов команд Kbot 3.0
+Размер считается по тексту после разметки (как его считает Telegram).
+Короткий вывод уходит одним сообщением, длинный - страницами, которые
+отрисовываются только при перелистывании, очень длинный - файлом из памяти
+"""
+
+import io
+import logging
+import math
+from typing import Any, Callable, List, Optional, Sequence
+
+from telethon import helpers
+from telethon.extensions import markdown
+
+# Лимит Telegram на длину сообщения (в UTF-16 единицах)
+MESSAGE_LIMIT = 4096
+# Запас под заголовок, подпись и строку навигации
+PAGE_LIMIT = 3500
+# Сколько секунд страницы доступны для перелистывания
+PAGER_TTL = 30 * 60
+
+
+def measure(text: str) -> int:
+    """Длина текста после разбора markdown, как ее считает Telegram"""
+    plain, _ = markdown.parse(text)
+    return len(helpers.add_surrogate(plain))
+
+
+class Pager:
+    """Страницы вывода; границы страниц находятся по мере перелистывания"""
+
+    def __init__(self, header: str, items: Sequence, render: Callable[[Any], str] = str,
+                 footer: str = '', code: bool = False, limit: int = PAGE_LIMIT):
+        self.header = header
+        self.items = items
+        self.render = render
+        self.footer = footer
+        self.code = code
+        self.limit = limit
+        # Индексы первых элементов известных страниц; последний - начало следующей
+        self._starts: List[int] = [0]
+        self.chat_id: Optional[int] = None
+        self.message_id: Optional[int] = None
+        self.current = 0
+
+    @property
+    def complete(self) -> bool:
+        return self._starts[-1] >= len(self.items)
+
+    @property
+    def known_pages(self) -> int:
+        return len(self._starts) - 1 if self.complete else len(self._starts)
+
+    def estimate_pages(self) -> int:
+        """Оценка числа страниц по размеру первой (без отрисовки остальных)"""
+        self._find(1)
+        if self.complete:
+            return self.known_pages
+        return math.ceil(len(self.items) / max(1, self._starts[1]))
+
+    def _find(self, page: int):
+        """Находит границы страниц до page включительно"""
+        budget = self.limit - measure(self.header) - measure(self.footer)
+        while len(self._starts) <= page and not self.complete:
+            start = self._starts[-1]
+            index, used = start, 0
+            while index < len(self.items):
+                size = measure(self.render(self.items[index])) + 1
+                if used + size > budget and index > start:
+                    break
+                used += size
+                index += 1
+            self._starts.append(index)
+
+    def page(self, number: int) -> Optional[str]:
+        """Текст страницы number (с нуля) или None, если ее нет"""
+        if number < 0:
+            return None
+        self._find(number + 1)
+        if number >= len(self._starts) - 1:
+            return None
+        lines = [self.render(item) for item in self.items[self._starts[number]:self._starts[number + 1]]]
+        lines = [self._clip(line) for line in lines]
+        body = "\n".join(lines)
+        if self.code:
+            body = f"```\n{body}\n```"
+        total = str(self.known_pages) if self.complete else '?'
+        navigation = f"📄 Страница {number + 1}/{total} · `.next` `.prev` `.page N`"
+        parts = [part for part in (self.header, body, self.footer, navigation) if part]
+        return "\n\n".join(parts)
+
+    def _clip(self, line: str) -> str:
+        # Одна строка длиннее страницы обрезается, иначе страница не отправится
+        if measure(line) <= self.limit:
+            return line
+        plain, _ = markdown.parse(line)
+        return plain[:self.limit - 200] + '…'
+
+    def document(self) -> io.BytesIO:
+        """Весь вывод простым текстом для отправки файлом"""
+        buffer = io.BytesIO()
+        for part in (self.header, *map(self.render, self.items), self.footer):
+            if part:
+                plain, _ = markdown.parse(part)
+                buffer.write(plain.encode('utf-8') + b'\n')
+        buffer.seek(0)
+        return buffer
+
+
+class OutputService:
+    """Отправка результатов команд с учетом лимита Telegram (bot.output)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("OutputService")
+        # (чат, сообщение) и чат -> Pager; старые страницы вытесняются
+        self.pagers = bot.cache.namespace('core.output', max_items=64, default_ttl=PAGER_TTL)
+
+    async def send(self, event, text: str, code: bool = False, reply: bool = False,
+                   file_name: str = 'output.txt', header: str = ''):
+        """Отправляет текст: одним сообщением, страницами по строкам или файлом"""
+        if not code and not header and measure(text) <= MESSAGE_LIMIT:
+            await self._deliver(event, text, reply)
+            return
+        await self.send_items(event, header, text.split('\n'), code=code, reply=reply, file_name=file_name)
+
+    async def send_items(self, event, header: str, items: Sequence, render: Callable[[Any], str] = str,
+                         footer: str = '', code: bool = False, reply: bool = False,
+                         file_name: str = 'output.txt'):
+        """Отправляет список элементов; render вызывается только для показываемых страниц"""
+        pager = Pager(header, items, render, footer, code)
+        pages = pager.estimate_pages()
+        if pages <= 1:
+            body = "\n".join(pager.render(item) for item in items)
+            if code:
+                body = f"```\n{body}\n```"
+            await self._deliver(event, "\n\n".join(part for part in (header, body, footer) if part), reply)
+            return
+
+        if pages > self.bot.config.get('output_max_pages', 10):
+            document = pager.document()
+            document.name = file_name
+            caption = f"{header}\n\n📎 Вывод слишком большой ({len(items)} строк), полная версия в файле" if header \
+                else f"📎 Вывод слишком большой ({len(items)} строк), полная версия в файле"
+            await self.bot.client.send_file(event.chat_id, document, caption=caption[:1024],
+                                            reply_to=event.id if reply else event.reply_to_msg_id)
+            if not reply and self.bot.config.get('edit_mode', True) and event.out:
+                await event.delete()
+            return
+
+        message = await self._deliver(event, pager.page(0), reply)
+        if message is not None:
+            pager.chat_id, pager.message_id = message.chat_id, message.id
+            self.pagers.set((message.chat_id, message.id), pager)
+            self.pagers.set(message.chat_id, pager)
+
+    async def _deliver(self, event, text: str, reply: bool):
+        """Как safe_reply, но возвращает отправленное сообщение"""
+        try:
+            if not reply and self.bot.config.get('edit_mode', True) and event.out and event.text and event.text.startswith(self.bot.config.get('command_prefix', '.')):
+                return await event.edit(text)
+        except Exception:
+            pass
+        try:
+            return await event.reply(text)
+        except Exception as e:
+            self.logger.error(f"❌ Не удалось отправить сообщение: {e}")
+            return None
+
+    # region Перелистывание
+
+    def find_pager(self, event) -> Optional[Pager]:
+        if event.is_reply:
+            pager = self.pagers.get((event.chat_id, event.reply_to_msg_id))
+            if pager is not None:
+                return pager
+        return self.pagers.get(event.chat_id)
+
+    async def turn(self, event, page: Optional[int] = None, step: int = 0):
+        """Показывает другую страницу в том же сообщении"""
+        pager = self.find_pager(event)
+        if pager is None:
+            await self.bot.safe_reply(event, "❌ Нет вывода для перелистывания (страницы хранятся 30 минут)")
+            return
+        number = page if page is not None else pager.current + step
+        text = pager.page(number)
+        if text is None:
+            await self.bot.safe_reply(event, f"❌ Страницы {number + 1} нет")
+            return
+        try:
+            await self.bot.client.edit_message(pager.chat_id, pager.message_id, text)
+            pager.current = number
+            await event.delete()
+        except Exception as e:
+            await self.bot.safe_reply(event, f"❌ Не удалось перелистнуть: {str(e)}")
+
+    # endregion
@@ -0,0 +1,190 @@
+"""
+Сэмплирующий профилировщик Kbot 3.0
+Фоновый поток с заданной частотой снимает стек потока цикла событий,
+определяет текущую задачу asyncio и обработчик/модуль, которому принадлежит
+стек, и собирает результат в формате collapsed stacks (flamegraph.pl, speedscope)
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INTERVAL = 0.01
+MAX_DEPTH = 64
+# Кадры ожидания цикла событий: такие сэмплы считаются простоем
+IDLE_FUNCTIONS = {('selectors.py', 'select'), ('base_events.py', '_run_once')}
+
+
+def frame_label(code) -> str:
+    """Короткое имя кадра: функция (путь от корня проекта или пакета:строка)"""
+    path = code.co_filename
+    if path.startswith(PROJECT_ROOT + os.sep):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    elif '-packages' + os.sep in path:
+        path = path.split('-packages' + os.sep, 1)[1]
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class ProfileResult:
+    """Сэмплы одного замера и их сводки"""
+
+    def __init__(self, seconds: float, interval: float):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        # Свернутый стек -> число сэмплов
+        self.stacks: Counter = Counter()
+        # Функция -> сэмплов на вершине стека / в стеке
+        self.own: Counter = Counter()
+        self.total: Counter = Counter()
+        # Обработчик ("модуль:функция") -> сэмплов, корутина задачи asyncio -> сэмплов
+        self.handlers: Counter = Counter()
+        self.tasks: Counter = Counter()
+
+    @property
+    def busy(self) -> int:
+        return self.samples - self.idle
+
+    def collapsed(self) -> str:
+        """Формат collapsed stacks: "корень;...;вершина количество" на строку"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def summary(self, limit: int = 10) -> str:
+        def share(count: int) -> str:
+            return f"{count / self.samples * 100:.1f}%" if self.samples else "0%"
+
+        lines = [
+            "🔥 **Kbot 3.0 - Профиль**",
+            "",
+            f"• Длительность: {self.seconds:.0f}с, сэмплов: {self.samples} (каждые {self.interval * 1000:.0f}ms)",
+            f"• Цикл событий занят: {share(self.busy)}, простой: {share(self.idle)}",
+        ]
+        if self.handlers:
+            lines += ["", "📦 **Обработчики:**"]
+            lines += [f"• `{name}` - {share(count)}" for name, count in self.handlers.most_common(limit)]
+        if self.own:
+            lines += ["", "⏱️ **Собственное время:**"]
+            lines += [f"• `{name}` - {share(count)}" for name, count in self.own.most_common(limit)]
+        if self.total:
+            lines += ["", "📚 **Суммарное время:**"]
+            lines += [f"• `{name}` - {share(count)}" for name, count in self.total.most_common(limit)]
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Профилирование работающего бота без перезапуска"""
+
+    def __init__(self, bot, interval: float = DEFAULT_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self.logger = logging.getLogger("SamplingProfiler")
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def handler_codes(self) -> Dict[object, str]:
+        """Код исходных функций обработчиков -> "модуль:функция" """
+        codes = {}
+        sources = [('system', callback) for callback, _ in getattr(self.bot, '_system_handlers', [])]
+        for module_name, info in self.bot.module_manager.modules.items():
+            sources += [(module_name, callback) for callback, _ in info.get('handlers', [])]
+        for module_name, callback in sources:
+            original = getattr(callback, '__wrapped__', callback)
+            code = getattr(original, '__code__', None)
+            if code is not None:
+                codes[code] = f"{module_name}:{original.__name__}"
+        return codes
+
+    async def profile(self, seconds: float) -> ProfileResult:
+        """Собирает сэмплы потока цикла событий в течение seconds секунд"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            result = ProfileResult(seconds, self.interval)
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), loop, self.handler_codes(), result, stop),
+                name='kbot-profiler', daemon=True
+            )
+            self.logger.info(f"🔥 Профилирование на {seconds:.0f}с")
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await loop.run_in_executor(None, sampler.join)
+            return result
+
+    def _sample(self, thread_id: int, loop, handlers: Dict[object, str], result: ProfileResult,
+                stop: threading.Event):
+        current_tasks = getattr(asyncio.tasks, '_current_tasks', {})
+        labels: Dict[object, str] = {}
+        next_tick = time.perf_counter()
+        while not stop.is_set():
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            task = current_tasks.get(loop)
+            self._record(frame, task, handlers, labels, result)
+            next_tick += self.interval
+            # Если поток отстал, не пытаемся догнать пачкой сэмплов
+            delay = next_tick - time.perf_counter()
+            if delay <= 0:
+                next_tick = time.perf_counter()
+                delay = self.interval
+            stop.wait(delay)
+
+    @staticmethod
+    def _record(frame, task, handlers: Dict[object, str], labels: Dict[object, str], result: ProfileResult):
+        codes: List[object] = []
+        while frame is not None and len(codes) < MAX_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        result.samples += 1
+        # Обвязку цикла событий (run_forever -> _run_once -> Handle._run) не показываем
+        for index in range(len(codes) - 1, -1, -1):
+            if codes[index].co_name == '_run' and os.path.basename(codes[index].co_filename) == 'events.py':
+                codes = codes[index + 1:] or codes
+                break
+
+        top = codes[-1] if codes else None
+        if task is None and top is not None and (os.path.basename(top.co_filename), top.co_name) in IDLE_FUNCTIONS:
+            result.idle += 1
+            return
+
+        handler: Optional[str] = None
+        names: List[str] = []
+        for code in codes:
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = frame_label(code)
+            names.append(label)
+            if handler is None and code in handlers:
+                handler = handlers[code]
+
+        root: Tuple[str, ...] = (handler or 'core',)
+        if task is not None:
+            # Имя корутины, а не задачи: у каждого обновления Telethon своя Task-N
+            coro = task.get_coro()
+            task_name = getattr(coro, '__qualname__', None) or task.get_name()
+            result.tasks[task_name] += 1
+            root += (f"task:{task_name}",)
+        result.stacks[";".join(root + tuple(names))] += 1
+        if handler:
+            result.handlers[handler] += 1
+        if names:
+            result.own[names[-1]] += 1
+        for name in set(names):
+            result.total[name] += 1
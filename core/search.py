@@ -0,0 +1,348 @@
+"""
+Локальный поиск по сообщениям Kbot 3.0
+Входящие и исходящие сообщения выбранных чатов (search_chats) попадают
+в полнотекстовый индекс SQLite FTS5 в базе бота. Записи копятся в памяти
+и уходят в поток базы пачками, старые сообщения удаляются по сроку
+хранения и общему лимиту. История чата добавляется фоновой догрузкой
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telethon import events, utils
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search__messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender_id INTEGER,
+    date INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (chat_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS search__messages_date ON search__messages (date);
+CREATE VIRTUAL TABLE IF NOT EXISTS search__fts USING fts5(
+    text, content='search__messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS search__messages_ai AFTER INSERT ON search__messages BEGIN
+    INSERT INTO search__fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS search__messages_ad AFTER DELETE ON search__messages BEGIN
+    INSERT INTO search__fts (search__fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS search__messages_au AFTER UPDATE OF text ON search__messages BEGIN
+    INSERT INTO search__fts (search__fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO search__fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# Повторная запись того же сообщения (догрузка, правка) меняет только текст
+UPSERT_SQL = (
+    "INSERT INTO search__messages (chat_id, message_id, sender_id, date, text) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (chat_id, message_id) DO UPDATE SET text = excluded.text WHERE text != excluded.text"
+)
+
+SEARCH_SQL = (
+    "SELECT m.chat_id, m.message_id, m.date, snippet(search__fts, 0, char(2), char(3), '…', 16) "
+    "FROM search__fts JOIN search__messages m ON m.id = search__fts.rowid "
+    "WHERE search__fts MATCH ?{chat} ORDER BY rank LIMIT ?"
+)
+
+# Идентификаторы каналов и супергрупп: -100xxxxxxxxxx
+CHANNEL_OFFSET = -10 ** 12
+
+MARKDOWN_RE = re.compile(r'[*_`\[\]~|]')
+WORD_RE = re.compile(r'\w+')
+
+
+def build_query(text: str) -> str:
+    """Запрос FTS5 из пользовательского текста: все слова, каждое по префиксу"""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(text))
+
+
+def message_link(chat_id: int, message_id: int) -> str:
+    """Ссылка на сообщение: t.me/c для каналов и супергрупп, tg://openmessage для остальных"""
+    if chat_id <= CHANNEL_OFFSET:
+        return f"https://t.me/c/{CHANNEL_OFFSET - chat_id}/{message_id}"
+    if chat_id > 0:
+        return f"tg://openmessage?user_id={chat_id}&message_id={message_id}"
+    return f"tg://openmessage?chat_id={-chat_id}&message_id={message_id}"
+
+
+def plain(text: str) -> str:
+    """Текст без символов разметки и переводов строк"""
+    return MARKDOWN_RE.sub('', text.replace('\n', ' '))
+
+
+def format_snippet(snippet: str) -> str:
+    """Фрагмент с найденными словами жирным; разметка из самого сообщения убирается"""
+    return plain(snippet).replace('\x02', '**').replace('\x03', '**')
+
+
+class MessageIndex:
+    """Полнотекстовый индекс сообщений выбранных чатов (bot.search)"""
+
+    def __init__(self, bot, flush_interval: float = 1.0, batch_size: int = 500,
+                 prune_interval: float = 3600.0):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.prune_interval = prune_interval
+        self.logger = logging.getLogger("MessageIndex")
+        # (чат, сообщение) -> строка для UPSERT_SQL; повторная правка заменяет запись в очереди
+        self._pending: Dict[Tuple[int, int], tuple] = {}
+        self._handlers: List[tuple] = []
+        self._ready = False
+        self._tasks: List[asyncio.Task] = []
+        # Чат -> задача догрузки истории
+        self.backfills: Dict[int, asyncio.Task] = {}
+        self.chats = set(bot.config.get('search_chats', []) or [])
+        # Названия чатов для результатов поиска
+        self.titles: Dict[int, str] = {}
+        self.indexed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.bot.config.get('search_index', False)
+
+    # region Запуск
+
+    async def start(self):
+        """Создает таблицы индекса и запускает фоновые сохранение и очистку"""
+        db = getattr(self.bot, 'db', None)
+        if db is None or self._ready or not self.enabled:
+            return
+        await db.run(lambda connection: connection.executescript(SCHEMA))
+        titles = await db.namespace('search').get('titles', {})
+        self.titles = {int(chat_id): title for chat_id, title in titles.items()}
+        self._ready = True
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._prune_loop())]
+
+    async def stop(self):
+        """Дописывает накопившиеся сообщения при остановке бота"""
+        for task in [*self._tasks, *self.backfills.values()]:
+            task.cancel()
+        self._tasks = []
+        self.backfills.clear()
+        self.flush()
+
+    def register(self, client):
+        """Подписывается на сообщения; вызывается до фильтра безопасности, чтобы видеть входящие"""
+        if not self.enabled:
+            return
+        self._handlers = [
+            (self.on_message, events.NewMessage()),
+            (self.on_message, events.MessageEdited()),
+            (self.on_deleted, events.MessageDeleted()),
+        ]
+        for callback, event in self._handlers:
+            client.add_event_handler(callback, event)
+
+    def unregister(self, client):
+        for callback, event in self._handlers:
+            client.remove_event_handler(callback, event)
+        self._handlers = []
+
+    async def configure(self, changes):
+        """Применяет измененные search_chats и search_index"""
+        if 'search_chats' in changes:
+            self.chats = set(changes['search_chats'] or [])
+        if 'search_index' not in changes or self.bot.client is None:
+            return
+        self.unregister(self.bot.client)
+        if changes['search_index']:
+            await self.start()
+            # Новые обработчики встают после фильтра безопасности: чужие сообщения видны после .restart
+            self.register(self.bot.client)
+            self.logger.info("🔎 Индекс сообщений включен (входящие - после .restart)")
+        else:
+            await self.stop()
+            self._ready = False
+            self.logger.info("🔎 Индекс сообщений выключен")
+
+    # endregion
+
+    # region Запись
+
+    async def on_message(self, event):
+        chat_id = event.chat_id
+        if chat_id not in self.chats:
+            return
+        if chat_id not in self.titles:
+            # Сущность чата пришла вместе с обновлением, запроса к Telegram нет
+            chat = event.chat
+            if chat is not None:
+                self.remember(chat_id, utils.get_display_name(chat))
+        self.add(chat_id, event.message)
+
+    async def on_deleted(self, event):
+        if not self._ready or not self.chats:
+            return
+        ids = list(event.deleted_ids)
+        chat_id = event.chat_id
+        for message_id in ids:
+            self._pending.pop((chat_id, message_id), None)
+        placeholders = ', '.join('?' for _ in ids)
+        if chat_id is not None:
+            if chat_id in self.chats:
+                self.bot.db.write(
+                    f"DELETE FROM search__messages WHERE chat_id = ? AND message_id IN ({placeholders})",
+                    (chat_id, *ids)
+                )
+        else:
+            # Удаление в личных чатах и обычных группах приходит без чата: номера сообщений в них общие
+            for key in [key for key in self._pending if key[1] in ids and key[0] > CHANNEL_OFFSET]:
+                del self._pending[key]
+            self.bot.db.write(
+                f"DELETE FROM search__messages WHERE chat_id > ? AND message_id IN ({placeholders})",
+                (CHANNEL_OFFSET, *ids)
+            )
+
+    def add(self, chat_id: int, message):
+        """Ставит сообщение в очередь индекса; сообщения без текста пропускаются"""
+        text = getattr(message, 'message', None)
+        if not text or not self._ready:
+            return
+        self._pending[(chat_id, message.id)] = (
+            chat_id, message.id, message.sender_id, int(message.date.timestamp()), text
+        )
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Одной пакетной записью отдает накопившиеся сообщения потоку базы"""
+        if not self._pending:
+            return
+        rows = list(self._pending.values())
+        self._pending.clear()
+        self.indexed += len(rows)
+        self.bot.db.write(UPSERT_SQL, rows, many=True)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    # endregion
+
+    # region Хранение
+
+    async def prune(self) -> int:
+        """Удаляет сообщения старше search_retention_days и сверх search_max_messages"""
+        days = self.bot.config.get('search_retention_days', 365)
+        limit = self.bot.config.get('search_max_messages', 500000)
+        cutoff = time.time() - days * 86400 if days else None
+
+        def prune(connection) -> int:
+            removed = 0
+            if cutoff is not None:
+                removed += connection.execute("DELETE FROM search__messages WHERE date < ?", (cutoff,)).rowcount
+            if limit:
+                extra = connection.execute("SELECT COUNT(*) FROM search__messages").fetchone()[0] - limit
+                if extra > 0:
+                    removed += connection.execute(
+                        "DELETE FROM search__messages WHERE id IN "
+                        "(SELECT id FROM search__messages ORDER BY date LIMIT ?)", (extra,)
+                    ).rowcount
+            return removed
+
+        removed = await self.bot.db.run(prune)
+        if removed:
+            self.logger.info(f"🧹 Из индекса сообщений удалено старых: {removed}")
+        return removed
+
+    async def _prune_loop(self):
+        while True:
+            try:
+                await self.prune()
+            except Exception as e:
+                self.logger.warning(f"⚠️ Не удалось очистить индекс сообщений: {e}")
+            await asyncio.sleep(self.prune_interval)
+
+    async def drop_chat(self, chat_id: int) -> int:
+        """Удаляет из индекса все сообщения чата"""
+        task = self.backfills.pop(chat_id, None)
+        if task is not None:
+            task.cancel()
+        for key in [key for key in self._pending if key[0] == chat_id]:
+            del self._pending[key]
+        return await self.bot.db.execute("DELETE FROM search__messages WHERE chat_id = ?", (chat_id,))
+
+    async def backfill(self, chat_id: int, limit: int) -> int:
+        """Добавляет в индекс до limit последних сообщений чата (не старше срока хранения)"""
+        days = self.bot.config.get('search_retention_days', 365)
+        cutoff = time.time() - days * 86400 if days else None
+        count = 0
+        async for message in self.bot.client.iter_messages(chat_id, limit=limit):
+            if cutoff is not None and message.date.timestamp() < cutoff:
+                break
+            if message.message:
+                self.add(chat_id, message)
+                count += 1
+        self.flush()
+        await self.bot.db.flush()
+        self.logger.info(f"🔎 Догружено в индекс из чата {chat_id}: {count} сообщений")
+        return count
+
+    def start_backfill(self, chat_id: int, limit: int) -> Optional[asyncio.Task]:
+        """Запускает догрузку в фоне; None, если для чата она уже идет"""
+        if chat_id in self.backfills:
+            return None
+        task = asyncio.create_task(self.backfill(chat_id, limit))
+        self.backfills[chat_id] = task
+        task.add_done_callback(lambda _: self.backfills.pop(chat_id, None))
+        return task
+
+    # endregion
+
+    # region Поиск
+
+    async def search(self, text: str, chat_id: Optional[int] = None, limit: int = 50) -> List[dict]:
+        """Сообщения, содержащие все слова запроса, лучшие совпадения первыми"""
+        query = build_query(text)
+        if not query or not self._ready:
+            return []
+        # Чтение встает в очередь потока базы после записи: только что пришедшие сообщения тоже находятся
+        self.flush()
+        params = [query]
+        if chat_id is not None:
+            params.append(chat_id)
+        params.append(limit)
+        rows = await self.bot.db.fetchall(
+            SEARCH_SQL.format(chat=' AND m.chat_id = ?' if chat_id is not None else ''), params
+        )
+        return [
+            {'chat_id': chat, 'message_id': message_id, 'date': date, 'snippet': snippet}
+            for chat, message_id, date, snippet in rows
+        ]
+
+    async def status(self) -> Dict[int, int]:
+        """Сколько сообщений проиндексировано в каждом чате"""
+        if not self._ready:
+            return {}
+        self.flush()
+        rows = await self.bot.db.fetchall("SELECT chat_id, COUNT(*) FROM search__messages GROUP BY chat_id")
+        return dict(rows)
+
+    # endregion
+
+    async def resolve_chat(self, argument: str) -> int:
+        """Идентификатор чата по @username, ссылке или числовому id; название запоминается"""
+        target = int(argument) if re.fullmatch(r'-?\d+', argument) else argument
+        entity = await self.bot.client.get_entity(target)
+        chat_id = utils.get_peer_id(entity)
+        self.remember(chat_id, utils.get_display_name(entity))
+        return chat_id
+
+    def remember(self, chat_id: int, title: str):
+        if not title or not self._ready or self.titles.get(chat_id) == title:
+            return
+        self.titles[chat_id] = title
+        self.bot.db.namespace('search').set('titles', {str(chat): name for chat, name in self.titles.items()})
+
+    def title(self, chat_id: int) -> str:
+        return self.titles.get(chat_id, str(chat_id))
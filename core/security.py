@@ -7,6 +7,8 @@ import logging
 import re
 from telethon import events
 
+from .tracing import span
+
 class SecurityManager:
     def __init__(self, bot):
         self.bot = bot
@@ -14,11 +16,28 @@ class SecurityManager:
         self.allowed_users = set()
         self._original_handlers = {}
         self.blocked_attempts = 0
+        self.state = None
+        
+    async def load_state(self):
+        """Восстанавливает счетчики из хранилища бота"""
+        db = getattr(self.bot, 'db', None)
+        if db is None:
+            return
+        self.state = db.namespace('security')
+        self.blocked_attempts = await self.state.get('blocked_attempts', 0)
         
     def add_admin(self, user_id: int):
         """Добавляет администратора"""
         self.allowed_users.add(user_id)
         
+    def apply_config_changes(self, changes):
+        """Применяет изменения настроек без перезапуска"""
+        if 'admin_id' in changes:
+            # Прежний администратор теряет доступ, владелец сессии - никогда
+            owner_id = getattr(self.bot.me, 'id', None)
+            self.allowed_users = {uid for uid in (changes['admin_id'], owner_id) if uid}
+            self.logger.info(f"🛡️ Администратор обновлен: {changes['admin_id']}")
+        
     def is_user_allowed(self, user_id: int) -> bool:
         """Проверяет, разрешен ли пользователь"""
         if not self.bot.config.get('admin_id'):
@@ -56,40 +75,43 @@ class SecurityManager:
         @self.bot.client.on(events.NewMessage(outgoing=False))
         async def global_security_filter(event):
             """Глобальный фильтр безопасности для ВСЕХ входящих сообщений"""
+            with span('security.filter'):
+                # Игнорируем сообщения без текста
+                if not event.text or not event.text.strip():
+                    return
             
-            # Игнорируем сообщения без текста
-            if not event.text or not event.text.strip():
-                return
+                text = event.text.strip()
             
-            text = event.text.strip()
+                # Проверяем, является ли сообщение командой (начинается с префикса).
+                # Модули регистрируют команды с точкой, поэтому она защищается всегда
+                command_prefix = self.bot.config.get('command_prefix', '.')
+                if not text.startswith((command_prefix, '.')):
+                    return  # Не команда - пропускаем
             
-            # Проверяем, является ли сообщение командой (начинается с префикса)
-            command_prefix = self.bot.config.get('command_prefix', '.')
-            if not text.startswith(command_prefix):
-                return  # Не команда - пропускаем
-            
-            # Проверяем права доступа
-            if not self.is_user_allowed(event.sender_id):
-                self.blocked_attempts += 1
-                self.logger.info(f"🚫 БЛОКИРОВКА: Пользователь {event.sender_id} попытался выполнить команду: {text}")
+                # Проверяем права доступа
+                if not self.is_user_allowed(event.sender_id):
+                    self.blocked_attempts += 1
+                    if self.state:
+                        self.state.set('blocked_attempts', self.blocked_attempts)
+                    self.logger.info(f"🚫 БЛОКИРОВКА: Пользователь {event.sender_id} попытался выполнить команду: {text}")
                 
-                # Отправляем уведомление только если включено в конфиге
-                if self.bot.config.get('enable_security_notifications'):
-                    try:
-                        if self.bot.config.get('chat_id'):
-                            await self.bot.client.send_message(
-                                self.bot.config['chat_id'],
-                                f"🚫 **Попытка несанкционированного доступа**\n"
-                                f"👤 Пользователь: {event.sender_id}\n"
-                                f"📝 Команда: `{text}`\n"
-                                f"💬 Чат: `{event.chat_id}`\n"
-                                f"🔢 Всего блокировок: `{self.blocked_attempts}`"
-                            )
-                    except Exception as e:
-                        self.logger.error(f"Ошибка отправки уведомления: {e}")
+                    # Отправляем уведомление только если включено в конфиге
+                    if self.bot.config.get('enable_security_notifications'):
+                        try:
+                            if self.bot.config.get('chat_id'):
+                                await self.bot.client.send_message(
+                                    self.bot.config['chat_id'],
+                                    f"🚫 **Попытка несанкционированного доступа**\n"
+                                    f"👤 Пользователь: {event.sender_id}\n"
+                                    f"📝 Команда: `{text}`\n"
+                                    f"💬 Чат: `{event.chat_id}`\n"
+                                    f"🔢 Всего блокировок: `{self.blocked_attempts}`"
+                                )
+                        except Exception as e:
+                            self.logger.error(f"Ошибка отправки уведомления: {e}")
                 
-                # Останавливаем обработку события
-                raise events.StopPropagation
+                    # Останавливаем обработку события
+                    raise events.StopPropagation
         
         self.logger.info("✅ Глобальная система безопасности активирована")
     
@@ -108,8 +130,7 @@ class SecurityManager:
                 'protected_commands': 0,
                 'allowed_users': len(self.allowed_users),
                 'admin_id': self.bot.config.get('admin_id'),
-                'blocked_attempts': self.blocked_attempts,
-                'security_enabled': True
+                'blocked_attempts': self.blocked_attempts
             }
         
         total_handlers = len(client._event_builders)
@@ -121,8 +142,7 @@ class SecurityManager:
             'protected_commands': protected_commands,
             'allowed_users': len(self.allowed_users),
             'admin_id': self.bot.config.get('admin_id'),
-            'blocked_attempts': self.blocked_attempts,
-            'security_enabled': True
+            'blocked_attempts': self.blocked_attempts
         }
 
 
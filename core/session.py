@@ -0,0 +1,296 @@
+"""
+Хранилище сессии Telegram для Kbot 3.0
+Сессия целиком живет в памяти и сбрасывается на диск пакетами:
+по таймеру, при смене ключа авторизации и при отключении
+"""
+
+import asyncio
+import base64
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from telethon import utils
+from telethon.crypto import AuthKey
+from telethon.sessions.memory import MemorySession, _SentFileType
+from telethon.tl import types
+
+from .fileio import disk
+
+SESSION_EXTENSION = '.kbsession'
+FORMAT_VERSION = 1
+
+
+class BufferedSession(MemorySession):
+    """Сессия в памяти с пакетной атомарной записью в <имя>.kbsession
+
+    Если файла еще нет, но есть обычная SQLite-сессия Telethon (<имя>.session),
+    данные импортируются из нее; исходный файл не изменяется.
+    """
+
+    def __init__(self, session_name: str, max_entities: int = 0):
+        super().__init__()
+        self.logger = logging.getLogger("BufferedSession")
+        self.filename = session_name if session_name.endswith(SESSION_EXTENSION) else session_name + SESSION_EXTENSION
+        self.legacy_filename = os.path.splitext(self.filename)[0] + '.session'
+        # 0 - сохранять все сущности, иначе только max_entities последних встреченных
+        self.max_entities = max_entities
+        # marked_id -> (id, hash, username, phone, name, last_seen)
+        self._entities: Dict[int, tuple] = {}
+        self._usernames: Dict[str, int] = {}
+        self._phones: Dict[str, int] = {}
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        # Снимки нумеруются по порядку создания; запись более старого снимка
+        # после более нового пропускается, иначе на диске окажется прежний ключ
+        self._write_lock = threading.Lock()
+        self._sequence = 0
+        self._written = 0
+
+        if os.path.exists(self.filename):
+            self._load()
+        elif os.path.exists(self.legacy_filename):
+            self._import_sqlite()
+            self._dirty = True
+
+    # region Ключ и дата-центр: изменения сохраняются сразу
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._dirty = True
+        # Потеря ключа означает повторный вход, поэтому его не откладываем
+        self.flush()
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self._dirty = True
+
+    # endregion
+
+    # region Сущности и состояние обновлений
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self._dirty = True
+
+    def cache_file(self, md5_digest, file_size, instance):
+        super().cache_file(md5_digest, file_size, instance)
+        self._dirty = True
+
+    def process_entities(self, tlo):
+        rows = self._entities_to_rows(tlo)
+        if not rows:
+            return
+        now = int(time.time())
+        for marked_id, access_hash, username, phone, name in rows:
+            previous = self._entities.get(marked_id)
+            if previous is not None:
+                # Старые индексы указывают на прежние username/телефон
+                if previous[2] and self._usernames.get(previous[2]) == marked_id:
+                    del self._usernames[previous[2]]
+                if previous[3] and self._phones.get(previous[3]) == marked_id:
+                    del self._phones[previous[3]]
+            self._add_entity((marked_id, access_hash, username, phone, name, now))
+        self._dirty = True
+
+    def _add_entity(self, row: tuple):
+        marked_id, _, username, phone, _, _ = row
+        self._entities[marked_id] = row
+        if username:
+            self._usernames[username] = marked_id
+        if phone:
+            self._phones[phone] = marked_id
+
+    def _rows_for(self, marked_id: Optional[int]) -> Optional[Tuple[int, int]]:
+        row = self._entities.get(marked_id) if marked_id is not None else None
+        return (row[0], row[1]) if row else None
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._rows_for(self._phones.get(phone))
+
+    def get_entity_rows_by_username(self, username):
+        return self._rows_for(self._usernames.get(username))
+
+    def get_entity_rows_by_name(self, name):
+        return next(((row[0], row[1]) for row in self._entities.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            return self._rows_for(id)
+        for marked_id in (
+            utils.get_peer_id(types.PeerUser(id)),
+            utils.get_peer_id(types.PeerChat(id)),
+            utils.get_peer_id(types.PeerChannel(id))
+        ):
+            found = self._rows_for(marked_id)
+            if found:
+                return found
+        return None
+
+    # endregion
+
+    # region Запись на диск
+
+    def start_flushing(self, interval: float = 30.0):
+        """Запускает периодический сброс изменений на диск"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            if not self._dirty:
+                continue
+            # Снимок берется в потоке цикла, запись на диск - в отдельном потоке
+            sequence, data = self._take_snapshot()
+            self._dirty = False
+            try:
+                await disk.run('session', self._write, data, sequence)
+            except OSError as e:
+                self._dirty = True
+                self.logger.warning(f"⚠️ Не удалось сохранить сессию: {e}")
+
+    def save(self):
+        # Telethon вызывает save() часто; запись выполняется пакетно по таймеру
+        if self._flush_task is None:
+            self.flush()
+
+    def flush(self):
+        """Немедленно записывает сессию, если есть изменения"""
+        if not self._dirty:
+            return
+        # Через ту же нумерованную запись, что и таймер: фоновая запись старого снимка ее не затрет
+        sequence, data = self._take_snapshot()
+        self._write(data, sequence)
+        self._dirty = False
+
+    def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+
+    def delete(self):
+        self.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+    def _take_snapshot(self) -> Tuple[int, dict]:
+        """Снимок и его номер (в потоке цикла событий)"""
+        self._sequence += 1
+        return self._sequence, self._snapshot()
+
+    def _snapshot(self) -> dict:
+        entities = list(self._entities.values())
+        if self.max_entities and len(entities) > self.max_entities:
+            # На диск попадают только недавно встреченные сущности
+            entities.sort(key=lambda row: row[5], reverse=True)
+            entities = entities[:self.max_entities]
+
+        return {
+            'version': FORMAT_VERSION,
+            'dc_id': self._dc_id,
+            'server_address': self._server_address,
+            'port': self._port,
+            'auth_key': base64.b64encode(self._auth_key.key).decode() if self._auth_key and self._auth_key.key else None,
+            'takeout_id': self._takeout_id,
+            'update_states': [
+                [entity_id, state.pts, state.qts, state.date.timestamp(), state.seq]
+                for entity_id, state in self._update_states.items()
+            ],
+            'entities': entities,
+            'files': [
+                [md5_digest.hex(), file_size, file_type.value, file_id, file_hash]
+                for (md5_digest, file_size, file_type), (file_id, file_hash) in self._files.items()
+            ],
+        }
+
+    def _write(self, data: dict, sequence: int):
+        """Атомарная запись: временный файл, fsync, замена; записи идут по одной и только вперед"""
+        with self._write_lock:
+            if sequence <= self._written:
+                # На диске уже более новый снимок
+                return
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.session.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.filename)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self._written = sequence
+            self.flushes += 1
+
+    # endregion
+
+    # region Загрузка
+
+    def _load(self):
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self._dc_id = data.get('dc_id') or 0
+        self._server_address = data.get('server_address')
+        self._port = data.get('port')
+        if data.get('auth_key'):
+            self._auth_key = AuthKey(data=base64.b64decode(data['auth_key']))
+        self._takeout_id = data.get('takeout_id')
+        for entity_id, pts, qts, date, seq in data.get('update_states', []):
+            self._update_states[entity_id] = self._state(pts, qts, date, seq)
+        for row in data.get('entities', []):
+            self._add_entity(tuple(row))
+        for md5_hex, file_size, file_type, file_id, file_hash in data.get('files', []):
+            self._files[(bytes.fromhex(md5_hex), file_size, _SentFileType(file_type))] = (file_id, file_hash)
+
+    def _import_sqlite(self):
+        """Переносит данные из SQLite-сессии Telethon"""
+        connection = sqlite3.connect(self.legacy_filename)
+        try:
+            row = connection.execute('select dc_id, server_address, port, auth_key, takeout_id from sessions').fetchone()
+            if row:
+                self._dc_id, self._server_address, self._port, key, self._takeout_id = row
+                if key:
+                    self._auth_key = AuthKey(data=key)
+            for entity_id, pts, qts, date, seq in connection.execute(
+                    'select id, pts, qts, date, seq from update_state'):
+                self._update_states[entity_id] = self._state(pts, qts, date, seq)
+            for marked_id, access_hash, username, phone, name, date in connection.execute(
+                    'select id, hash, username, phone, name, date from entities'):
+                self._add_entity((marked_id, access_hash, username, phone, name, date or 0))
+            for md5_digest, file_size, file_type, file_id, file_hash in connection.execute(
+                    'select md5_digest, file_size, type, id, hash from sent_files'):
+                self._files[(md5_digest, file_size, _SentFileType(file_type))] = (file_id, file_hash)
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️ Не удалось полностью импортировать {self.legacy_filename}: {e}")
+        finally:
+            connection.close()
+        self.logger.info(f"📥 Сессия импортирована из {self.legacy_filename}")
+
+    @staticmethod
+    def _state(pts, qts, date, seq) -> types.updates.State:
+        return types.updates.State(
+            pts=pts, qts=qts, seq=seq, unread_count=0,
+            date=datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc)
+        )
+
+    # endregion
@@ -0,0 +1,187 @@
+"""
+Статистика использования команд Kbot 3.0
+Счетчики по минутам в кольцевом буфере, агрегаты по часам и дням,
+пакетное сохранение в хранилище бота
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+MINUTE_SLOTS = 60
+HOURS_KEPT = 24 * 7
+DAYS_KEPT = 366
+
+# Период -> (уровень агрегации, сколько бакетов назад)
+PERIODS = {
+    'hour': ('minute', MINUTE_SLOTS),
+    'day': ('hour', 24),
+    'week': ('day', 7),
+    'month': ('day', 30),
+    'all': ('day', DAYS_KEPT),
+}
+
+# (модуль, команда) -> [вызовы, суммарная задержка, ошибки]
+Counters = Dict[Tuple[str, str], List[float]]
+
+
+def _merge(target: Counters, source: Counters):
+    for key, (count, latency, errors) in source.items():
+        bucket = target.get(key)
+        if bucket is None:
+            target[key] = [count, latency, errors]
+        else:
+            bucket[0] += count
+            bucket[1] += latency
+            bucket[2] += errors
+
+
+class UsageStats:
+    """Учет вызовов команд: запись O(1), без обращения к диску на каждое событие"""
+
+    def __init__(self, bot, flush_interval: float = 60.0):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger("UsageStats")
+        # Кольцевой буфер: индекс = минута % 60, в слоте номер минуты и счетчики
+        self.minutes: List[Tuple[int, Counters]] = [(-1, {}) for _ in range(MINUTE_SLOTS)]
+        self.hours: Dict[int, Counters] = {}
+        self.days: Dict[int, Counters] = {}
+        self._current_minute = int(time.time() // 60)
+        self.minutes[self._current_minute % MINUTE_SLOTS] = (self._current_minute, {})
+        self._dirty = set()
+        self._table = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, module: str, command: str, latency: float, failed: bool = False):
+        """Учитывает один вызов команды"""
+        minute = int(time.time() // 60)
+        if minute != self._current_minute:
+            self._roll_up(minute)
+
+        counters = self.minutes[minute % MINUTE_SLOTS][1]
+        bucket = counters.get((module, command))
+        if bucket is None:
+            counters[(module, command)] = [1, latency, 1 if failed else 0]
+        else:
+            bucket[0] += 1
+            bucket[1] += latency
+            if failed:
+                bucket[2] += 1
+
+    def _roll_up(self, minute: int):
+        """Переносит завершенную минуту в часовые и дневные агрегаты"""
+        previous = self._current_minute
+        stamp, counters = self.minutes[previous % MINUTE_SLOTS]
+        if stamp == previous and counters:
+            hour = previous // 60
+            day = previous // (60 * 24)
+            _merge(self.hours.setdefault(hour, {}), counters)
+            _merge(self.days.setdefault(day, {}), counters)
+            self._dirty.add(('h', hour))
+            self._dirty.add(('d', day))
+
+        self.minutes[minute % MINUTE_SLOTS] = (minute, {})
+        self._current_minute = minute
+        self._trim()
+
+    def _trim(self):
+        oldest_hour = self._current_minute // 60 - HOURS_KEPT
+        for hour in [h for h in self.hours if h < oldest_hour]:
+            del self.hours[hour]
+        oldest_day = self._current_minute // (60 * 24) - DAYS_KEPT
+        for day in [d for d in self.days if d < oldest_day]:
+            del self.days[day]
+
+    def summary(self, period: str = 'day', module: Optional[str] = None,
+                command: Optional[str] = None) -> Dict[Tuple[str, str], List[float]]:
+        """Суммирует счетчики за период с фильтром по модулю или команде"""
+        level, span = PERIODS[period]
+        now_minute = int(time.time() // 60)
+        if now_minute != self._current_minute:
+            self._roll_up(now_minute)
+
+        result: Counters = {}
+        if level == 'minute':
+            for stamp, counters in self.minutes:
+                if stamp > now_minute - span:
+                    _merge(result, counters)
+        else:
+            source = self.hours if level == 'hour' else self.days
+            current = now_minute // 60 if level == 'hour' else now_minute // (60 * 24)
+            for stamp, counters in source.items():
+                if stamp > current - span:
+                    _merge(result, counters)
+            # Текущая минута еще не перенесена в агрегаты
+            _merge(result, self.minutes[now_minute % MINUTE_SLOTS][1])
+
+        return {
+            key: value for key, value in result.items()
+            if (module is None or key[0] == module) and (command is None or key[1] == command)
+        }
+
+    async def start(self):
+        """Загружает сохраненные агрегаты и запускает периодическое сохранение"""
+        db = getattr(self.bot, 'db', None)
+        if db is None:
+            return
+        self._table = await db.namespace('stats').table('buckets', {
+            'period': 'TEXT NOT NULL',
+            'bucket': 'INTEGER NOT NULL',
+            'module': 'TEXT NOT NULL',
+            'command': 'TEXT NOT NULL',
+            'count': 'INTEGER NOT NULL',
+            'latency': 'REAL NOT NULL',
+            'errors': 'INTEGER NOT NULL',
+        })
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS stats__buckets_key "
+            "ON stats__buckets (period, bucket, module, command)"
+        )
+
+        now_minute = int(time.time() // 60)
+        rows = await self._table.select(
+            "(period = 'h' AND bucket > ?) OR (period = 'd' AND bucket > ?)",
+            (now_minute // 60 - HOURS_KEPT, now_minute // (60 * 24) - DAYS_KEPT)
+        )
+        for row in rows:
+            target = self.hours if row['period'] == 'h' else self.days
+            _merge(target.setdefault(row['bucket'], {}),
+                   {(row['module'], row['command']): [row['count'], row['latency'], row['errors']]})
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Одной пакетной записью сохраняет изменившиеся агрегаты"""
+        now_minute = int(time.time() // 60)
+        if now_minute != self._current_minute:
+            self._roll_up(now_minute)
+        if self._table is None or not self._dirty:
+            return
+
+        rows = []
+        for period, bucket in self._dirty:
+            counters = (self.hours if period == 'h' else self.days).get(bucket, {})
+            for (module, command), (count, latency, errors) in counters.items():
+                rows.append({
+                    'period': period, 'bucket': bucket, 'module': module, 'command': command,
+                    'count': int(count), 'latency': latency, 'errors': int(errors)
+                })
+        self._dirty.clear()
+        if rows:
+            self._table.insert_many(rows)
+
+    async def stop(self):
+        """Сохраняет данные при остановке бота"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        # Текущая минута тоже попадает в агрегаты
+        self._roll_up(self._current_minute + 1)
+        self.flush()
@@ -0,0 +1,364 @@
+"""
+Супервизор рабочих процессов Kbot 3.0
+Распределяет аккаунты по процессам, перезапускает упавшие процессы с задержкой,
+собирает состояние по локальному каналу и переносит аккаунты без их потери
+"""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from .diagnostics import process_memory
+from .fileio import disk
+
+ENV_ADDRESS = 'KBOT_SUPERVISOR'
+ENV_TOKEN = 'KBOT_SUPERVISOR_TOKEN'
+ENV_WORKER = 'KBOT_WORKER_ID'
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def shard_accounts(accounts: List[str], workers: int) -> List[List[str]]:
+    """Раскладывает аккаунты по процессам равномерно и детерминированно"""
+    workers = max(1, min(workers, len(accounts) or 1))
+    shards: List[List[str]] = [[] for _ in range(workers)]
+    for index, account in enumerate(sorted(accounts)):
+        shards[index % workers].append(account)
+    return shards
+
+
+class WorkerProcess:
+    """Один рабочий процесс и его состояние в супервизоре"""
+
+    def __init__(self, worker_id: int, accounts: List[str]):
+        self.worker_id = worker_id
+        self.accounts = accounts
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.health: Dict = {}
+        self.restarts = 0
+        self.started_at = 0.0
+        self.draining = False
+        self.retired = False
+        self.exited = asyncio.Event()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def send(self, message: Dict):
+        if self.writer is None or self.writer.is_closing():
+            return False
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+        return True
+
+
+class Supervisor:
+    """Запускает аккаунты в нескольких процессах и следит за ними"""
+
+    def __init__(self, accounts: List[str], workers: Optional[int] = None,
+                 min_backoff: float = 1.0, max_backoff: float = 60.0,
+                 stable_after: float = 60.0, drain_timeout: float = 30.0,
+                 status_path: str = os.path.join('data', 'supervisor.json')):
+        self.logger = logging.getLogger("Supervisor")
+        self.accounts = accounts
+        self.worker_count = workers or os.cpu_count() or 1
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        # Процесс, проработавший stable_after секунд, считается здоровым и счетчик сбоев сбрасывается
+        self.stable_after = stable_after
+        self.drain_timeout = drain_timeout
+        self.status_path = status_path
+        self.token = secrets.token_hex(16)
+        self.workers: Dict[int, WorkerProcess] = {}
+        self._next_id = 0
+        self._server = None
+        self._address = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    # region Жизненный цикл
+
+    async def run(self):
+        """Запускает процессы и работает до сигнала остановки"""
+        self._server = await asyncio.start_server(self._handle_connection, '127.0.0.1', 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self._address = f"{host}:{port}"
+        self._install_signals()
+
+        for accounts in shard_accounts(self.accounts, self.worker_count):
+            self._add_worker(accounts)
+        self.logger.info(f"🧭 Супервизор запущен: {len(self.accounts)} аккаунтов в {len(self.workers)} процессах")
+
+        status_task = asyncio.create_task(self._status_loop())
+        try:
+            await self._stopping.wait()
+        finally:
+            status_task.cancel()
+            await self._shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _shutdown(self):
+        self.logger.info("⏹️ Остановка рабочих процессов...")
+        await asyncio.gather(*(self._drain(worker, retire=True) for worker in list(self.workers.values())))
+        for task in self._tasks:
+            task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _install_signals(self):
+        loop = asyncio.get_running_loop()
+        handlers = {
+            'SIGINT': self.stop,
+            'SIGTERM': self.stop,
+            # SIGHUP - перечитать аккаунты и перераспределить, SIGUSR1 - поочередный перезапуск
+            'SIGHUP': lambda: asyncio.create_task(self.rebalance()),
+            'SIGUSR1': lambda: asyncio.create_task(self.rolling_restart()),
+        }
+        for name, handler in handlers.items():
+            sig = getattr(signal, name, None)
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, handler)
+            except (NotImplementedError, RuntimeError):
+                # Windows: управление только через остановку процесса
+                pass
+
+    # endregion
+
+    # region Процессы
+
+    def _add_worker(self, accounts: List[str]) -> WorkerProcess:
+        worker = WorkerProcess(self._next_id, accounts)
+        self._next_id += 1
+        self.workers[worker.worker_id] = worker
+        self._tasks.append(asyncio.create_task(self._keep_alive(worker)))
+        return worker
+
+    async def _spawn(self, worker: WorkerProcess):
+        env = dict(os.environ)
+        env[ENV_ADDRESS] = self._address
+        env[ENV_TOKEN] = self.token
+        env[ENV_WORKER] = str(worker.worker_id)
+        worker.exited.clear()
+        worker.health = {}
+        # Остановка относится к прежнему процессу; сбой нового - обычный сбой с задержкой
+        worker.draining = False
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, MAIN_SCRIPT, '--worker', '--accounts', ','.join(worker.accounts),
+            env=env
+        )
+        worker.started_at = time.monotonic()
+        self.logger.info(f"▶️ Процесс #{worker.worker_id} (PID {worker.process.pid}): {', '.join(worker.accounts)}")
+
+    async def _keep_alive(self, worker: WorkerProcess):
+        """Держит процесс запущенным, перезапуская его с растущей задержкой"""
+        while not worker.retired:
+            await self._spawn(worker)
+            code = await worker.process.wait()
+            worker.writer = None
+            worker.exited.set()
+            if worker.retired or self._stopping.is_set():
+                break
+            if worker.draining:
+                # Плановая остановка: сразу запускаем заново с текущим набором аккаунтов
+                worker.draining = False
+                continue
+
+            if time.monotonic() - worker.started_at >= self.stable_after:
+                worker.restarts = 0
+            delay = min(self.max_backoff, self.min_backoff * (2 ** worker.restarts))
+            worker.restarts += 1
+            self.logger.warning(
+                f"⚠️ Процесс #{worker.worker_id} завершился с кодом {code}, "
+                f"перезапуск через {delay:.1f}с (попытка {worker.restarts})"
+            )
+            await asyncio.sleep(delay)
+
+        self.workers.pop(worker.worker_id, None)
+
+    async def _drain(self, worker: WorkerProcess, retire: bool = False):
+        """Плавно останавливает процесс: аккаунты отключаются и сохраняют сессии"""
+        worker.retired = worker.retired or retire
+        if not worker.alive:
+            # Процесс ждет перезапуска после сбоя: останавливать нечего
+            return
+        worker.draining = True
+        sent = await worker.send({'type': 'drain'})
+        if not sent:
+            worker.process.terminate()
+        try:
+            await asyncio.wait_for(worker.exited.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"⚠️ Процесс #{worker.worker_id} не остановился вовремя, завершаем принудительно")
+            worker.process.kill()
+            await worker.exited.wait()
+
+    async def restart_worker(self, worker_id: int):
+        """Перезапускает процесс; его аккаунты поднимаются в новом процессе"""
+        worker = self.workers.get(worker_id)
+        if worker is not None:
+            await self._drain(worker)
+
+    async def rolling_restart(self):
+        """Поочередно перезапускает все процессы, остальные аккаунты продолжают работать"""
+        for worker_id in list(self.workers):
+            await self.restart_worker(worker_id)
+
+    async def rebalance(self, accounts: Optional[List[str]] = None, workers: Optional[int] = None):
+        """Перераспределяет аккаунты: перезапускаются только процессы, чей набор изменился"""
+        if accounts is None:
+            from .accounts import list_accounts
+            accounts = list_accounts() or self.accounts
+        self.accounts = accounts
+        if workers:
+            self.worker_count = workers
+
+        shards = shard_accounts(self.accounts, self.worker_count)
+        current = [w for w in self.workers.values() if not w.retired]
+        # Процессы с уже совпадающим набором аккаунтов не трогаем
+        unchanged = {tuple(w.accounts) for w in current} & {tuple(s) for s in shards}
+        pending = [s for s in shards if tuple(s) not in unchanged]
+        outdated = [w for w in current if tuple(w.accounts) not in unchanged]
+
+        # Аккаунт не может работать в двух процессах сразу (одна сессия), поэтому
+        # сначала останавливаем все процессы с изменившимся набором, затем запускаем новые
+        await asyncio.gather(*(self._drain(worker, retire=True) for worker in outdated))
+        for accounts in pending:
+            self._add_worker(accounts)
+        self.logger.info(f"🔀 Перераспределение: {len(self.accounts)} аккаунтов в {len(shards)} процессах")
+
+    # endregion
+
+    # region Канал связи с процессами
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            hello = json.loads(await reader.readline() or b'{}')
+            if hello.get('type') != 'hello' or not secrets.compare_digest(str(hello.get('token')), self.token):
+                writer.close()
+                return
+            worker = self.workers.get(hello.get('worker'))
+            if worker is None:
+                writer.close()
+                return
+            worker.writer = writer
+
+            async for line in reader:
+                message = json.loads(line)
+                if message.get('type') == 'health':
+                    message['received_at'] = time.time()
+                    worker.health = message
+        except (ValueError, ConnectionError) as e:
+            self.logger.debug(f"Канал процесса закрыт: {e}")
+        finally:
+            if worker is not None and worker.writer is writer:
+                worker.writer = None
+            writer.close()
+
+    def status(self) -> Dict:
+        """Сводка по процессам для data/supervisor.json"""
+        return {
+            'updated_at': time.time(),
+            'accounts': len(self.accounts),
+            'workers': [
+                {
+                    'id': w.worker_id,
+                    'pid': w.process.pid if w.process else None,
+                    'alive': w.alive,
+                    'accounts': w.accounts,
+                    'restarts': w.restarts,
+                    'health': w.health,
+                }
+                for w in sorted(self.workers.values(), key=lambda w: w.worker_id)
+            ],
+        }
+
+    async def _status_loop(self, interval: float = 15.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                data = json.dumps(self.status(), ensure_ascii=False, indent=2)
+                await disk.write_text(self.status_path, data)
+            except OSError as e:
+                self.logger.warning(f"⚠️ Не удалось записать состояние супервизора: {e}")
+
+    # endregion
+
+
+class WorkerLink:
+    """Сторона рабочего процесса: отчеты о состоянии и команды супервизора"""
+
+    def __init__(self, host, interval: float = 10.0):
+        self.host = host
+        self.interval = interval
+        self.logger = logging.getLogger("WorkerLink")
+        self.worker_id = int(os.environ.get(ENV_WORKER, 0))
+        self.started_at = time.time()
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(os.environ.get(ENV_ADDRESS))
+
+    async def health(self) -> Dict:
+        memory = await disk.run('stat', process_memory)
+        accounts = {}
+        for bot in self.host.bots:
+            hour = bot.stats.summary('hour') if bot.stats else {}
+            accounts[bot.account or 'main'] = {
+                'connected': bool(bot.client and bot.client.is_connected()),
+                'modules': len(bot.module_manager.list_modules()),
+                'commands_hour': int(sum(value[0] for value in hour.values())),
+                'errors_hour': int(sum(value[2] for value in hour.values())),
+            }
+        return {
+            'type': 'health',
+            'worker': self.worker_id,
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started_at,
+            'memory': memory['rss'] or memory['peak_rss'],
+            'accounts': accounts,
+        }
+
+    async def run(self):
+        """Держит канал с супервизором; потеря канала останавливает процесс"""
+        host, port = os.environ[ENV_ADDRESS].rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+        writer.write((json.dumps({
+            'type': 'hello', 'worker': self.worker_id, 'token': os.environ.get(ENV_TOKEN)
+        }) + '\n').encode())
+        await writer.drain()
+
+        reporter = asyncio.create_task(self._report(writer))
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message.get('type') == 'drain':
+                    self.logger.info("⏸️ Получена команда остановки от супервизора")
+                    break
+            else:
+                self.logger.warning("⚠️ Супервизор недоступен, останавливаем процесс")
+        finally:
+            reporter.cancel()
+            writer.close()
+            await self.host.stop()
+
+    async def _report(self, writer: asyncio.StreamWriter):
+        while True:
+            try:
+                writer.write((json.dumps(await self.health()) + '\n').encode())
+                await writer.drain()
+            except Exception as e:
+                self.logger.debug(f"Не удалось отправить состояние: {e}")
+            await asyncio.sleep(self.interval)
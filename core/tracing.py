@@ -0,0 +1,303 @@
+"""
+Трассировка обработки событий Kbot 3.0
+Каждое входящее обновление получает trace id, операции ядра записывают
+вложенные интервалы (spans). Самые медленные трассы хранятся в памяти
+(.trace), медленные трассы можно дописывать на диск в формате JSON lines
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+# Не даем одной трассе (например, скачивание большого файла частями) разрастись
+MAX_SPANS = 500
+
+_current: contextvars.ContextVar = contextvars.ContextVar('kbot_span', default=None)
+
+
+class Span:
+    """Интервал трассы: имя, атрибуты, время начала и длительность"""
+
+    __slots__ = ('trace', 'name', 'attrs', 'start', 'duration', 'children')
+
+    def __init__(self, trace: 'Trace', name: str, attrs: Dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.children: List['Span'] = []
+
+    def to_dict(self, origin: float) -> Dict:
+        return {
+            'name': self.name,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attrs': self.attrs,
+            'children': [child.to_dict(origin) for child in self.children],
+        }
+
+
+# Номера трасс общие для всех аккаунтов процесса; pid различает трассы рабочих процессов в экспорте
+_trace_numbers = itertools.count(1)
+
+
+class Trace:
+    """Дерево интервалов обработки одного обновления"""
+
+    def __init__(self, name: str, attrs: Dict):
+        self.id = f"{os.getpid():x}-{next(_trace_numbers):x}"
+        self.created_at = time.time()
+        self.spans = 0
+        self.dropped = 0
+        self.finished = False
+        self.root = Span(self, name, attrs)
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration or 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.id,
+            'created_at': self.created_at,
+            'duration_ms': round(self.duration * 1000, 3),
+            'dropped_spans': self.dropped,
+            'root': self.root.to_dict(self.root.start),
+        }
+
+
+class _SpanScope:
+    """Контекстный менеджер вложенного интервала (работает и в async-коде)"""
+
+    __slots__ = ('parent', 'span', 'token')
+
+    def __init__(self, parent: Span, name: str, attrs: Dict):
+        self.parent = parent
+        self.span = Span(parent.trace, name, attrs)
+        self.token = None
+
+    def __enter__(self) -> Span:
+        trace = self.parent.trace
+        if trace.spans < MAX_SPANS:
+            trace.spans += 1
+            self.parent.children.append(self.span)
+        else:
+            trace.dropped += 1
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration = time.perf_counter() - self.span.start
+        if exc_type is not None and exc_type.__name__ != 'StopPropagation':
+            self.span.attrs['error'] = exc_type.__name__
+        _current.reset(self.token)
+        return False
+
+
+class _NoSpan:
+    """Заглушка вне трассы: ничего не записывает"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attrs):
+    """Вложенный интервал текущей трассы; вне трассы ничего не стоит
+
+        with span('module.exec', module=name):
+            ...
+    """
+    parent = _current.get()
+    if parent is None or parent.trace.finished:
+        return _NO_SPAN
+    return _SpanScope(parent, name, attrs)
+
+
+class Tracer:
+    """Создает трассы для входящих обновлений и хранит самые медленные"""
+
+    def __init__(self, bot, keep: int = 20, export_path: Optional[str] = None,
+                 export_min: float = 1.0, enabled: bool = True):
+        self.bot = bot
+        self.logger = logging.getLogger("Tracer")
+        self.keep = keep
+        self.export_path = export_path
+        # Экспортируются только трассы не короче export_min секунд
+        self.export_min = export_min
+        self.enabled = enabled
+        self.traced = 0
+        # Мин-куча (длительность, номер, трасса): на вершине самая быстрая из сохраненных
+        self._slowest: List[tuple] = []
+        self._counter = itertools.count()
+        self._pending: List[str] = []
+        self._export_task: Optional[asyncio.Task] = None
+
+    # region Подключение к клиенту
+
+    def install(self, client):
+        """Оборачивает разбор обновлений и вызовы API клиента"""
+        dispatch = client._dispatch_update
+        call = client._call
+
+        async def traced_dispatch(update):
+            if not self.enabled:
+                return await dispatch(update)
+            name, attrs = self.describe(update)
+            with self.trace(name, **attrs):
+                return await dispatch(update)
+
+        async def traced_call(sender, request, ordered=False, flood_sleep_threshold=None):
+            with span(f"api.{type(request).__name__}"):
+                return await call(sender, request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+
+        client._dispatch_update = traced_dispatch
+        client._call = traced_call
+
+    def describe(self, update) -> tuple:
+        """Имя корня трассы: команда сообщения или тип обновления"""
+        name = type(update).__name__
+        attrs = {}
+        message = getattr(update, 'message', None)
+        text = getattr(message, 'message', None) if message is not None else None
+        if isinstance(text, str):
+            prefix = self.bot.config.get('command_prefix', '.')
+            if text.startswith((prefix, '.')) and text.strip():
+                attrs['command'] = text.split(maxsplit=1)[0]
+                name = attrs['command']
+            peer = getattr(message, 'peer_id', None)
+            if peer is not None:
+                attrs['peer'] = type(peer).__name__ + ':' + str(
+                    getattr(peer, 'channel_id', None) or getattr(peer, 'chat_id', None) or getattr(peer, 'user_id', None))
+        return name, attrs
+
+    # endregion
+
+    # region Трассы
+
+    def trace(self, name: str, **attrs) -> '_TraceScope':
+        return _TraceScope(self, Trace(name, attrs))
+
+    def finish(self, trace: Trace):
+        trace.finished = True
+        self.traced += 1
+        entry = (trace.duration, next(self._counter), trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and entry[0] > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+        if self.export_path and trace.duration >= self.export_min:
+            self._pending.append(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+            self._schedule_export()
+
+    def slowest(self, limit: Optional[int] = None) -> List[Trace]:
+        traces = [entry[2] for entry in sorted(self._slowest, reverse=True)]
+        return traces[:limit] if limit else traces
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return next((entry[2] for entry in self._slowest if entry[2].id == trace_id), None)
+
+    def clear(self):
+        self._slowest.clear()
+
+    def resize(self, keep: int):
+        self.keep = max(1, keep)
+        while len(self._slowest) > self.keep:
+            heapq.heappop(self._slowest)
+
+    # endregion
+
+    # region Экспорт на диск
+
+    def _schedule_export(self):
+        if self._export_task is None or self._export_task.done():
+            try:
+                self._export_task = asyncio.get_running_loop().create_task(self._export())
+            except RuntimeError:
+                # Нет цикла событий (выход из процесса) - пишем сразу
+                self._write(self._take_pending())
+
+    def _take_pending(self) -> List[str]:
+        lines, self._pending = self._pending, []
+        return lines
+
+    async def _export(self):
+        # Импорт здесь: fileio сам использует span() из этого модуля
+        from .fileio import disk
+        while self._pending:
+            lines = self._take_pending()
+            try:
+                await disk.run('trace_export', self._write, lines)
+            except OSError as e:
+                self.logger.warning(f"⚠️ Не удалось записать трассы в {self.export_path}: {e}")
+
+    def _write(self, lines: List[str]):
+        if not lines or not self.export_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.export_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.export_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+    # endregion
+
+    # region Вывод
+
+    @staticmethod
+    def format_tree(trace: Trace, max_lines: int = 60) -> str:
+        lines = [f"🧵 `{trace.id}` {trace.root.name} - {trace.duration * 1000:.1f}ms"]
+
+        def walk(node: Span, depth: int):
+            for child in node.children:
+                if len(lines) >= max_lines:
+                    return
+                duration = f"{child.duration * 1000:.1f}ms" if child.duration is not None else "…"
+                offset = (child.start - trace.root.start) * 1000
+                attrs = ", ".join(f"{key}={value}" for key, value in child.attrs.items())
+                lines.append(f"{'  ' * depth}• {child.name} {duration} (+{offset:.0f}ms){f' [{attrs}]' if attrs else ''}")
+                walk(child, depth + 1)
+
+        walk(trace.root, 1)
+        if len(lines) >= max_lines or trace.dropped:
+            lines.append(f"  … интервалов не показано/отброшено: {max(0, trace.spans - max_lines + 1)}/{trace.dropped}")
+        return "\n".join(lines)
+
+    # endregion
+
+
+class _TraceScope:
+    """Корень трассы: делает ее текущей на время обработки обновления"""
+
+    __slots__ = ('tracer', 'trace', 'token')
+
+    def __init__(self, tracer: Tracer, trace: Trace):
+        self.tracer = tracer
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self) -> Trace:
+        self.token = _current.set(self.trace.root)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        root = self.trace.root
+        root.duration = time.perf_counter() - root.start
+        if exc_type is not None:
+            root.attrs['error'] = exc_type.__name__
+        _current.reset(self.token)
+        self.tracer.finish(self.trace)
+        return False
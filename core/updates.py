@@ -0,0 +1,217 @@
+"""
+Буферизация обновлений Telegram для Kbot 3.0
+Позволяет пересобрать бота без потери входящих обновлений
+и разобрать накопившиеся за время простоя обновления, не задерживая новые
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from telethon import utils
+from telethon.tl import types
+
+
+class UpdateBuffer:
+    """Временно перехватывает обновления клиента и воспроизводит их позже"""
+
+    def __init__(self, client, limit: int = 10000):
+        self.client = client
+        self.logger = logging.getLogger("UpdateBuffer")
+        self.updates = deque(maxlen=limit)
+        self.dropped = 0
+        self._original_dispatch = None
+        self._wrapped = False
+
+    @property
+    def holding(self) -> bool:
+        return self._original_dispatch is not None
+
+    def hold(self):
+        """Начинает копить обновления вместо их обработки"""
+        if self.holding:
+            return
+        # Telethon вызывает self._dispatch_update для каждого обновления,
+        # поэтому атрибут экземпляра перекрывает метод класса
+        self._original_dispatch = self.client._dispatch_update
+        # Обработку могла уже перехватить другая обертка (CatchUpGate) - ее нужно вернуть
+        self._wrapped = '_dispatch_update' in vars(self.client)
+        self.client._dispatch_update = self._buffer_update
+
+    async def _buffer_update(self, update):
+        if len(self.updates) == self.updates.maxlen:
+            self.dropped += 1
+        self.updates.append(update)
+
+    async def release(self) -> int:
+        """Возвращает обработку обновлений клиенту и воспроизводит накопленные"""
+        if not self.holding:
+            return 0
+
+        original = self._original_dispatch
+        if self._wrapped:
+            self.client._dispatch_update = original
+        else:
+            # Удаляем атрибут экземпляра, чтобы снова работал метод клиента
+            del self.client._dispatch_update
+        self._original_dispatch = None
+
+        if self.dropped:
+            self.logger.warning(f"⚠️ Буфер переполнен, потеряно обновлений: {self.dropped}")
+
+        replayed = 0
+        while self.updates:
+            update = self.updates.popleft()
+            try:
+                await original(update)
+                replayed += 1
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка обработки отложенного обновления: {e}")
+        return replayed
+
+
+class CatchUpGate:
+    """Отделяет накопившиеся за время простоя сообщения от новых
+
+    Новые обновления обрабатываются сразу, старые - небольшими пакетами
+    в фоне: сначала команды администраторов, затем остальные. Устаревшие
+    команды отбрасываются, повторы одного сообщения обрабатываются один раз.
+    """
+
+    # Сообщения, отправленные раньше запуска минус этот запас, считаются накопившимися
+    LIVE_SLACK = 2.0
+
+    def __init__(self, bot, client, max_age: float = 300.0, batch_size: int = 50,
+                 dedupe_size: int = 10000, limit: int = 10000):
+        self.bot = bot
+        self.client = client
+        self.logger = logging.getLogger("CatchUpGate")
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.started_at = time.time()
+        self.opened = False
+        # Ключи (чат, id сообщения) уже полученных сообщений
+        self.seen: OrderedDict = OrderedDict()
+        self.dedupe_size = dedupe_size
+        self.early = deque(maxlen=limit)
+        self.priority = deque(maxlen=limit)
+        self.backlog = deque(maxlen=limit)
+        self.duplicates = 0
+        self.expired = 0
+        self.processed = 0
+        self._original_dispatch = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    def install(self):
+        """Перехватывает обработку обновлений клиента до его подключения"""
+        self._original_dispatch = self.client._dispatch_update
+        self.client._dispatch_update = self._dispatch
+
+    @staticmethod
+    def describe(update):
+        """Возвращает (ключ, дата, текст, отправитель) для новых сообщений, иначе None"""
+        if isinstance(update, (types.UpdateNewMessage, types.UpdateNewChannelMessage)):
+            message = update.message
+            if not isinstance(message, types.Message):
+                return None
+            chat_id = utils.get_peer_id(message.peer_id)
+            sender = utils.get_peer_id(message.from_id) if message.from_id else chat_id
+            return (chat_id, message.id), message.date, message.message, None if message.out else sender
+        if isinstance(update, types.UpdateShortMessage):
+            return (update.user_id, update.id), update.date, update.message, None if update.out else update.user_id
+        if isinstance(update, types.UpdateShortChatMessage):
+            return (-update.chat_id, update.id), update.date, update.message, update.from_id
+        return None
+
+    async def _dispatch(self, update):
+        info = self.describe(update)
+        if info is None:
+            # Служебные обновления (правки, прочтения и т.п.) не задерживаем
+            if self.opened:
+                await self._original_dispatch(update)
+            else:
+                self.early.append(update)
+            return
+
+        key, date, _, _ = info
+        if key in self.seen:
+            self.duplicates += 1
+            return
+        self.seen[key] = None
+        if len(self.seen) > self.dedupe_size:
+            self.seen.popitem(last=False)
+
+        live = date is None or date.timestamp() >= self.started_at - self.LIVE_SLACK
+        if not self.opened:
+            (self.early if live else self.backlog).append(update)
+            return
+        if live:
+            await self._original_dispatch(update)
+        else:
+            self._enqueue(update, info)
+            self._ensure_drain()
+
+    def _is_command(self, text: Optional[str]) -> bool:
+        return bool(text) and text.startswith(self.bot.config.get('command_prefix', '.'))
+
+    def _enqueue(self, update, info) -> bool:
+        _, date, text, sender = info
+        if self._is_command(text):
+            if time.time() - date.timestamp() > self.max_age:
+                # Команда устарела - не выполняем ее спустя долгое время
+                self.expired += 1
+                return False
+            # sender None - исходящее сообщение владельца
+            if sender is None or self.bot.is_admin(sender):
+                self.priority.append(update)
+                return True
+        self.backlog.append(update)
+        return True
+
+    def open(self):
+        """Вызывается после регистрации обработчиков: начинает обработку"""
+        if self.opened:
+            return
+        self.opened = True
+
+        # Накопленное до открытия распределяем по очередям, когда безопасность уже готова
+        held = list(self.backlog)
+        self.backlog.clear()
+        for update in held:
+            self._enqueue(update, self.describe(update))
+
+        early = list(self.early)
+        self.early.clear()
+        for update in early:
+            asyncio.create_task(self._safe_dispatch(update))
+
+        self._ensure_drain()
+
+    def _ensure_drain(self):
+        if (self.priority or self.backlog) and (self._drain_task is None or self._drain_task.done()):
+            self._drain_task = asyncio.create_task(self._drain())
+
+    async def _safe_dispatch(self, update):
+        try:
+            await self._original_dispatch(update)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка обработки накопившегося обновления: {e}")
+
+    async def _drain(self):
+        started = time.perf_counter()
+        processed = 0
+        while self.priority or self.backlog:
+            queue = self.priority if self.priority else self.backlog
+            batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+            await asyncio.gather(*(self._safe_dispatch(update) for update in batch))
+            processed += len(batch)
+            # Между пакетами уступаем циклу, чтобы новые сообщения не ждали
+            await asyncio.sleep(0)
+
+        self.processed += processed
+        self.logger.info(
+            f"📬 Накопившиеся обновления разобраны: {processed} за {time.perf_counter() - started:.2f}с "
+            f"(устаревших команд: {self.expired}, повторов: {self.duplicates})"
+        )
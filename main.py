@@ -1,29 +1,21 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
 import logging
 import sys
 import os
 import time
-from datetime import datetime
 
 # Добавляем путь для импорта core
 sys.path.append(os.path.dirname(__file__))
 
-def setup_logging():
-    """Настройка логирования"""
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
+def setup_logging(file_name: str = "kbot.log"):
+    """Настройка логирования: запись в консоль и файл идет в фоновом потоке"""
+    from utils.log_pipeline import LogPipeline
     
-    log_file = os.path.join(log_dir, f"kbot_{datetime.now().strftime('%Y%m%d')}.log")
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    pipeline = LogPipeline("logs", file_name)
+    pipeline.start()
+    return pipeline
 
 def check_config():
     """Проверяет наличие конфигурации"""
@@ -50,14 +42,47 @@ async def check_updates_on_start():
         logging.getLogger("KbotLauncher").warning(f"⚠️ Модуль проверки обновлений не найден: {e}")
         return False, None
 
+def parse_args():
+    """Аргументы запуска: обычный режим, супервизор или рабочий процесс"""
+    parser = argparse.ArgumentParser(description="Kbot 3.0")
+    parser.add_argument('--supervisor', action='store_true',
+                        help='распределить аккаунты из configs/accounts по нескольким процессам')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='количество рабочих процессов (по умолчанию - число ядер)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--accounts', default=None,
+                        help='аккаунты через запятую (по умолчанию - все из configs/accounts)')
+    return parser.parse_args()
+
+async def run_supervisor(args):
+    """Запускает супервизор рабочих процессов"""
+    from core.accounts import list_accounts
+    from core.supervisor import Supervisor
+    
+    accounts = args.accounts.split(',') if args.accounts else list_accounts()
+    if not accounts:
+        logging.getLogger("KbotLauncher").error("❌ Для режима супервизора нужны файлы configs/accounts/<имя>.json")
+        sys.exit(1)
+    await Supervisor(accounts, workers=args.workers).run()
+
 async def main():
+    args = parse_args()
+    if args.supervisor:
+        log_pipeline = setup_logging("supervisor.log")
+    elif args.worker:
+        log_pipeline = setup_logging(f"kbot.worker{os.environ.get('KBOT_WORKER_ID', 0)}.log")
+    else:
+        log_pipeline = setup_logging()
     try:
-        setup_logging()
         logger = logging.getLogger("KbotLauncher")
         
         if not check_config():
             sys.exit(1)
         
+        if args.supervisor:
+            await run_supervisor(args)
+            return
+        
         # Создаем необходимые директории
         os.makedirs("modules", exist_ok=True)
         os.makedirs("backups", exist_ok=True)
@@ -71,21 +96,38 @@ async def main():
         except ImportError as e:
             logger.warning(f"⚠️ Модуль конвертации не найден: {e}")
         
-        # Проверяем обновления при запуске
-        update_info = await check_updates_on_start()
+        # Проверяем обновления при запуске (рабочие процессы супервизора не повторяют проверку)
+        if not args.worker:
+            update_info = await check_updates_on_start()
         
-        from core.bot import Kbot
-        bot = Kbot()
-        bot.start_time = time.time()
+        # Один процесс обслуживает все аккаунты из configs/accounts
+        from core.accounts import AccountHost
+        host = AccountHost(args.accounts.split(',') if args.accounts else None)
+        for bot in host.bots:
+            bot.start_time = time.time()
+        # Логированием процесса управляют настройки первого аккаунта
+        host.primary.log_pipeline = log_pipeline
+        log_pipeline.configure(host.primary.config)
         
         logger.info("🚀 Запуск Kbot...")
-        await bot.start()
+        from core.supervisor import WorkerLink
+        if WorkerLink.enabled():
+            # Рабочий процесс отчитывается супервизору и останавливается по его команде
+            link_task = asyncio.create_task(WorkerLink(host).run())
+            try:
+                await host.run()
+            finally:
+                link_task.cancel()
+        else:
+            await host.run()
         
     except KeyboardInterrupt:
         logging.info("⏹️ Остановка Kbot по запросу пользователя")
     except Exception as e:
         logging.error(f"❌ Критическая ошибка: {e}")
         sys.exit(1)
+    finally:
+        log_pipeline.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
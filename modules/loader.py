@@ -4,7 +4,6 @@
 """
 
 from telethon import events
-import requests
 import os
 
 async def register(bot):
@@ -12,25 +11,32 @@ async def register(bot):
 
     modules_path = os.path.join(os.getcwd(), "modules")
 
-    # .klm URL — скачать модуль (только для админа)
-    @bot.client.on(events.NewMessage(pattern=r"\.klm (.+)"))
+    # .klm URL [URL ...] — скачать модули (только для админа)
+    @bot.client.on(events.NewMessage(pattern=r"\.klm\s+(.+)"))
     async def download_module(event):
-        """Скачать модуль по URL"""
+        """Скачать один или несколько модулей по URL"""
         # Проверка прав доступа
         if not bot.is_admin(event.sender_id):
             return
         
-        url = event.pattern_match.group(1)
-        name = url.split("/")[-1]
-
-        try:
-            data = requests.get(url).text
-            with open(f"{modules_path}/{name}", "w") as f:
-                f.write(data)
-
-            await event.respond(f"✅ Модуль `{name}` скачан!")
-        except Exception as e:
-            await event.respond(f"❌ Ошибка: `{e}`")
+        urls = event.pattern_match.group(1).split()
+        await event.respond(f"📥 Скачиваю модулей: {len(urls)}...")
+        
+        results = await bot.module_fetcher.install_many(urls)
+        
+        lines = []
+        for result in results:
+            name = result['name'] or result['url']
+            if result['success']:
+                line = f"✅ `{name}`"
+                if result['commands']:
+                    line += f" — {', '.join(result['commands'])}"
+            else:
+                line = f"❌ `{name}`: {result['error']}"
+            lines.append(line)
+        
+        installed = len([r for r in results if r['success']])
+        await event.respond(f"📦 Установлено {installed}/{len(results)}\n\n" + "\n".join(lines))
 
     # .kun name — удалить модуль (только для админа)
     @bot.client.on(events.NewMessage(pattern=r"\.kun (.+)"))
@@ -44,10 +50,14 @@ async def register(bot):
         file = f"{modules_path}/{name}.py"
 
         try:
-            os.remove(file)  # safe: системная операция
-            await event.respond(f"🗑 Модуль `{name}` удалён!")
-        except:
+            await bot.io.remove(file, missing_ok=False)
+        except FileNotFoundError:
             await event.respond("❌ Такого модуля нет!")
+            return
+        except OSError as e:
+            await event.respond(f"❌ Не удалось удалить модуль `{name}`: {e}")
+            return
+        await event.respond(f"🗑 Модуль `{name}` удалён!")
 
     # .reload — перезагрузить все модули (только для админа)
     @bot.client.on(events.NewMessage(pattern=r"\.reload"))
@@ -57,8 +67,10 @@ async def register(bot):
         if not bot.is_admin(event.sender_id):
             return
             
-        await event.respond("♻ Модули перезагружены!")
-        raise SystemExit
+        # Мягкий перезапуск: соединение с Telegram сохраняется
+        duration = await bot.soft_restart()
+        await event.respond(f"♻ Модули перезагружены за `{duration * 1000:.0f}ms`!")
+        raise events.StopPropagation
 
 async def unregister(bot):
     """Выгрузка модуля"""
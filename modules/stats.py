@@ -1,5 +1,6 @@
 """
 Модуль показывает случайный факт. Полезно, когда хочется удивить собеседника чем-то интересным.
+Также выводит статистику использования команд бота.
 """
 
 import random
@@ -13,11 +14,55 @@ FACTS = [
     "У бабочек есть органы вкуса на ногах."
 ]
 
+PERIOD_NAMES = {
+    'hour': 'за час',
+    'day': 'за сутки',
+    'week': 'за неделю',
+    'month': 'за месяц',
+    'all': 'за все время'
+}
+
 async def register(bot):
     @bot.client.on(events.NewMessage(pattern=r'\.fact'))
     async def send_fact(event):
         fact = random.choice(FACTS)
         await event.reply(fact)
 
+    # .stats [модуль|.команда] [hour|day|week|month|all]
+    @bot.client.on(events.NewMessage(pattern=r'\.stats(?:\s+(.+))?$'))
+    async def stats_handler(event):
+        """Статистика использования команд"""
+        if not bot.is_admin(event.sender_id):
+            return
+
+        period = 'day'
+        module = command = None
+        for arg in (event.pattern_match.group(1) or '').split():
+            if arg in PERIOD_NAMES:
+                period = arg
+            elif arg.startswith('.'):
+                command = arg
+            else:
+                module = arg
+
+        summary = bot.stats.summary(period, module=module, command=command)
+        if not summary:
+            await bot.safe_reply(event, f"📊 Нет вызовов команд {PERIOD_NAMES[period]}")
+            return
+
+        total = int(sum(value[0] for value in summary.values()))
+        errors = int(sum(value[2] for value in summary.values()))
+        top = sorted(summary.items(), key=lambda item: item[1][0], reverse=True)[:20]
+
+        message = f"📊 **Статистика команд {PERIOD_NAMES[period]}**\n\n"
+        for (module_name, command_name), (count, latency, failed) in top:
+            avg_ms = latency / count * 1000 if count else 0
+            message += f"• `{command_name}` ({module_name}) — {int(count)} вызовов, ср. {avg_ms:.0f}ms"
+            if failed:
+                message += f", ошибок: {int(failed)}"
+            message += "\n"
+        message += f"\n🔢 Всего: {total}, ошибок: {errors}"
+        await bot.safe_reply(event, message)
+
 async def unregister(bot):
-    pass
\ No newline at end of file
+    pass
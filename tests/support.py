@@ -0,0 +1,69 @@
+"""
+Общие заготовки тестов: Kbot поверх FakeClient во временной папке
+и локальный HTTP-сервер aiohttp вместо настоящих источников модулей
+"""
+
+import contextlib
+import datetime
+import os
+from typing import Callable, Dict
+
+from aiohttp import web
+from telethon.tl import types
+
+from benchmarks.dispatch import BenchmarkBot
+from benchmarks.fake_client import SELF_ID, FakeClient
+
+
+@contextlib.asynccontextmanager
+async def running_bot(workdir):
+    """Kbot с модулями из workdir/modules; рабочая папка меняется на время теста"""
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    bot = BenchmarkBot(str(workdir))
+    bot.config['module_image'] = False
+    client = FakeClient()
+    bot.client = client
+    bot.me = client.me
+    bot.db.start()
+    try:
+        await bot.setup()
+        yield bot
+    finally:
+        await bot.module_fetcher.close()
+        await bot.teardown()
+        await bot.db.close()
+        os.chdir(previous_cwd)
+
+
+@contextlib.asynccontextmanager
+async def stand_in_server(routes: Dict[str, Callable]):
+    """HTTP-сервер на 127.0.0.1 со случайным портом; отдает базовый URL"""
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def outgoing_message(text: str, chat_id: int = SELF_ID, message_id: int = 1):
+    """Обновление с исходящим сообщением владельца, как его присылает Telegram"""
+    message = types.Message(
+        id=message_id,
+        peer_id=types.PeerUser(chat_id),
+        date=datetime.datetime.now(datetime.timezone.utc),
+        message=text,
+        out=True,
+        from_id=types.PeerUser(SELF_ID)
+    )
+    update = types.UpdateNewMessage(message, pts=0, pts_count=0)
+    me = types.User(id=SELF_ID, access_hash=SELF_ID, is_self=True, first_name='Kbot')
+    update._entities = {SELF_ID: me}
+    return update
@@ -0,0 +1,120 @@
+"""
+Массовые операции: позиция purge сохраняется только после удаления страницы,
+а AdaptivePacer не ждет FloodWait бесконечно
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from telethon import errors
+from telethon.tl import functions, types
+
+from benchmarks.fake_client import FakeClient
+from core.bulk import HISTORY_PAGE_SIZE, AdaptivePacer, BulkOperations
+from core.database import Database
+
+CHAT = types.InputPeerUser(user_id=42, access_hash=0)
+
+
+class HistoryClient(FakeClient):
+    """История из заданных ID; удаление может упасть на заданном вызове"""
+
+    def __init__(self, ids, fail_on_delete=None):
+        super().__init__()
+        self.ids = sorted(ids, reverse=True)
+        self.fail_on_delete = fail_on_delete
+        self.delete_calls = 0
+        self.deleted = []
+
+    async def get_input_entity(self, chat):
+        return CHAT
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        if isinstance(request, functions.messages.GetHistoryRequest):
+            # Пауза, чтобы читатель успел заполнить очередь раньше удаления
+            await asyncio.sleep(0)
+            ids = [i for i in self.ids if (not request.offset_id or i < request.offset_id) and i > request.min_id]
+            page = [
+                types.Message(id=i, peer_id=types.PeerUser(42), date=datetime.now(timezone.utc), message='')
+                for i in ids[:request.limit]
+            ]
+            return types.messages.Messages(messages=page, topics=[], chats=[], users=[])
+        self.delete_calls += 1
+        if self.delete_calls == self.fail_on_delete:
+            raise ConnectionError("удаление не прошло")
+        self.deleted.extend(request.id)
+        self.ids = [i for i in self.ids if i not in request.id]
+        return types.messages.AffectedMessages(pts=0, pts_count=len(request.id))
+
+
+def test_failed_purge_resumes_from_last_deleted_page(tmp_path):
+    ids = range(1, HISTORY_PAGE_SIZE * 4 + 1)
+
+    async def scenario():
+        db = Database(str(tmp_path / 'kbot.db'))
+        db.start()
+        try:
+            client = HistoryClient(ids, fail_on_delete=2)
+            bulk = BulkOperations(SimpleNamespace(client=client, db=db))
+            with pytest.raises(ConnectionError):
+                await bulk.purge('chat', job_id='purge:42')
+            # Удалена только первая страница: позиция стоит сразу после нее
+            assert len(client.deleted) == HISTORY_PAGE_SIZE
+            await db.flush()
+            assert await db.namespace('bulk').get('purge:42') == min(client.deleted)
+
+            client.fail_on_delete = None
+            deleted = await bulk.purge('chat', job_id='purge:42')
+            assert deleted == HISTORY_PAGE_SIZE * 3
+            assert client.ids == []
+            await db.flush()
+            assert await db.namespace('bulk').get('purge:42') is None
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+class FloodingClient:
+    """Отвечает на каждый запрос FloodWait заданной длины"""
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.calls = 0
+        self._sender = None
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.calls += 1
+        raise errors.FloodWaitError(request=request, capture=self.seconds)
+
+
+def test_pacer_gives_up_after_max_attempts(monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+    client = FloodingClient(seconds=3)
+    pacer = AdaptivePacer('delete', max_attempts=4, max_wait=3600)
+
+    with pytest.raises(errors.FloodWaitError):
+        asyncio.run(pacer.call(client, functions.messages.DeleteMessagesRequest([1])))
+    assert client.calls == 4
+    assert pacer.flood_waits == 4
+
+
+def test_pacer_does_not_wait_past_budget(monkeypatch):
+    async def fake_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+    # Первое ожидание в бюджет помещается, второе уже нет
+    client = FloodingClient(seconds=400)
+    pacer = AdaptivePacer('history', max_attempts=100, max_wait=600)
+
+    with pytest.raises(errors.FloodWaitError):
+        asyncio.run(pacer.call(client, functions.messages.DeleteMessagesRequest([1])))
+    assert client.calls == 2
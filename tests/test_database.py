@@ -0,0 +1,48 @@
+"""
+Кеш Namespace: чтение, во время которого пришла запись, не кладет
+в кеш устаревшее значение
+"""
+
+import asyncio
+import threading
+
+from core.database import Database
+
+
+async def read_in_flight(db, namespace, key):
+    """Запускает get() и ждет, пока поток базы выполнит чтение; результат до цикла еще не дошел"""
+    reading = asyncio.create_task(namespace.get(key))
+    await asyncio.sleep(0)
+    reached = threading.Event()
+    # Очередь базы обрабатывается по порядку: отметка ставится после чтения
+    db._queue.put(('call', lambda connection: reached.set(), None))
+    reached.wait(5)
+    return reading
+
+
+def test_get_racing_set_keeps_new_value(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / 'kbot.db'))
+        db.start()
+        try:
+            first = db.namespace('race')
+            first.set('counter', 1)
+            await db.flush()
+            db._cache.clear()
+
+            # Чтение выполнено в потоке базы до записи и вернет прежнее значение
+            reading = await read_in_flight(db, first, 'counter')
+            first.set('counter', 2)
+            assert await reading == 1
+            assert await first.get('counter') == 2
+
+            # То же для clear(): очищенный ключ не возвращается из кеша
+            db._cache.clear()
+            reading = await read_in_flight(db, first, 'counter')
+            await first.clear()
+            assert await reading == 2
+            assert await first.get('counter') is None
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,238 @@
+"""
+ModuleFetcher против локального сервера: лимиты, контрольные суммы,
+таймауты, проверка модуля и откат при неудачной активации
+"""
+
+import asyncio
+import hashlib
+
+from aiohttp import web
+
+from tests.support import running_bot, stand_in_server
+from utils.module_bundle import build_bundle
+
+GOOD_MODULE = '''"""Тестовый модуль {name}"""
+from telethon import events
+
+VERSION = {version}
+
+
+async def register(bot):
+    @bot.client.on(events.NewMessage(pattern=r'\\.{name}'))
+    async def handler(event):
+        await event.reply("ok")
+'''
+
+BROKEN_MODULE = '''"""Модуль, который падает при регистрации"""
+
+async def register(bot):
+    raise RuntimeError("сломан")
+'''
+
+CONFLICT_MODULE = '''"""Модуль, перехватывающий системную команду"""
+from telethon import events
+
+
+async def register(bot):
+    @bot.client.on(events.NewMessage(pattern=r'\\.help'))
+    async def handler(event):
+        pass
+'''
+
+
+DANGEROUS_MODULE = '''"""Модуль с запрещенным вызовом"""
+import os
+
+
+async def register(bot):
+    os.system("true")
+'''
+
+
+def text_route(body: str):
+    async def handler(request):
+        return web.Response(text=body)
+    return handler
+
+
+def bytes_route(body: bytes):
+    async def handler(request):
+        return web.Response(body=body, content_type='application/zip')
+    return handler
+
+
+def make_bundle(directory, name: str, modules: dict) -> bytes:
+    """Собирает zip-пакет из исходников {имя: текст} и возвращает его байты"""
+    directory.mkdir()
+    paths = []
+    for module_name, source in modules.items():
+        path = directory / f"{module_name}.py"
+        path.write_text(source, encoding='utf-8')
+        paths.append(path)
+    output = directory / f"{name}.kbz"
+    build_bundle(output, paths)
+    return output.read_bytes()
+
+
+def leftovers(workdir):
+    """Временные и резервные файлы, оставшиеся в папке modules"""
+    return sorted(path.name for path in (workdir / 'modules').iterdir() if path.name.startswith('.'))
+
+
+def test_size_limit_aborts_streaming_download(tmp_path):
+    async def endless(request):
+        # Без Content-Length: лимит срабатывает только по мере чтения потока
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(64):
+            await response.write(b'#' * 1024)
+        return response
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server({'/big_one.py': endless}) as base:
+            bot.module_fetcher.max_size = 4096
+            result = await bot.module_fetcher.install(f"{base}/big_one.py")
+            assert not result['success']
+            assert 'лимита' in result['error']
+            assert 'big_one' not in bot.module_manager.list_modules()
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+    assert not (tmp_path / 'modules' / 'big_one.py').exists()
+
+
+def test_sha256_mismatch_is_rejected(tmp_path):
+    source = GOOD_MODULE.format(name='hashed', version=1)
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server({'/hashed.py': text_route(source)}) as base:
+            wrong = await bot.module_fetcher.install(f"{base}/hashed.py#sha256={'0' * 64}")
+            assert not wrong['success']
+            assert 'Контрольная сумма' in wrong['error']
+            assert 'hashed' not in bot.module_manager.list_modules()
+
+            digest = hashlib.sha256(source.encode()).hexdigest()
+            right = await bot.module_fetcher.install(f"{base}/hashed.py#sha256={digest}")
+            assert right['success'], right['error']
+            assert 'hashed' in bot.module_manager.list_modules()
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+
+
+def test_timeout(tmp_path):
+    async def slow(request):
+        await asyncio.sleep(5)
+        return web.Response(text='')
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server({'/slow_one.py': slow}) as base:
+            bot.module_fetcher.timeout = 0.3
+            result = await bot.module_fetcher.install(f"{base}/slow_one.py")
+            assert not result['success']
+            assert 'Таймаут' in result['error']
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+
+
+def test_validate_rejects_system_command_conflict(tmp_path):
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server({'/conflicting.py': text_route(CONFLICT_MODULE)}) as base:
+            result = await bot.module_fetcher.install(f"{base}/conflicting.py")
+            assert not result['success']
+            assert 'Конфликт с системными командами' in result['error']
+            assert '.help' in result['error']
+            assert 'conflicting' not in bot.module_manager.list_modules()
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+    assert not (tmp_path / 'modules' / 'conflicting.py').exists()
+
+
+def test_failed_activation_restores_previous_version(tmp_path):
+    previous = GOOD_MODULE.format(name='rollback', version=1)
+    (tmp_path / 'modules').mkdir()
+    (tmp_path / 'modules' / 'rollback.py').write_text(previous, encoding='utf-8')
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server({'/rollback.py': text_route(BROKEN_MODULE)}) as base:
+            assert bot.module_manager.get_module_info('rollback')['module'].VERSION == 1
+            result = await bot.module_fetcher.install(f"{base}/rollback.py")
+            assert not result['success']
+            assert 'Ошибка загрузки модуля' in result['error']
+            # Прежняя версия снова на диске и загружена
+            assert bot.module_manager.get_module_info('rollback')['module'].VERSION == 1
+
+    asyncio.run(scenario())
+    assert (tmp_path / 'modules' / 'rollback.py').read_text(encoding='utf-8') == previous
+    assert leftovers(tmp_path) == []
+
+
+def test_install_many_mixed_urls(tmp_path):
+    async def missing(request):
+        raise web.HTTPNotFound()
+
+    routes = {
+        '/first_ok.py': text_route(GOOD_MODULE.format(name='first_ok', version=1)),
+        '/second_ok.py': text_route(GOOD_MODULE.format(name='second_ok', version=1)),
+        '/broken_many.py': text_route(BROKEN_MODULE),
+        '/missing_one.py': missing,
+    }
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server(routes) as base:
+            urls = [
+                f"{base}/first_ok.py",
+                f"{base}/missing_one.py",
+                f"{base}/second_ok.py",
+                f"{base}/broken_many.py",
+                f"{base}/not-a-module.txt",
+                "ftp://example.com/mod.py",
+            ]
+            results = await bot.module_fetcher.install_many(urls)
+            assert [result['url'] for result in results] == urls
+            assert [result['success'] for result in results] == [True, False, True, False, False, False]
+            assert results[0]['commands'] == ['.first_ok']
+            assert 'HTTP 404' in results[1]['error']
+            assert 'Ошибка загрузки модуля' in results[3]['error']
+            assert 'Некорректное имя' in results[4]['error']
+            assert 'схема' in results[5]['error']
+
+            modules = bot.module_manager.list_modules()
+            assert 'first_ok' in modules and 'second_ok' in modules
+            assert 'broken_many' not in modules
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+    assert not (tmp_path / 'modules' / 'broken_many.py').exists()
+
+
+def test_install_bundle_from_url(tmp_path):
+    good = make_bundle(tmp_path / 'good', 'pair', {
+        'bundled_a': GOOD_MODULE.format(name='bundled_a', version=1),
+        'bundled_b': GOOD_MODULE.format(name='bundled_b', version=1),
+    })
+    bad = make_bundle(tmp_path / 'bad', 'unsafe', {
+        'bundled_ok': GOOD_MODULE.format(name='bundled_ok', version=1),
+        'bundled_bad': DANGEROUS_MODULE,
+    })
+    routes = {'/pair.kbz': bytes_route(good), '/unsafe.kbz': bytes_route(bad)}
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot, stand_in_server(routes) as base:
+            result = await bot.module_fetcher.install(f"{base}/pair.kbz")
+            assert result['success'], result['error']
+            assert sorted(result['commands']) == ['.bundled_a', '.bundled_b']
+            modules = bot.module_manager.list_modules()
+            assert 'bundled_a' in modules and 'bundled_b' in modules
+
+            rejected = await bot.module_fetcher.install(f"{base}/unsafe.kbz")
+            assert not rejected['success']
+            assert 'проверку безопасности' in rejected['error']
+            assert 'bundled_ok' not in bot.module_manager.list_modules()
+
+    asyncio.run(scenario())
+    assert leftovers(tmp_path) == []
+    assert (tmp_path / 'modules' / 'pair.kbz').exists()
+    assert not (tmp_path / 'modules' / 'unsafe.kbz').exists()
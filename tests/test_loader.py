@@ -0,0 +1,50 @@
+"""
+Системный модуль loader: .kun удаляет файл через пул ввода-вывода
+и работает в строгом режиме io_strict=raise
+"""
+
+import asyncio
+import re
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks.fake_client import SELF_ID
+from core.fileio import disk
+from tests.support import running_bot
+
+PROJECT_LOADER = Path(__file__).resolve().parent.parent / 'modules' / 'loader.py'
+
+
+def kun_handler(bot):
+    handlers = bot.module_manager.get_module_info('loader')['handlers']
+    return next(callback for callback, _ in handlers if callback.__name__ == 'delete_module')
+
+
+def kun_event(name: str, replies: list):
+    async def respond(text):
+        replies.append(text)
+    return SimpleNamespace(sender_id=SELF_ID, pattern_match=re.match(r"\.kun (.+)", f".kun {name}"), respond=respond)
+
+
+def test_kun_removes_module_file_under_strict_io(tmp_path):
+    modules = tmp_path / 'modules'
+    modules.mkdir()
+    shutil.copy(PROJECT_LOADER, modules / 'loader.py')
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot:
+            await disk.run('write', (modules / 'gone.py').write_text, '', encoding='utf-8')
+            handler = kun_handler(bot)
+            replies = []
+            disk.arm('raise')
+            try:
+                await handler(kun_event('gone', replies))
+                await handler(kun_event('gone', replies))
+            finally:
+                disk.disarm()
+            return replies
+
+    replies = asyncio.run(scenario())
+    assert replies == ["🗑 Модуль `gone` удалён!", "❌ Такого модуля нет!"]
+    assert not (modules / 'gone.py').exists()
@@ -0,0 +1,85 @@
+"""
+MediaTransfer.download на диск: готовый файл появляется только после
+успешной загрузки всех частей, при ошибке и отмене не остается ничего
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.media import MIN_PART_SIZE, MediaTransfer
+
+PART = MIN_PART_SIZE
+SIZE = PART * 8
+
+
+class PartsClient:
+    """Отдает части файла как iter_download; может упасть или зависнуть на заданной части"""
+
+    def __init__(self, data: bytes, fail_at=None, hang_at=None):
+        self.data = data
+        self.fail_at = fail_at
+        self.hang_at = hang_at
+        self.reached = asyncio.Event()
+
+    async def iter_download(self, media, offset, stride, limit, chunk_size, request_size, file_size):
+        position = offset
+        for _ in range(limit):
+            if position == self.fail_at:
+                raise ConnectionError("часть не получена")
+            if position == self.hang_at:
+                self.reached.set()
+                await asyncio.sleep(3600)
+            yield self.data[position:position + chunk_size]
+            position += stride
+
+
+def make_transfer(client):
+    bot = SimpleNamespace(client=client)
+    return MediaTransfer(bot, part_size=PART, workers=4)
+
+
+def message(name: str):
+    return SimpleNamespace(media=object(), id=1, file=SimpleNamespace(size=SIZE, name=name))
+
+
+def test_download_replaces_target_on_success(tmp_path):
+    data = bytes(range(256)) * (SIZE // 256)
+    target = tmp_path / 'module.py'
+
+    async def scenario():
+        media = make_transfer(PartsClient(data))
+        return await media.download(message('module.py'), str(target))
+
+    assert asyncio.run(scenario()) == str(target)
+    assert target.read_bytes() == data
+    assert [path.name for path in tmp_path.iterdir()] == ['module.py']
+
+
+def test_failed_part_leaves_no_file(tmp_path):
+    target = tmp_path / 'module.py'
+
+    async def scenario():
+        media = make_transfer(PartsClient(b'x' * SIZE, fail_at=PART * 5))
+        with pytest.raises(ConnectionError):
+            await media.download(message('module.py'), str(target))
+
+    asyncio.run(scenario())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cancelled_download_leaves_no_file(tmp_path):
+    target = tmp_path / 'module.py'
+
+    async def scenario():
+        client = PartsClient(b'x' * SIZE, hang_at=PART * 6)
+        media = make_transfer(client)
+        task = asyncio.create_task(media.download(message('module.py'), str(target)))
+        await client.reached.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,54 @@
+"""
+Глобальный фильтр безопасности: чужие команды блокируются всегда,
+выключить проверку настройками нельзя
+"""
+
+import asyncio
+import datetime
+
+import pytest
+from telethon.tl import functions, types
+
+from tests.support import running_bot
+
+STRANGER = 555
+
+
+def incoming_message(text: str, sender_id: int = STRANGER, message_id: int = 1):
+    """Входящее сообщение постороннего пользователя в личном чате"""
+    message = types.Message(
+        id=message_id,
+        peer_id=types.PeerUser(sender_id),
+        date=datetime.datetime.now(datetime.timezone.utc),
+        message=text,
+        from_id=types.PeerUser(sender_id)
+    )
+    update = types.UpdateNewMessage(message, pts=0, pts_count=0)
+    update._entities = {sender_id: types.User(id=sender_id, access_hash=sender_id, first_name='Чужой')}
+    return update
+
+
+def test_stranger_commands_are_blocked_regardless_of_settings(tmp_path):
+    async def scenario():
+        async with running_bot(tmp_path) as bot:
+            with pytest.raises(KeyError):
+                await bot.config.set('enable_security', 'off')
+            # Старый ключ из config.py ни на что не влияет
+            bot.config['enable_security'] = False
+
+            sent = []
+            respond = bot.client._respond
+
+            def recording(request):
+                if isinstance(request, (functions.messages.SendMessageRequest,
+                                        functions.messages.EditMessageRequest)):
+                    sent.append(request)
+                return respond(request)
+
+            bot.client._respond = recording
+            for number, text in enumerate(['.settings', '.version', '.restart hard'], 1):
+                await bot.client._dispatch_update(incoming_message(text, message_id=number))
+            assert bot.security.blocked_attempts == 3
+            assert sent == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+"""
+BufferedSession: записи на диск идут по порядку снимков, поэтому
+фоновая запись старого снимка не затирает новый ключ авторизации
+"""
+
+import asyncio
+import threading
+
+from telethon.crypto import AuthKey
+
+from core.session import BufferedSession
+
+OLD_KEY = AuthKey(b'\x01' * 256)
+NEW_KEY = AuthKey(b'\x02' * 256)
+
+
+def test_late_timer_write_does_not_replace_new_auth_key(tmp_path):
+    name = str(tmp_path / 'account')
+    session = BufferedSession(name)
+    session.set_dc(2, '149.154.167.51', 443)
+    session._auth_key = OLD_KEY
+
+    write = session._write
+    timer_started = threading.Event()
+    release_timer = threading.Event()
+
+    def gated_write(data, sequence):
+        # Запись таймера (в пуле) ждет, пока на цикле не сменится ключ
+        if threading.current_thread() is not threading.main_thread():
+            timer_started.set()
+            release_timer.wait(5)
+        write(data, sequence)
+
+    session._write = gated_write
+
+    async def scenario():
+        session.start_flushing(interval=0)
+        await asyncio.get_running_loop().run_in_executor(None, timer_started.wait, 5)
+        # Снимок со старым ключом уже у пула; новый ключ пишется сразу на цикле
+        session.auth_key = NEW_KEY
+        release_timer.set()
+        await asyncio.sleep(0.2)
+        session.close()
+
+    asyncio.run(scenario())
+    assert BufferedSession(name).auth_key.key == NEW_KEY.key
@@ -0,0 +1,47 @@
+"""
+Учет команд в .stats: команда засчитывается модулю, чей шаблон ее распознал
+"""
+
+import asyncio
+
+from tests.support import outgoing_message, running_bot
+
+WATCHER = '''"""Смотрит на все сообщения"""
+from telethon import events
+
+
+async def register(bot):
+    @bot.client.on(events.NewMessage())
+    async def watch(event):
+        pass
+'''
+
+GREETER = '''"""Команда .greet"""
+from telethon import events
+
+
+async def register(bot):
+    @bot.client.on(events.NewMessage(pattern=r'\\.gr(?:eet)?'))
+    async def greet(event):
+        pass
+'''
+
+
+def test_command_is_credited_only_to_matching_handler(tmp_path):
+    modules = tmp_path / 'modules'
+    modules.mkdir()
+    (modules / 'watcher.py').write_text(WATCHER, encoding='utf-8')
+    (modules / 'greeter.py').write_text(GREETER, encoding='utf-8')
+
+    async def scenario():
+        async with running_bot(tmp_path) as bot:
+            for number, text in enumerate(['.greet всем', '.gr', '.version', 'просто текст'], 1):
+                await bot.client._dispatch_update(outgoing_message(text, message_id=number))
+            counters = bot.stats.summary('hour')
+            assert counters[('greeter', '.greet')][0] == 1
+            assert counters[('greeter', '.gr')][0] == 1
+            assert counters[('system', '.version')][0] == 1
+            assert not any(module == 'watcher' for module, _ in counters)
+            assert not any(module == 'greeter' and command == '.version' for module, command in counters)
+
+    asyncio.run(scenario())
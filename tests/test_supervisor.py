@@ -0,0 +1,88 @@
+"""
+Отчет рабочего процесса супервизору не делает блокирующего
+ввода-вывода в цикле событий
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from core.fileio import disk
+from core.supervisor import Supervisor, WorkerLink
+
+
+def test_health_report_under_strict_io():
+    async def scenario():
+        disk.arm('raise')
+        try:
+            return await WorkerLink(SimpleNamespace(bots=[])).health()
+        finally:
+            disk.disarm()
+
+    report = asyncio.run(scenario())
+    assert report['type'] == 'health'
+    assert report['accounts'] == {}
+    assert report['memory'] and report['memory'] > 0
+
+
+
+class FakeProcess:
+    """Рабочий процесс, который завершается по команде теста"""
+
+    pid = 0
+
+    def __init__(self):
+        self.returncode = None
+        self._exit = asyncio.get_running_loop().create_future()
+
+    def finish(self, code: int):
+        if self.returncode is None:
+            self.returncode = code
+            self._exit.set_result(code)
+
+    async def wait(self):
+        return await self._exit
+
+    def terminate(self):
+        self.finish(-15)
+
+    kill = terminate
+
+
+def test_restart_during_crash_backoff_keeps_backoff(monkeypatch):
+    spawned = []
+
+    async def create_subprocess_exec(*args, **kwargs):
+        process = FakeProcess()
+        spawned.append((time.monotonic(), process))
+        return process
+
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+
+    async def scenario():
+        supervisor = Supervisor(['main'], workers=1, min_backoff=0.3)
+        supervisor._address = '127.0.0.1:0'
+        worker = supervisor._add_worker(['main'])
+        await asyncio.sleep(0)
+
+        spawned[-1][1].finish(1)
+        await asyncio.sleep(0.05)
+        # Процесс ждет перезапуска после сбоя; перезапуск по команде ничего не останавливает
+        await supervisor.restart_worker(worker.worker_id)
+        assert not worker.draining
+        while len(spawned) < 2:
+            await asyncio.sleep(0.01)
+
+        # Следующий сбой нового процесса снова ждет задержку, а не перезапускается сразу
+        crashed_at = time.monotonic()
+        spawned[-1][1].finish(1)
+        while len(spawned) < 3:
+            await asyncio.sleep(0.01)
+        gap = spawned[-1][0] - crashed_at
+
+        worker.retired = True
+        spawned[-1][1].finish(0)
+        await asyncio.gather(*supervisor._tasks)
+        return gap
+
+    assert asyncio.run(scenario()) >= 0.5
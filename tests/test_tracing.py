@@ -0,0 +1,37 @@
+"""
+Номера трасс: уникальны в процессе, содержат pid и находятся командой .trace <id>
+"""
+
+import asyncio
+import os
+
+from telethon.tl import functions
+
+from tests.support import outgoing_message, running_bot
+
+
+def test_trace_ids_are_sequential_and_resolvable(tmp_path):
+    async def scenario():
+        async with running_bot(tmp_path) as bot:
+            # Тестовый бот не проходит start(), где трассировщик подключается к клиенту
+            bot.tracer.install(bot.client)
+            for number in range(1, 4):
+                await bot.client._dispatch_update(outgoing_message('.version', message_id=number))
+            ids = [trace.id for trace in bot.tracer.slowest()]
+            assert len(set(ids)) == 3
+            assert all(trace_id.startswith(f"{os.getpid():x}-") for trace_id in ids)
+
+            texts = []
+            respond = bot.client._respond
+
+            def recording(request):
+                if isinstance(request, functions.messages.EditMessageRequest):
+                    texts.append(request.message)
+                return respond(request)
+
+            bot.client._respond = recording
+            await bot.client._dispatch_update(outgoing_message(f".trace {ids[0]}", message_id=10))
+            assert texts and 'не найдена' not in texts[-1]
+            assert '.version' in texts[-1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,39 @@
+"""
+CatchUpGate: сроки и приоритет команд применяются только к сообщениям
+с настроенным префиксом
+"""
+
+import datetime
+import time
+from types import SimpleNamespace
+
+from core.updates import CatchUpGate
+
+
+def stale_info(text: str, age: float):
+    date = datetime.datetime.fromtimestamp(time.time() - age, tz=datetime.timezone.utc)
+    # Отправитель None - исходящее сообщение владельца
+    return (1, 1), date, text, None
+
+
+def make_gate(prefix: str) -> CatchUpGate:
+    bot = SimpleNamespace(config={'command_prefix': prefix}, is_admin=lambda user_id: True)
+    return CatchUpGate(bot, client=None, max_age=60)
+
+
+def test_only_configured_prefix_counts_as_command():
+    gate = make_gate('!')
+    assert gate._is_command('!ping')
+    assert not gate._is_command('.ping')
+    assert not gate._is_command('')
+
+    # Старое сообщение с точкой - обычный текст: не отбрасывается и не идет вперед
+    assert gate._enqueue('dot', stale_info('.ping', age=3600))
+    assert gate.expired == 0
+    assert list(gate.backlog) == ['dot'] and not gate.priority
+
+    # Устаревшая команда с настроенным префиксом отбрасывается, свежая идет первой
+    assert not gate._enqueue('old', stale_info('!ping', age=3600))
+    assert gate.expired == 1
+    assert gate._enqueue('fresh', stale_info('!ping', age=10))
+    assert list(gate.priority) == ['fresh']
@@ -0,0 +1,179 @@
+"""
+Неблокирующее логирование Kbot 3.0
+Записи передаются через очередь фоновому потоку, который пишет их
+в консоль и в файл с ротацией по размеру и по дням и сжатием старых файлов
+"""
+
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Настройки, при изменении которых конвейер перенастраивается
+LOG_SETTINGS = {'log_level', 'log_to_file', 'log_json', 'log_max_bytes', 'log_backup_count', 'log_sampling'}
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    """Кладет запись в очередь без форматирования в потоке цикла событий"""
+
+    def prepare(self, record):
+        # Очередь живет в том же процессе, поэтому запись не нужно
+        # сериализовать - форматирование выполнит фоновый поток
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только часть записей уровней ниже WARNING для выбранных логгеров"""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = {}
+        self._counters = {}
+        self.set_rates(rates or {})
+
+    def set_rates(self, rates: Dict[str, float]):
+        # Храним шаг выборки: rate=0.1 - каждая 10-я запись
+        self.rates = {name: max(1, round(1 / rate)) for name, rate in rates.items() if rate > 0}
+        self._counters = {}
+
+    def filter(self, record) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+
+        step = self.rates.get(record.name)
+        if step is None:
+            # Правило для родительского логгера действует и на дочерние
+            name = record.name
+            while '.' in name and step is None:
+                name = name.rsplit('.', 1)[0]
+                step = self.rates.get(name)
+            if step is None:
+                return True
+
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        return count % step == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON"""
+
+    def format(self, record) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ротация по размеру и при смене дня, старые файлы сжимаются в gzip"""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._compress
+        self._day = self._current_day()
+
+    @staticmethod
+    def _current_day() -> str:
+        return time.strftime('%Y%m%d')
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record) -> bool:
+        day = self._current_day()
+        if day != self._day:
+            self._day = day
+            # Пустой файл при смене дня ротировать незачем
+            return self.stream is None or self.stream.tell() > 0
+        return bool(super().shouldRollover(record))
+
+
+class LogPipeline:
+    """Очередь логов и фоновый поток-обработчик"""
+
+    def __init__(self, log_dir: str = "logs", file_name: str = "kbot.log"):
+        self.log_dir = log_dir
+        # Каждый процесс пишет в свой файл: ротация не рассчитана на несколько писателей
+        self.file_name = file_name
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = LoopQueueHandler(self.queue)
+        self.sampling = SamplingFilter()
+        self.queue_handler.addFilter(self.sampling)
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def _build_handlers(self, log_to_file: bool, json_format: bool,
+                        max_bytes: int, backup_count: int):
+        formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+        handlers = [stream_handler]
+
+        if log_to_file:
+            os.makedirs(self.log_dir, exist_ok=True)
+            file_handler = CompressingRotatingFileHandler(
+                os.path.join(self.log_dir, self.file_name), max_bytes, backup_count
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+
+        return handlers
+
+    def start(self, level: str = 'INFO', log_to_file: bool = True, json_format: bool = False,
+              max_bytes: int = 10 * 1024 * 1024, backup_count: int = 7):
+        """Подключает очередь к корневому логгеру и запускает фоновый поток"""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(level)
+
+        handlers = self._build_handlers(log_to_file, json_format, max_bytes, backup_count)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def configure(self, config):
+        """Применяет настройки логирования из конфигурации"""
+        logging.getLogger().setLevel(str(config.get('log_level', 'INFO')).upper())
+        self.sampling.set_rates(config.get('log_sampling', {}))
+
+        if self.listener is None:
+            return
+        # Останавливаем поток, чтобы он дописал очередь в старые обработчики,
+        # и запускаем новый с обработчиками по новым настройкам
+        self.stop()
+        handlers = self._build_handlers(
+            config.get('log_to_file', True),
+            config.get('log_json', False),
+            config.get('log_max_bytes', 10 * 1024 * 1024),
+            config.get('log_backup_count', 7)
+        )
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Дописывает оставшиеся записи и останавливает фоновый поток"""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
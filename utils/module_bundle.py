@@ -0,0 +1,96 @@
+"""
+Сборка zip-пакета модулей Kbot 3.0
+
+    python -m utils.module_bundle pack.kbz modules/ping.py modules/weather/
+
+Кладет модули (файлы .py и папки-пакеты) в один архив и пишет манифест
+kbot.json с командами и описанием каждого модуля: при установке и загрузке
+пакета исходники не разбираются. Пакет ставится командой .klm
+"""
+
+import ast
+import json
+import sys
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.module_manager.manager import ModuleManager
+from core.module_manager.sources import MANIFEST_FORMAT, MANIFEST_NAME, module_sources
+
+
+def defines_register(source: str) -> bool:
+    """Есть ли в исходнике функция register верхнего уровня"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return False
+    return any(
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'register'
+        for node in tree.body
+    )
+
+
+def describe_module(analyzer: ModuleManager, source, sources: Dict[str, str]) -> Dict:
+    """Запись манифеста: те же команды и описание, что нашел бы загрузчик"""
+    main_source = sources[source.main]
+    register_source = next(
+        (text for text in [main_source, *sources.values()] if defines_register(text)), None
+    )
+    if register_source is not None:
+        commands = analyzer.extract_commands_from_register(None, register_source)
+    else:
+        commands = analyzer.extract_commands_from_sources(source.location, sources)
+    return {
+        'name': source.name,
+        'description': analyzer.get_module_description(None, source.location, main_source),
+        'commands': commands,
+    }
+
+
+def build_bundle(output: Path, paths: List[Path], name: str = '', version: str = '') -> Dict:
+    """Собирает архив output из модулей paths и возвращает манифест"""
+    analyzer = ModuleManager(None)
+    manifest = {'format': MANIFEST_FORMAT, 'name': name or output.stem, 'version': version, 'modules': []}
+    seen = set()
+
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for path in paths:
+            for source in module_sources(path):
+                if source.kind == 'bundle':
+                    raise ValueError(f"{path}: пакет нельзя вложить в пакет")
+                if source.name in seen:
+                    raise ValueError(f"Модуль {source.name} указан дважды")
+                seen.add(source.name)
+
+                sources = source.read_sources()
+                prefix = f"{source.name}/" if source.kind == 'package' else ''
+                for relative, text in sources.items():
+                    archive.writestr(prefix + relative, text)
+                manifest['modules'].append(describe_module(analyzer, source, sources))
+
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    return manifest
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) < 2 or not argv[0].endswith(('.kbz', '.zip')):
+        print("Использование: python -m utils.module_bundle pack.kbz module.py [package/ ...]")
+        return 2
+
+    try:
+        manifest = build_bundle(Path(argv[0]), [Path(arg) for arg in argv[1:]])
+    except (OSError, ValueError, SyntaxError) as e:
+        print(f"❌ Ошибка сборки пакета: {e}")
+        return 1
+
+    print(f"📦 Пакет {argv[0]} собран, модулей: {len(manifest['modules'])}")
+    for module in manifest['modules']:
+        print(f"  • {module['name']}: {', '.join(module['commands']) or 'без команд'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))